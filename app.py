@@ -1,51 +1,52 @@
 # app.py
-from flask import Flask, session, request, redirect, url_for, render_template, jsonify
+from flask import Flask, Blueprint, request, redirect, url_for, render_template, jsonify
 from flask_cors import CORS
-from db_config import get_mongo_client
-from redis_config import get_redis_client
+from db_config import get_mongo_client, ping_mongo
+from indices import asegurar_indices
+from redis_config import ping_redis
 from bson import ObjectId
-import uuid
+from datetime import datetime
+import os
 import json
 from crud.crud_usuarios import usuarios_bp
 from crud.crud_productos import productos_bp
 from crud.crud_pedidos import pedidos_bp
-import redis
-
-app = Flask(__name__)
-app.secret_key = "SECRET_KEY_DE_EJEMPLO"  # Cambiar por algo seguro en producción
-
-
-# Registrar cada blueprint, asociándolos a un prefijo de URL
-app.register_blueprint(usuarios_bp, url_prefix="/usuarios")
-app.register_blueprint(productos_bp, url_prefix="/productos")
-app.register_blueprint(pedidos_bp, url_prefix="/pedidos")
-
-
-CORS(app, supports_credentials=True)
-app.config['SESSION_COOKIE_SAMESITE'] = 'None'
-app.config['SESSION_COOKIE_SECURE'] = True
-
-# Conexiones a las BD
-db = get_mongo_client()
-redis_client = get_redis_client()
-
-
-
-
-@app.before_request
-def ensure_session():
-    if 'user_session_id' not in session:
-        session['user_session_id'] = str(uuid.uuid4())
-
-@app.route("/")
+from crud.crud_ventas import ventas_bp
+from crud.crud_facturacion import facturas_bp
+from ciclo_vida import checkout_en_curso
+from metricas import instrumentar
+from serializacion import ProveedorJSONBSON
+import cache_productos
+import categorias
+import carrito_repo
+import cola_pedidos
+import inventario
+import limites
+import negociacion
+import sesiones
+import ventas
+
+# Las rutas propias de la tienda se agrupan en un blueprint; create_app() arma
+# la aplicación con todos los blueprints. Las conexiones a las BD se obtienen
+# por request: db_config y redis_config mantienen un cliente/pool compartido
+# por proceso. Los carritos y sesiones en Redis se manejan desde carrito_repo;
+# el id de sesión y el usuario logueado del request, desde sesiones.
+tienda_bp = Blueprint("tienda", __name__)
+
+
+@tienda_bp.route("/")
 def index():
     return "Bienvenido a la plataforma de comercio electrónico."
 
 
+@tienda_bp.route("/health", methods=["GET"])
+def health():
+    estado = {"mongo": ping_mongo(), "redis": ping_redis()}
+    codigo = 200 if all(estado.values()) else 503
+    return jsonify(estado), codigo
 
-redis_client = redis.Redis(host="redis", port=6379, db=0)  # Ajusta según tu configuración
 
-@app.route("/login", methods=["POST"])
+@tienda_bp.route("/login", methods=["POST"])
 def login():
     email = request.form.get("email")
     db = get_mongo_client()
@@ -53,157 +54,214 @@ def login():
     usuario = usuarios_coll.find_one({"email": email})
 
     if usuario:
-        session_id = session.get("user_session_id")
-        # Guardar datos de sesión en Redis
-        redis_client.hset(f"session:{session_id}", "user_id", str(usuario["_id"]))
-        redis_client.hset(f"session:{session_id}", "user_email", usuario["email"])
+        # Crear la sesión si no existía y guardar sus datos en Redis (con TTL)
+        sesiones.iniciar_sesion(usuario["_id"], usuario["email"])
         return jsonify({"message": "Usuario logueado", "user": usuario["email"]}), 200
     else:
         return jsonify({"error": "Usuario no encontrado"}), 404
 
 
-@app.route("/logout", methods=["GET"])
+@tienda_bp.route("/logout", methods=["GET"])
 def logout():
     """
     Cerrar sesión: limpiamos en Redis la key asociada al session_id.
     """
-    session_id = session['user_session_id']
-    redis_client.delete(f"session:{session_id}")
-    session.pop('user_session_id', None)
-    return redirect(url_for('index'))
+    sesiones.cerrar_sesion()
+    return redirect(url_for('tienda.index'))
 
-@app.route("/agregar_carrito", methods=["POST"])
+@tienda_bp.route("/agregar_carrito", methods=["POST"])
 def agregar_carrito():
-    session_id = session.get('user_session_id')
-    if not session_id:
-        return jsonify({"error": "No hay sesión activa"}), 401
+    # Primer uso del carrito: recién aquí se crea la sesión
+    session_id = sesiones.id_sesion(crear=True)
 
-    cart_key = f"cart:{session_id}"
     product_id = request.form.get("product_id")
     cantidad = int(request.form.get("cantidad", 1))
+    if cantidad < 1:
+        return jsonify({"error": "La cantidad debe ser mayor a 0"}), 400
 
-    # Validar que el producto exista en MongoDB
-    db = get_mongo_client()
-    productos_coll = db["productos"]
-    producto = productos_coll.find_one({"_id": ObjectId(product_id)})
+    # Validar que el producto exista (cache de productos -> MongoDB)
+    producto = cache_productos.obtener_producto(product_id)
     if not producto:
         return jsonify({"error": "Producto no encontrado"}), 404
 
-    # Agregar o incrementar la cantidad en el carrito en Redis
-    redis_client.hincrby(cart_key, product_id, cantidad)
-    # Establecer/renovar el TTL para el carrito (ej. 30 minutos)
-    redis_client.expire(cart_key, 1800)
+    # Reservar el stock en Redis y sumarlo al carrito (un solo script Lua, ver inventario.py)
+    try:
+        en_carrito, disponible = inventario.reservar(session_id, product_id, cantidad)
+    except carrito_repo.CarritoLleno:
+        return jsonify({"error": f"El carrito admite hasta {carrito_repo.MAX_ITEMS_CARRITO} productos distintos"}), 409
+    if en_carrito is None:
+        return jsonify({"error": "No hay stock suficiente", "disponible": max(disponible, 0)}), 409
 
     return jsonify({"message": "Producto agregado al carrito"}), 200
 
 
-@app.route("/ver_carrito", methods=["GET"])
+@tienda_bp.route("/ver_carrito", methods=["GET"])
 def ver_carrito():
-    session_id = session.get('user_session_id')
+    session_id = sesiones.id_sesion()
     if not session_id:
-        return jsonify({"error": "No hay sesión activa"}), 401
-
-    cart_key = f"cart:{session_id}"
-    cart_data = redis_client.hgetall(cart_key)
+        # Sin sesión todavía no hay carrito
+        return jsonify({}), 200
 
-    # Convertir las claves y valores de bytes a strings (y números, en el caso de cantidades)
-    carrito = { key.decode("utf-8"): int(value.decode("utf-8")) for key, value in cart_data.items() }
-
-    # Renovar el TTL del carrito
-    redis_client.expire(cart_key, 1800)
+    # Leer el carrito y renovar su TTL en un solo round trip
+    carrito = carrito_repo.ver_carrito(session_id)
 
     return jsonify(carrito), 200
 
-@app.route("/confirmar_pedido", methods=["POST"])
+@tienda_bp.route("/confirmar_pedido", methods=["POST"])
 def confirmar_pedido():
     """
     Convierte el carrito en un pedido en MongoDB.
+
+    Las unidades reservadas al agregar al carrito se confirman como venta en
+    Redis (inventario.py); el descuento en productos.stock lo hace después el
+    volcado en lote. Si algún producto no tiene stock suficiente el pedido se
+    rechaza completo (409), salvo que se envíe parcial=1: en ese caso se
+    confirman solo los productos disponibles. El carrito se toma (lee y borra)
+    al inicio y se devuelve a Redis si el pedido no se confirma.
     """
-    session_id = session['user_session_id']
-    cart_key = f"cart:{session_id}"
+    session_id = sesiones.id_sesion()
+    if not session_id:
+        return jsonify({"error": "Debes iniciar sesión antes de confirmar un pedido"}), 401
 
-    # Verificar si el usuario está logueado
-    user_id = redis_client.hget(f"session:{session_id}", "user_id")
+    # Verificar el login y tomar el carrito (leer y borrar) de forma atómica
+    user_id, cart_items = carrito_repo.tomar_carrito(session_id)
     if not user_id:
         return jsonify({"error": "Debes iniciar sesión antes de confirmar un pedido"}), 401
-
-    cart_items = redis_client.hgetall(cart_key)
     if not cart_items:
         return jsonify({"error": "El carrito está vacío"}), 400
 
+    # El apagado del worker espera a que terminen los checkouts en curso
+    with checkout_en_curso():
+        try:
+            respuesta = _crear_pedido(session_id, user_id, cart_items)
+        except Exception:
+            carrito_repo.devolver_carrito(session_id, cart_items)
+            raise
+        if respuesta[1] not in (200, 202):
+            # Pedido rechazado: el carrito vuelve a quedar como estaba
+            carrito_repo.devolver_carrito(session_id, cart_items)
+    return respuesta
+
+
+def _crear_pedido(session_id, user_id, cart_items):
+    """Arma y guarda el pedido con los items tomados del carrito. Devuelve (respuesta, código)."""
+    parcial = request.form.get("parcial") in ("1", "true")
+    cantidades = {
+        ObjectId(product_id): qty for product_id, qty in cart_items.items()
+    }
+
+    # Obtener todos los productos del carrito: cache y, para los que falten,
+    # una sola consulta $in a MongoDB
+    db = get_mongo_client()
+    productos = cache_productos.obtener_productos(cantidades)
+
+    # Los productos eliminados mientras estaban en el carrito no se venden
+    sin_stock = [pid for pid in cantidades if pid not in productos]
+    a_confirmar = {pid: qty for pid, qty in cantidades.items() if pid in productos}
+    aceptado = bool(a_confirmar) and (parcial or not sin_stock)
+    if aceptado:
+        # Reserva -> venta en Redis, de forma atómica para todas las líneas
+        aceptado, agotados = inventario.confirmar(session_id, a_confirmar, parcial)
+        sin_stock += agotados
+    if not aceptado:
+        return jsonify({
+            "error": "No hay stock suficiente para algunos productos",
+            "sin_stock": sin_stock
+        }), 409
+    descontados = {pid: qty for pid, qty in a_confirmar.items() if pid not in sin_stock}
+
     # Convertir items del carrito en lista de objetos
     items_pedido = []
     total = 0
-
-    productos_coll = db["productos"]
-    for product_id_bytes, qty_bytes in cart_items.items():
-        product_id_str = product_id_bytes.decode("utf-8")
-        qty = int(qty_bytes.decode("utf-8"))
-
-        # Obtener datos del producto desde MongoDB
-        producto = productos_coll.find_one({"_id": ObjectId(product_id_str)})
-        if producto:
-            subtotal = producto["precio"] * qty
-            total += subtotal
-            items_pedido.append({
-                "product_id": product_id_str,
-                "nombre": producto["nombre"],
-                "cantidad": qty,
-                "precio_unitario": producto["precio"],
-                "subtotal": subtotal
-            })
+    for pid, qty in descontados.items():
+        producto = productos[pid]
+        subtotal = producto["precio"] * qty
+        total += subtotal
+        items_pedido.append({
+            "product_id": str(pid),
+            "nombre": producto["nombre"],
+            "cantidad": qty,
+            "precio_unitario": producto["precio"],
+            "subtotal": subtotal
+        })
 
     # Guardar pedido en MongoDB
     pedidos_coll = db["pedidos"]
+    pedido_id = ObjectId()
     nuevo_pedido = {
-        "usuario_id": ObjectId(user_id.decode("utf-8")),
+        "_id": pedido_id,
+        "usuario_id": ObjectId(user_id),
         "items": items_pedido,
         "total": total,
-        "estado": "pendiente"
+        "estado": "pendiente",
+        "fecha": datetime.utcnow()
     }
-    pedidos_coll.insert_one(nuevo_pedido)
-
-    # Limpiar el carrito en Redis
-    redis_client.delete(cart_key)
+    try:
+        if cola_pedidos.ASINCRONO:
+            # Modo asíncrono: el escritor de cola_pedidos.py lo guarda en lote
+            cola_pedidos.encolar_pedido(nuevo_pedido)
+        else:
+            pedidos_coll.insert_one(nuevo_pedido)
+    except Exception:
+        # Las unidades vuelven al stock; el carrito se devuelve en confirmar_pedido
+        inventario.revertir(descontados)
+        raise
+
+    if not cola_pedidos.ASINCRONO:
+        # Actividad del cliente y rollups de ventas (en modo asíncrono lo hace el escritor)
+        categorias.registrar_pedido(user_id, nuevo_pedido["fecha"])
+        ventas.registrar_pedido(nuevo_pedido)
+
+    if cola_pedidos.ASINCRONO:
+        return _aceptado({
+            "message": "Pedido aceptado",
+            "pedido_id": pedido_id,
+            "total": total,
+            "sin_stock": sin_stock
+        }, pedido_id)
 
-    return jsonify({"message": "Pedido confirmado", "total": total})
+    return jsonify({
+        "message": "Pedido confirmado",
+        "pedido_id": pedido_id,
+        "total": total,
+        "sin_stock": sin_stock
+    }), 200
 
-@app.route("/ver_sesion", methods=["GET"])
+@tienda_bp.route("/ver_sesion", methods=["GET"])
 def ver_sesion():
-    session_id = session.get("user_session_id")
+    session_id = sesiones.id_sesion()
     if not session_id:
         return jsonify({"error": "No hay sesión activa"}), 401
 
     # Usar el session_id para consultar la sesión en Redis
-    session_key = f"session:{session_id}"
-    session_data = redis_client.hgetall(session_key)
-
-    # Convertir las claves y valores de bytes a string
-    session_dict = {key.decode("utf-8"): value.decode("utf-8") for key, value in session_data.items()}
+    session_dict = carrito_repo.datos_sesion(session_id)
+    if "user_id" in session_dict and "user_email" not in session_dict:
+        # Las sesiones compactas no guardan el email (ver carrito_repo.py)
+        usuario = get_mongo_client()["usuarios"].find_one({"_id": ObjectId(session_dict["user_id"])}, {"email": 1})
+        session_dict["user_email"] = usuario["email"] if usuario else None
 
     return jsonify(session_dict), 200
 
 """Facturacion"""
-@app.route("/facturar_pedido/<pedido_id>", methods=["POST"])
+@tienda_bp.route("/facturar_pedido/<pedido_id>", methods=["POST"])
 def facturar_pedido(pedido_id):
     """Factura un pedido y registra el pago."""
-    session_id = session.get("user_session_id")
-    if not session_id:
-        return jsonify({"error": "No hay sesión activa"}), 401
-
-    # Obtener usuario autenticado desde Redis
-    user_id = redis_client.hget(f"session:{session_id}", "user_id")
+    # Usuario autenticado (resuelto una vez por request, ver sesiones.py)
+    user_id = sesiones.usuario_actual()
     if not user_id:
         return jsonify({"error": "Se debe iniciar sesión para facturar un pedido"}), 401
 
-    user_id = ObjectId(user_id.decode("utf-8"))  # Convertimos de bytes a ObjectId
+    user_id = ObjectId(user_id)
 
+    db = get_mongo_client()
     pedidos_coll = db["pedidos"]
     pagos_coll = db["pagos"]
 
     # Buscar pedido
     pedido = pedidos_coll.find_one({"_id": ObjectId(pedido_id)})
     if not pedido:
+        if cola_pedidos.ASINCRONO and _en_proceso(pedido_id):
+            return _reintentar_luego("El pedido todavía se está guardando")
         return jsonify({"error": "Pedido no encontrado"}), 404
 
     # Verificar si el usuario que intenta pagar es el mismo que lo creó
@@ -218,48 +276,138 @@ def facturar_pedido(pedido_id):
 
     # Registrar pago en la colección "pagos"
     pago = {
+        "_id": ObjectId(),
         "pedido_id": ObjectId(pedido_id),
         "usuario_id": user_id,
         "total_pagado": pedido["total"],
         "metodo_pago": metodo_pago,
         "fecha_pago": datetime.utcnow()
     }
-    pagos_coll.insert_one(pago)
+    if cola_pedidos.ASINCRONO:
+        # El escritor guarda el pago y marca el pedido como pagado
+        if not cola_pedidos.encolar_pago(pago):
+            return jsonify({"error": "El pedido ya tiene un pago en curso"}), 409
+        return _aceptado({
+            "message": "Pago aceptado",
+            "pedido_id": pedido_id,
+            "pago_id": pago["_id"],
+            "metodo_pago": metodo_pago
+        }, pago["_id"])
+
+    # El pedido pasa a "pagado" de forma atómica: de dos pagos simultáneos solo
+    # uno lo reclama, y solo ese guarda el pago y suma a la actividad del cliente
+    reclamado = pedidos_coll.find_one_and_update(
+        {"_id": pedido["_id"], "estado": {"$ne": "pagado"}},
+        {"$set": {"estado": "pagado"}},
+        projection={"estado": 1, "fecha": 1},
+    )
+    if not reclamado:
+        return jsonify({"error": "El pedido ya fue pagado"}), 400
+    try:
+        pagos_coll.insert_one(pago)
+    except Exception:
+        pedidos_coll.update_one({"_id": pedido["_id"], "estado": "pagado"},
+                                {"$set": {"estado": reclamado.get("estado", "pendiente")}})
+        raise
 
-    # Actualizar estado del pedido a "pagado"
-    pedidos_coll.update_one({"_id": ObjectId(pedido_id)}, {"$set": {"estado": "pagado"}})
+    categorias.registrar_pago(user_id, pago["total_pagado"], pago["fecha_pago"])
+    # Con el estado que tenía el pedido al reclamarlo, no el leído al principio
+    ventas.registrar_pago(reclamado, pago)
 
     return jsonify({
         "message": "Pago registrado con éxito",
-        "pedido_id": str(pedido_id),
+        "pedido_id": pedido_id,
         "metodo_pago": metodo_pago
     })
 
+def _aceptado(cuerpo, operacion_id):
+    # 202: la escritura quedó encolada; el resultado se consulta en /operaciones/<id>
+    url = url_for("tienda.ver_operacion", operacion_id=str(operacion_id))
+    respuesta = jsonify(dict(cuerpo, estado="aceptado", operacion=url))
+    respuesta.headers["Location"] = url
+    return respuesta, 202
+
+
+def _en_proceso(operacion_id):
+    operacion = cola_pedidos.operacion(operacion_id)
+    return bool(operacion) and operacion["estado"] == "aceptado"
+
+
+def _reintentar_luego(mensaje):
+    respuesta = jsonify({"error": mensaje})
+    respuesta.headers["Retry-After"] = "1"
+    return respuesta, 409
+
+
+@tienda_bp.route("/operaciones/<operacion_id>", methods=["GET"])
+def ver_operacion(operacion_id):
+    """Estado de un pedido o pago encolado: aceptado, procesado o error."""
+    user_id = sesiones.usuario_actual()
+    if not user_id:
+        return jsonify({"error": "Se debe iniciar sesión para consultar una operación"}), 401
+    operacion = cola_pedidos.operacion(operacion_id)
+    # Las operaciones de otro usuario se responden como inexistentes
+    if not operacion or operacion.pop("usuario_id") != user_id:
+        return jsonify({"error": "Operación no encontrada"}), 404
+    return jsonify(dict(operacion, id=operacion_id)), 200
+
 """Historial de pagos registrados"""
-@app.route("/historial_pagos", methods=["GET"])
+@tienda_bp.route("/historial_pagos", methods=["GET"])
 def historial_pagos():
     """Devuelve la lista de pagos registrados, solo se veran los pagos de los usuario autenticado."""
-    session_id = session.get("user_session_id")
-    if not session_id:
-        return jsonify({"error": "No hay sesión activa"}), 401
-
-    # Obtener usuario autenticado desde Redis
-    user_id = redis_client.hget(f"session:{session_id}", "user_id")
+    user_id = sesiones.usuario_actual()
     if not user_id:
         return jsonify({"error": "Se debe iniciar sesión para ver tu historial de pagos"}), 401
 
-    user_id = ObjectId(user_id.decode("utf-8"))  # Convertimos de bytes a ObjectId
+    user_id = ObjectId(user_id)
 
+    db = get_mongo_client()
     pagos_coll = db["pagos"]
-    pagos = list(pagos_coll.find({"usuario_id": user_id}, {"_id": 0}))
-
-    # Convertir fecha a un formato legible
-    for pago in pagos:
-        pago["fecha_pago"] = pago["fecha_pago"].strftime("%Y-%m-%d %H:%M:%S")
+    # Usa el índice usuario_id + fecha_pago (más recientes primero)
+    pagos = list(pagos_coll.find({"usuario_id": user_id}, {"_id": 0}).sort("fecha_pago", -1))
 
     return jsonify({"historial_pagos": pagos})
 
 
+def create_app():
+    """Crea la aplicación. En producción: gunicorn -c gunicorn.conf.py "app:create_app()"."""
+    app = Flask(__name__)
+    # JSON con orjson que serializa ObjectId, datetime y Decimal128 (ver serializacion.py)
+    app.json = ProveedorJSONBSON(app)
+    # Cuerpos en MessagePack y compresión gzip/zstd de respuestas grandes (ver negociacion.py)
+    negociacion.registrar(app)
+    app.secret_key = os.environ.get("SECRET_KEY", "SECRET_KEY_DE_EJEMPLO")  # Cambiar por algo seguro en producción
+
+    # Registrar cada blueprint, asociándolos a un prefijo de URL
+    app.register_blueprint(tienda_bp)
+    app.register_blueprint(usuarios_bp, url_prefix="/usuarios")
+    app.register_blueprint(productos_bp, url_prefix="/productos")
+    app.register_blueprint(pedidos_bp, url_prefix="/pedidos")
+    app.register_blueprint(ventas_bp, url_prefix="/ventas")
+    app.register_blueprint(facturas_bp, url_prefix="/facturas")
+
+    # Latencias por ruta, tiempo en MongoDB/Redis y GET /metrics (ver metricas.py)
+    instrumentar(app)
+    # Rate limiting y descarte de carga con prioridad para el checkout (ver limites.py)
+    limites.registrar(app)
+
+    # Liberación de reservas vencidas y volcado del stock vendido a MongoDB
+    inventario.iniciar_worker()
+    # Escritor de pedidos y pagos encolados (solo con PEDIDOS_ASINCRONOS=1)
+    cola_pedidos.iniciar_worker()
+
+    CORS(app, supports_credentials=True)
+    app.config['SESSION_COOKIE_SAMESITE'] = 'None'
+    # SESSION_COOKIE_SECURE=0 permite probar sobre http (por ejemplo, los benchmarks)
+    app.config['SESSION_COOKIE_SECURE'] = os.environ.get("SESSION_COOKIE_SECURE", "1") == "1"
+
+    # Crear/actualizar índices al arrancar (también: python scripts/gestionar_indices.py aplicar)
+    if os.environ.get("CREAR_INDICES") == "1":
+        asegurar_indices(get_mongo_client())
+
+    return app
+
+
 if __name__ == "__main__":
-    # Para escuchar en todas las interfaces del contenedor
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Servidor de desarrollo, para escuchar en todas las interfaces del contenedor
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,388 @@
+# app_async.py
+# Variante asíncrona de app.py (Quart + motor + redis.asyncio) con la tienda y
+# los CRUD de usuarios, productos y pedidos. Cada request en espera de MongoDB o
+# Redis no ocupa un thread, así que un proceso puede mantener miles de requests
+# en vuelo. Lo que solo sirve app.py está en SOLO_SINCRONO.
+#
+#   hypercorn app_async:app --bind 0.0.0.0:5001 --workers 2
+import asyncio
+import os
+import re
+import uuid
+from datetime import datetime
+
+from quart import Quart, session, request, redirect, url_for, jsonify
+from quart_cors import cors
+from bson import ObjectId
+
+from db_config import get_motor_client, close_motor_client
+from redis_config import get_async_redis_client, close_async_redis_pool
+from crud.crud_async import productos_async_bp, usuarios_async_bp, pedidos_async_bp
+import cache_productos
+import categorias
+import carrito_repo_async as carrito_repo
+from carrito_repo import CarritoLleno, MAX_ITEMS_CARRITO
+import cola_pedidos
+import inventario
+import limites
+import negociacion
+import ventas
+from serializacion import ProveedorJSONBSON
+
+# Rutas de app.py que esta variante no sirve; scripts/verificar_scripts.py
+# compara las dos apps contra esta lista. Además, aquí el catálogo no responde
+# con ETag/304 (versiones.py) y limites.py solo aplica los token buckets, sin
+# descartar por lugares en vuelo ni por pools saturados.
+SOLO_SINCRONO = {
+    "/metrics",
+    "/productos/buscar",
+    "/productos/autocompletar",
+    "/ventas/",
+    "/ventas/productos",
+    "/facturas/",
+    "/facturas/<factura_id>",
+    "/facturas/<factura_id>/pago",
+    "/facturas/<factura_id>/pagos",
+}
+
+app = Quart(__name__)
+app.json = ProveedorJSONBSON(app)
+# Cuerpos en MessagePack y compresión gzip/zstd de respuestas grandes (ver negociacion.py)
+negociacion.registrar_async(app)
+app.secret_key = "SECRET_KEY_DE_EJEMPLO"  # Cambiar por algo seguro en producción
+
+app.register_blueprint(usuarios_async_bp, url_prefix="/usuarios")
+app.register_blueprint(productos_async_bp, url_prefix="/productos")
+app.register_blueprint(pedidos_async_bp, url_prefix="/pedidos")
+
+# Rate limiting por sesión y ruta (ver limites.py)
+limites.registrar_async(app)
+
+app = cors(app, allow_origin=re.compile(r".*"), allow_credentials=True)
+app.config['SESSION_COOKIE_SAMESITE'] = 'None'
+# SESSION_COOKIE_SECURE=0 permite probar sobre http (por ejemplo, los benchmarks)
+app.config['SESSION_COOKIE_SECURE'] = os.environ.get("SESSION_COOKIE_SECURE", "1") == "1"
+
+
+@app.before_serving
+async def abrir_conexiones():
+    # Los clientes asíncronos quedan ligados al event loop del servidor
+    get_motor_client()
+    get_async_redis_client()
+    # El volcado del inventario corre en un thread con los clientes síncronos
+    inventario.iniciar_worker()
+    cola_pedidos.iniciar_worker()
+
+
+@app.after_serving
+async def cerrar_conexiones():
+    close_motor_client()
+    await close_async_redis_pool()
+
+
+def _id_sesion(crear=False):
+    # Sesión perezosa, igual que sesiones.id_sesion en app.py
+    session_id = session.get("user_session_id")
+    if session_id is None and crear:
+        session_id = session["user_session_id"] = str(uuid.uuid4())
+    return session_id
+
+
+@app.route("/")
+async def index():
+    return "Bienvenido a la plataforma de comercio electrónico."
+
+
+@app.route("/health", methods=["GET"])
+async def health():
+    async def ping(coro):
+        try:
+            await coro
+            return True
+        except Exception:
+            return False
+
+    mongo, redis_ok = await asyncio.gather(
+        ping(get_motor_client().client.admin.command("ping")),
+        ping(get_async_redis_client().ping()),
+    )
+    estado = {"mongo": mongo, "redis": redis_ok}
+    return jsonify(estado), 200 if all(estado.values()) else 503
+
+
+@app.route("/login", methods=["POST"])
+async def login():
+    form = await request.form
+    email = form.get("email")
+    usuario = await get_motor_client()["usuarios"].find_one({"email": email})
+
+    if usuario:
+        session_id = _id_sesion(crear=True)
+        await carrito_repo.guardar_sesion(session_id, usuario["_id"], usuario["email"])
+        return jsonify({"message": "Usuario logueado", "user": usuario["email"]}), 200
+    else:
+        return jsonify({"error": "Usuario no encontrado"}), 404
+
+
+@app.route("/logout", methods=["GET"])
+async def logout():
+    session_id = session.pop('user_session_id', None)
+    if session_id:
+        await carrito_repo.borrar_sesion(session_id)
+    return redirect(url_for('index'))
+
+
+@app.route("/agregar_carrito", methods=["POST"])
+async def agregar_carrito():
+    session_id = _id_sesion(crear=True)
+
+    form = await request.form
+    product_id = form.get("product_id")
+    cantidad = int(form.get("cantidad", 1))
+    if cantidad < 1:
+        return jsonify({"error": "La cantidad debe ser mayor a 0"}), 400
+
+    db = get_motor_client()
+    productos = await cache_productos.obtener_productos_async([product_id], db, get_async_redis_client())
+    if not productos:
+        return jsonify({"error": "Producto no encontrado"}), 404
+
+    try:
+        en_carrito, disponible = await inventario.reservar_async(db, session_id, product_id, cantidad)
+    except CarritoLleno:
+        return jsonify({"error": f"El carrito admite hasta {MAX_ITEMS_CARRITO} productos distintos"}), 409
+    if en_carrito is None:
+        return jsonify({"error": "No hay stock suficiente", "disponible": max(disponible, 0)}), 409
+    return jsonify({"message": "Producto agregado al carrito"}), 200
+
+
+@app.route("/ver_carrito", methods=["GET"])
+async def ver_carrito():
+    session_id = _id_sesion()
+    if not session_id:
+        return jsonify({}), 200
+
+    carrito = await carrito_repo.ver_carrito(session_id)
+    return jsonify(carrito), 200
+
+
+@app.route("/confirmar_pedido", methods=["POST"])
+async def confirmar_pedido():
+    """
+    Convierte el carrito en un pedido en MongoDB (mismas reglas que app.py:
+    el stock se confirma en Redis y se vuelca a MongoDB en lote).
+    """
+    session_id = _id_sesion()
+    if not session_id:
+        return jsonify({"error": "Debes iniciar sesión antes de confirmar un pedido"}), 401
+
+    user_id, cart_items = await carrito_repo.tomar_carrito(session_id)
+    if not user_id:
+        return jsonify({"error": "Debes iniciar sesión antes de confirmar un pedido"}), 401
+    if not cart_items:
+        return jsonify({"error": "El carrito está vacío"}), 400
+
+    form = await request.form
+    try:
+        respuesta = await _crear_pedido(session_id, user_id, cart_items, form.get("parcial") in ("1", "true"))
+    except Exception:
+        await carrito_repo.devolver_carrito(session_id, cart_items)
+        raise
+    if respuesta[1] not in (200, 202):
+        await carrito_repo.devolver_carrito(session_id, cart_items)
+    return respuesta
+
+
+async def _crear_pedido(session_id, user_id, cart_items, parcial):
+    db = get_motor_client()
+    cantidades = {ObjectId(product_id): qty for product_id, qty in cart_items.items()}
+    productos = await cache_productos.obtener_productos_async(cantidades, db, get_async_redis_client())
+
+    sin_stock = [pid for pid in cantidades if pid not in productos]
+    a_confirmar = {pid: qty for pid, qty in cantidades.items() if pid in productos}
+    aceptado = bool(a_confirmar) and (parcial or not sin_stock)
+    if aceptado:
+        aceptado, agotados = await inventario.confirmar_async(db, session_id, a_confirmar, parcial)
+        sin_stock += agotados
+    if not aceptado:
+        return jsonify({
+            "error": "No hay stock suficiente para algunos productos",
+            "sin_stock": sin_stock
+        }), 409
+    descontados = {pid: qty for pid, qty in a_confirmar.items() if pid not in sin_stock}
+
+    items_pedido = []
+    total = 0
+    for pid, qty in descontados.items():
+        producto = productos[pid]
+        subtotal = producto["precio"] * qty
+        total += subtotal
+        items_pedido.append({
+            "product_id": str(pid),
+            "nombre": producto["nombre"],
+            "cantidad": qty,
+            "precio_unitario": producto["precio"],
+            "subtotal": subtotal
+        })
+
+    pedido_id = ObjectId()
+    nuevo_pedido = {
+        "_id": pedido_id,
+        "usuario_id": ObjectId(user_id),
+        "items": items_pedido,
+        "total": total,
+        "estado": "pendiente",
+        "fecha": datetime.utcnow()
+    }
+    try:
+        if cola_pedidos.ASINCRONO:
+            await cola_pedidos.encolar_pedido_async(nuevo_pedido)
+        else:
+            await db["pedidos"].insert_one(nuevo_pedido)
+    except Exception:
+        await inventario.revertir_async(descontados)
+        raise
+
+    if not cola_pedidos.ASINCRONO:
+        # categorias.py y ventas.py usan el cliente síncrono de MongoDB
+        await asyncio.to_thread(categorias.registrar_pedido, user_id, nuevo_pedido["fecha"])
+        await asyncio.to_thread(ventas.registrar_pedido, nuevo_pedido)
+
+    if cola_pedidos.ASINCRONO:
+        return _aceptado({
+            "message": "Pedido aceptado",
+            "pedido_id": pedido_id,
+            "total": total,
+            "sin_stock": sin_stock
+        }, pedido_id)
+
+    return jsonify({
+        "message": "Pedido confirmado",
+        "pedido_id": pedido_id,
+        "total": total,
+        "sin_stock": sin_stock
+    }), 200
+
+
+@app.route("/ver_sesion", methods=["GET"])
+async def ver_sesion():
+    session_id = session.get("user_session_id")
+    if not session_id:
+        return jsonify({"error": "No hay sesión activa"}), 401
+    datos = await carrito_repo.datos_sesion(session_id)
+    if "user_id" in datos and "user_email" not in datos:
+        usuario = await get_motor_client()["usuarios"].find_one({"_id": ObjectId(datos["user_id"])}, {"email": 1})
+        datos["user_email"] = usuario["email"] if usuario else None
+    return jsonify(datos), 200
+
+
+@app.route("/facturar_pedido/<pedido_id>", methods=["POST"])
+async def facturar_pedido(pedido_id):
+    """Factura un pedido y registra el pago."""
+    session_id = session.get("user_session_id")
+    if not session_id:
+        return jsonify({"error": "No hay sesión activa"}), 401
+
+    user_id = await carrito_repo.usuario_de_sesion(session_id)
+    if not user_id:
+        return jsonify({"error": "Se debe iniciar sesión para facturar un pedido"}), 401
+    user_id = ObjectId(user_id)
+
+    db = get_motor_client()
+    pedido = await db["pedidos"].find_one({"_id": ObjectId(pedido_id)})
+    if not pedido:
+        operacion = await cola_pedidos.operacion_async(pedido_id) if cola_pedidos.ASINCRONO else None
+        if operacion and operacion["estado"] == "aceptado":
+            respuesta = jsonify({"error": "El pedido todavía se está guardando"})
+            respuesta.headers["Retry-After"] = "1"
+            return respuesta, 409
+        return jsonify({"error": "Pedido no encontrado"}), 404
+    if pedido["usuario_id"] != user_id:
+        return jsonify({"error": "No puedes facturar un pedido que no te pertenece"}), 403
+    if pedido.get("estado") == "pagado":
+        return jsonify({"error": "El pedido ya fue pagado"}), 400
+
+    form = await request.form
+    metodo_pago = form.get("metodo_pago", "Tarjeta de Crédito")
+
+    pago = {
+        "_id": ObjectId(),
+        "pedido_id": ObjectId(pedido_id),
+        "usuario_id": user_id,
+        "total_pagado": pedido["total"],
+        "metodo_pago": metodo_pago,
+        "fecha_pago": datetime.utcnow()
+    }
+    if cola_pedidos.ASINCRONO:
+        if not await cola_pedidos.encolar_pago_async(pago):
+            return jsonify({"error": "El pedido ya tiene un pago en curso"}), 409
+        return _aceptado({
+            "message": "Pago aceptado",
+            "pedido_id": pedido_id,
+            "pago_id": pago["_id"],
+            "metodo_pago": metodo_pago
+        }, pago["_id"])
+
+    # Igual que app.py: solo el pago que reclama el pedido se guarda y se cuenta
+    reclamado = await db["pedidos"].find_one_and_update(
+        {"_id": pedido["_id"], "estado": {"$ne": "pagado"}},
+        {"$set": {"estado": "pagado"}},
+        projection={"estado": 1, "fecha": 1},
+    )
+    if not reclamado:
+        return jsonify({"error": "El pedido ya fue pagado"}), 400
+    try:
+        await db["pagos"].insert_one(pago)
+    except Exception:
+        await db["pedidos"].update_one({"_id": pedido["_id"], "estado": "pagado"},
+                                       {"$set": {"estado": reclamado.get("estado", "pendiente")}})
+        raise
+    await asyncio.to_thread(categorias.registrar_pago, user_id, pago["total_pagado"], pago["fecha_pago"])
+    await asyncio.to_thread(ventas.registrar_pago, reclamado, pago)
+
+    return jsonify({
+        "message": "Pago registrado con éxito",
+        "pedido_id": pedido_id,
+        "metodo_pago": metodo_pago
+    })
+
+
+def _aceptado(cuerpo, operacion_id):
+    # Igual que en app.py: 202 y la URL para consultar el resultado
+    url = url_for("ver_operacion", operacion_id=str(operacion_id))
+    respuesta = jsonify(dict(cuerpo, estado="aceptado", operacion=url))
+    respuesta.headers["Location"] = url
+    return respuesta, 202
+
+
+@app.route("/operaciones/<operacion_id>", methods=["GET"])
+async def ver_operacion(operacion_id):
+    session_id = session.get("user_session_id")
+    user_id = await carrito_repo.usuario_de_sesion(session_id) if session_id else None
+    if not user_id:
+        return jsonify({"error": "Se debe iniciar sesión para consultar una operación"}), 401
+    operacion = await cola_pedidos.operacion_async(operacion_id)
+    if not operacion or operacion.pop("usuario_id") != user_id:
+        return jsonify({"error": "Operación no encontrada"}), 404
+    return jsonify(dict(operacion, id=operacion_id)), 200
+
+
+@app.route("/historial_pagos", methods=["GET"])
+async def historial_pagos():
+    session_id = session.get("user_session_id")
+    if not session_id:
+        return jsonify({"error": "No hay sesión activa"}), 401
+
+    user_id = await carrito_repo.usuario_de_sesion(session_id)
+    if not user_id:
+        return jsonify({"error": "Se debe iniciar sesión para ver tu historial de pagos"}), 401
+
+    pagos = await get_motor_client()["pagos"].find(
+        {"usuario_id": ObjectId(user_id)}, {"_id": 0}
+    ).sort("fecha_pago", -1).to_list(None)
+
+    return jsonify({"historial_pagos": pagos})
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5001)
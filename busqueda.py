@@ -0,0 +1,184 @@
+# busqueda.py
+import logging
+import re
+import unicodedata
+
+import redis
+from bson import ObjectId
+
+from db_config import get_mongo_client
+from redis_config import get_redis_client
+
+# Índice de autocompletado de productos en Redis:
+#   autocompletar:productos  ZSET con score 0 y miembros "termino\0id", que
+#                            ZRANGEBYLEX recorre por prefijo en O(log N + k)
+#   autocompletar:nombres    HASH id -> nombre, para mostrar el resultado y para
+#                            saber qué términos quitar cuando el nombre cambia
+# Los términos de un producto son cada palabra del nombre normalizado (sin
+# tildes, en minúsculas) y el nombre completo, así "roj" encuentra "Zapatilla
+# roja" y "zapatilla r" también. La búsqueda por relevancia usa el índice de
+# texto de MongoDB (ver indices.py).
+#
+# Las rutas de productos mantienen el índice al día (indexar / desindexar /
+# reindexar); reconstruir() lo arma de cero desde MongoDB.
+
+CLAVE_TERMINOS = "autocompletar:productos"
+CLAVE_NOMBRES = "autocompletar:nombres"
+LONGITUD_MINIMA = 2
+BATCH_RECONSTRUIR = 5000
+
+log = logging.getLogger(__name__)
+
+# KEYS = términos, nombres; ARGV = desde, hasta, cantidad a leer, cantidad a devolver
+# Devuelve [id1, nombre1, id2, nombre2, ...] sin ids repetidos, en un round trip
+_LUA_AUTOCOMPLETAR = """
+local miembros = redis.call('ZRANGEBYLEX', KEYS[1], ARGV[1], ARGV[2], 'LIMIT', 0, ARGV[3])
+local vistos = {}
+local ids = {}
+for _, miembro in ipairs(miembros) do
+  local id = string.match(miembro, '%z(.+)$')
+  if id and not vistos[id] then
+    vistos[id] = true
+    ids[#ids + 1] = id
+    if #ids >= tonumber(ARGV[4]) then
+      break
+    end
+  end
+end
+if #ids == 0 then
+  return {}
+end
+local nombres = redis.call('HMGET', KEYS[2], unpack(ids))
+local r = {}
+for i, id in ipairs(ids) do
+  r[#r + 1] = id
+  r[#r + 1] = nombres[i] or ''
+end
+return r
+"""
+
+_scripts = {}
+
+
+def _script(nombre, fuente):
+    if nombre not in _scripts:
+        _scripts[nombre] = get_redis_client().register_script(fuente)
+    return _scripts[nombre]
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con espacios simples."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"\w+", texto))
+
+
+def terminos(nombre):
+    normalizado = normalizar(nombre)
+    if not normalizado:
+        return set()
+    palabras = {p for p in normalizado.split() if len(p) >= LONGITUD_MINIMA}
+    return palabras | {normalizado}
+
+
+def _miembros(nombre, producto_id):
+    return [f"{termino}\0{producto_id}" for termino in terminos(nombre)]
+
+
+def _agregar(pipe, producto_id, nombre, terminos_clave=CLAVE_TERMINOS, nombres_clave=CLAVE_NOMBRES):
+    miembros = _miembros(nombre, producto_id)
+    if miembros:
+        pipe.zadd(terminos_clave, {m: 0 for m in miembros})
+        pipe.hset(nombres_clave, producto_id, nombre)
+
+
+def _reemplazar(docs, borrados=()):
+    # docs: [(id, nombre nuevo)]; borrados: ids a quitar del índice
+    r = get_redis_client()
+    ids = [str(i) for i, _ in docs] + [str(i) for i in borrados]
+    anteriores = r.hmget(CLAVE_NOMBRES, ids) if ids else []
+    pipe = r.pipeline()  # MULTI: el índice nunca queda a medio actualizar
+    for producto_id, anterior in zip(ids, anteriores):
+        if anterior is not None:
+            viejos = _miembros(anterior.decode("utf-8"), producto_id)
+            if viejos:
+                pipe.zrem(CLAVE_TERMINOS, *viejos)
+            pipe.hdel(CLAVE_NOMBRES, producto_id)
+    for producto_id, nombre in docs:
+        _agregar(pipe, str(producto_id), nombre)
+    pipe.execute()
+
+
+def indexar(producto_id, nombre):
+    """Agrega o actualiza un producto en el índice de autocompletado."""
+    try:
+        _reemplazar([(producto_id, nombre)])
+    except redis.RedisError:
+        log.warning("No se pudo indexar el producto %s", producto_id)
+
+
+def desindexar(*ids):
+    try:
+        _reemplazar([], borrados=ids)
+    except redis.RedisError:
+        log.warning("No se pudieron desindexar los productos %s", ids)
+
+
+def reindexar(*ids):
+    """Relee los productos de MongoDB y actualiza el índice (los que no existen se quitan)."""
+    oids = [ObjectId(i) for i in ids]
+    docs = get_mongo_client()["productos"].find({"_id": {"$in": oids}}, {"nombre": 1})
+    encontrados = {doc["_id"]: doc.get("nombre", "") for doc in docs}
+    try:
+        _reemplazar(list(encontrados.items()), borrados=[i for i in oids if i not in encontrados])
+    except redis.RedisError:
+        log.warning("No se pudieron reindexar los productos %s", ids)
+
+
+def autocompletar(prefijo, limite=10):
+    """Devuelve [{"_id", "nombre"}] de los productos con algún término que empieza con `prefijo`."""
+    prefijo = normalizar(prefijo)
+    if len(prefijo) < LONGITUD_MINIMA:
+        return []
+    # El byte 0xff no aparece en UTF-8: cierra el rango del prefijo
+    desde = b"[" + prefijo.encode("utf-8")
+    valores = _script("autocompletar", _LUA_AUTOCOMPLETAR)(
+        keys=[CLAVE_TERMINOS, CLAVE_NOMBRES],
+        args=[desde, desde + b"\xff", limite * 4, limite],
+        client=get_redis_client(),
+    )
+    return [
+        {"_id": valores[i].decode("utf-8"), "nombre": valores[i + 1].decode("utf-8")}
+        for i in range(0, len(valores), 2)
+    ]
+
+
+def reconstruir(batch=BATCH_RECONSTRUIR):
+    """
+    Arma el índice completo desde MongoDB en claves temporales y las reemplaza
+    con RENAME, así las consultas nunca ven un índice a medio construir.
+    Devuelve la cantidad de productos indexados.
+    """
+    r = get_redis_client()
+    terminos_tmp = CLAVE_TERMINOS + ":tmp"
+    nombres_tmp = CLAVE_NOMBRES + ":tmp"
+    r.delete(terminos_tmp, nombres_tmp)
+
+    total = 0
+    pipe = r.pipeline(transaction=False)
+    cursor = get_mongo_client()["productos"].find({}, {"nombre": 1}).batch_size(batch)
+    for doc in cursor:
+        _agregar(pipe, str(doc["_id"]), doc.get("nombre", ""), terminos_tmp, nombres_tmp)
+        total += 1
+        if total % batch == 0:
+            pipe.execute()
+    pipe.execute()
+
+    pipe = r.pipeline()
+    if r.exists(terminos_tmp):
+        pipe.rename(terminos_tmp, CLAVE_TERMINOS)
+        pipe.rename(nombres_tmp, CLAVE_NOMBRES)
+    else:
+        pipe.delete(CLAVE_TERMINOS, CLAVE_NOMBRES)
+    pipe.execute()
+    return total
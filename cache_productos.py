@@ -0,0 +1,327 @@
+# cache_productos.py
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+import bson
+import redis
+from bson import ObjectId
+
+from db_config import get_mongo_client
+from redis_config import get_redis_client, get_async_redis_client
+from metricas import CACHE_PRODUCTOS
+import versiones
+
+# Cache de productos en dos niveles, consultados en orden:
+#   1. LRU en memoria del proceso, con TTL corto
+#   2. Redis (clave producto:{id}, documento en BSON), compartido por los workers
+#   3. MongoDB
+# Las escrituras llaman a invalidar(): se borra la entrada en Redis, se
+# incrementan las versiones para los ETag (versiones.py) y se publica el id en
+# un canal para que cada proceso la descarte de su LRU.
+#
+# Un lector que leyó de MongoDB el documento anterior a una escritura podría
+# guardarlo después de invalidar(). Por eso, al buscar en Redis también se lee
+# la versión del documento (version:productos:{id}), y lo traído de MongoDB se
+# guarda, en Redis y en el LRU, solo si la versión sigue siendo esa.
+
+TTL_LOCAL = float(os.environ.get("CACHE_PRODUCTOS_TTL_LOCAL", 30))
+TTL_REDIS = int(os.environ.get("CACHE_PRODUCTOS_TTL_REDIS", 300))
+TAMANO_LOCAL = int(os.environ.get("CACHE_PRODUCTOS_TAMANO", 10000))
+CANAL_INVALIDACIONES = "productos:invalidaciones"
+
+# Campos internos que no forman parte del producto
+PROYECCION = {"reservas": 0, "inventario_lote": 0}
+
+log = logging.getLogger(__name__)
+
+# KEYS = producto:{id}, version:productos:{id}, ... (de a pares)
+# ARGV = ttl, versión leída antes de consultar MongoDB ('' si no había), documento, ...
+# Devuelve las posiciones (desde 1) de los documentos guardados
+_LUA_GUARDAR = """
+local guardados = {}
+for i = 1, #KEYS, 2 do
+  if (redis.call('HGET', KEYS[i + 1], 'v') or '') == ARGV[i + 1] then
+    redis.call('SETEX', KEYS[i], ARGV[1], ARGV[i + 2])
+    guardados[#guardados + 1] = (i + 1) / 2
+  end
+end
+return guardados
+"""
+
+_scripts = {}
+
+
+def _script(nombre, fuente, asincrono=False):
+    clave = (nombre, asincrono)
+    if clave not in _scripts:
+        cliente = get_async_redis_client() if asincrono else get_redis_client()
+        _scripts[clave] = cliente.register_script(fuente)
+    return _scripts[clave]
+
+
+class CacheLRU:
+    """LRU con expiración por entrada, seguro entre threads."""
+
+    def __init__(self, tamano, ttl):
+        self.tamano = tamano
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            valor, expira = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + self.ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.tamano:
+                self._datos.popitem(last=False)
+
+    def borrar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+_local = CacheLRU(TAMANO_LOCAL, TTL_LOCAL)
+_contadores = {"hits_local": 0, "hits_redis": 0, "misses": 0, "invalidaciones": 0}
+_contadores_lock = threading.Lock()
+_suscriptor_pid = None
+_suscriptor_lock = threading.Lock()
+
+
+def _contar(nombre, cantidad=1):
+    if cantidad:
+        with _contadores_lock:
+            _contadores[nombre] += cantidad
+        CACHE_PRODUCTOS.labels(nombre).inc(cantidad)
+
+
+def _clave(producto_id):
+    return f"producto:{producto_id}"
+
+
+def _leer_redis(pipe, faltantes):
+    # Los documentos y, en el mismo viaje, sus versiones (ver _LUA_GUARDAR)
+    pipe.mget([_clave(oid) for oid in faltantes])
+    for oid in faltantes:
+        pipe.hget(versiones.clave_documento("productos", oid), "v")
+
+
+def _versiones_leidas(faltantes, respuesta):
+    # Devuelve (valores de MGET, {oid: versión})
+    return respuesta[0], {oid: v or b"" for oid, v in zip(faltantes, respuesta[1:])}
+
+
+def _args_guardar(docs, vistas):
+    keys, args = [], [TTL_REDIS]
+    for doc in docs:
+        keys += [_clave(doc["_id"]), versiones.clave_documento("productos", doc["_id"])]
+        args += [vistas[doc["_id"]], bson.encode(doc)]
+    return keys, args
+
+
+def _guardados(docs, posiciones):
+    return {docs[p - 1]["_id"] for p in posiciones}
+
+
+def _escuchar_invalidaciones():
+    while True:
+        try:
+            pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CANAL_INVALIDACIONES)
+            # Pudimos perder mensajes mientras no estábamos suscritos
+            _local.limpiar()
+            for mensaje in pubsub.listen():
+                if mensaje["type"] != "message":
+                    continue
+                for producto_id in mensaje["data"].decode("utf-8").split(","):
+                    _local.borrar(producto_id)
+        except redis.RedisError:
+            log.warning("Suscripción a %s caída, reintentando", CANAL_INVALIDACIONES)
+            time.sleep(1)
+
+
+def _asegurar_suscriptor():
+    # Un thread suscriptor por proceso (se vuelve a lanzar tras un fork)
+    global _suscriptor_pid
+    pid = os.getpid()
+    if _suscriptor_pid == pid:
+        return
+    with _suscriptor_lock:
+        if _suscriptor_pid != pid:
+            threading.Thread(target=_escuchar_invalidaciones, name="cache-productos",
+                             daemon=True).start()
+            _suscriptor_pid = pid
+
+
+def _buscar_local(ids):
+    encontrados = {}
+    faltantes = []
+    for oid in ids:
+        doc = _local.obtener(str(oid))
+        if doc is not None:
+            encontrados[oid] = doc
+        else:
+            faltantes.append(oid)
+    _contar("hits_local", len(encontrados))
+    return encontrados, faltantes
+
+
+def _cargar_de_redis(faltantes, valores, encontrados):
+    # Devuelve los ids que tampoco estaban en Redis
+    pendientes = []
+    for oid, valor in zip(faltantes, valores):
+        if valor is None:
+            pendientes.append(oid)
+            continue
+        doc = bson.decode(valor)
+        encontrados[oid] = doc
+        _local.guardar(str(oid), doc)
+    _contar("hits_redis", len(faltantes) - len(pendientes))
+    _contar("misses", len(pendientes))
+    return pendientes
+
+
+def _cargar_de_mongo(docs, encontrados, guardados=None):
+    # guardados: los que pueden ir al LRU (None = todos, si no se pudo comprobar la versión)
+    for doc in docs:
+        encontrados[doc["_id"]] = doc
+        if guardados is None or doc["_id"] in guardados:
+            _local.guardar(str(doc["_id"]), doc)
+
+
+def obtener_productos(ids):
+    """
+    Devuelve {ObjectId: producto} para los ids indicados que existan.
+    Cada documento es una copia que el llamador puede modificar.
+    """
+    _asegurar_suscriptor()
+    encontrados, faltantes = _buscar_local([ObjectId(i) for i in ids])
+
+    r = get_redis_client()
+    vistas = None
+    if faltantes:
+        try:
+            pipe = r.pipeline(transaction=False)
+            _leer_redis(pipe, faltantes)
+            valores, vistas = _versiones_leidas(faltantes, pipe.execute())
+        except redis.RedisError:
+            valores = [None] * len(faltantes)
+        faltantes = _cargar_de_redis(faltantes, valores, encontrados)
+
+    if faltantes:
+        db = get_mongo_client()
+        docs = list(db["productos"].find({"_id": {"$in": faltantes}}, PROYECCION))
+        guardados = None
+        if docs and vistas is not None:
+            try:
+                keys, args = _args_guardar(docs, vistas)
+                guardados = _guardados(docs, _script("guardar", _LUA_GUARDAR)(keys=keys, args=args, client=r))
+            except redis.RedisError:
+                pass
+        _cargar_de_mongo(docs, encontrados, guardados)
+
+    return {oid: dict(doc) for oid, doc in encontrados.items()}
+
+
+async def obtener_productos_async(ids, db, r):
+    """Igual que obtener_productos, con motor (`db`) y redis.asyncio (`r`)."""
+    _asegurar_suscriptor()
+    encontrados, faltantes = _buscar_local([ObjectId(i) for i in ids])
+
+    vistas = None
+    if faltantes:
+        try:
+            pipe = r.pipeline(transaction=False)
+            _leer_redis(pipe, faltantes)
+            valores, vistas = _versiones_leidas(faltantes, await pipe.execute())
+        except redis.RedisError:
+            valores = [None] * len(faltantes)
+        faltantes = _cargar_de_redis(faltantes, valores, encontrados)
+
+    if faltantes:
+        docs = await db["productos"].find({"_id": {"$in": faltantes}}, PROYECCION).to_list(None)
+        guardados = None
+        if docs and vistas is not None:
+            try:
+                keys, args = _args_guardar(docs, vistas)
+                posiciones = await _script("guardar", _LUA_GUARDAR, asincrono=True)(keys=keys, args=args, client=r)
+                guardados = _guardados(docs, posiciones)
+            except redis.RedisError:
+                pass
+        _cargar_de_mongo(docs, encontrados, guardados)
+
+    return {oid: dict(doc) for oid, doc in encontrados.items()}
+
+
+def obtener_producto(producto_id):
+    """Devuelve una copia del producto o None si no existe."""
+    return obtener_productos([producto_id]).get(ObjectId(producto_id))
+
+
+def invalidar(*ids):
+    """
+    Descarta los productos en este proceso, en Redis y en el resto de los
+    workers, e incrementa su versión y la del catálogo.
+    """
+    ids = [str(i) for i in ids]
+    if not ids:
+        return
+    for producto_id in ids:
+        _local.borrar(producto_id)
+    _contar("invalidaciones", len(ids))
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.delete(*[_clave(producto_id) for producto_id in ids])
+        versiones.incrementar(pipe, "productos", ids)
+        pipe.publish(CANAL_INVALIDACIONES, ",".join(ids))
+        pipe.execute()
+    except redis.RedisError:
+        log.warning("No se pudo invalidar en Redis: %s", ids)
+
+
+async def invalidar_async(r, *ids):
+    """Igual que invalidar, con un cliente de redis.asyncio."""
+    ids = [str(i) for i in ids]
+    if not ids:
+        return
+    for producto_id in ids:
+        _local.borrar(producto_id)
+    _contar("invalidaciones", len(ids))
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.delete(*[_clave(producto_id) for producto_id in ids])
+        await versiones.incrementar_async(pipe, "productos", ids)
+        pipe.publish(CANAL_INVALIDACIONES, ",".join(ids))
+        await pipe.execute()
+    except redis.RedisError:
+        log.warning("No se pudo invalidar en Redis: %s", ids)
+
+
+def estadisticas():
+    with _contadores_lock:
+        datos = dict(_contadores)
+    consultas = datos["hits_local"] + datos["hits_redis"] + datos["misses"]
+    datos["entradas_local"] = len(_local)
+    datos["hit_rate"] = round((consultas - datos["misses"]) / consultas, 4) if consultas else 0.0
+    return datos
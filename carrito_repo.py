@@ -0,0 +1,272 @@
+# carrito_repo.py
+import os
+from bson import ObjectId
+from redis_config import get_redis_client, get_redis_client_nodo, get_redis_client_sesion, nodo_sesion
+
+# Acceso a carritos (cart:{session_id}) y sesiones (session:{session_id}) en Redis.
+# Cada operación es un único round trip: un comando, o un script Lua cuando
+# hacen falta varios comandos de forma atómica. Los items se agregan desde
+# inventario.reservar(), que reserva el stock en el mismo script.
+#
+# Modo compacto (REDIS_COMPACTO=1), para cuando hay millones de carritos:
+#   c:{session_id}   HASH ObjectId binario (12 bytes) -> cantidad
+#   s:{session_id}   STRING user_id binario (12 bytes); el email se lee de MongoDB
+# Los campos cortos y la cantidad de productos por carrito acotada a
+# MAX_ITEMS_CARRITO mantienen los HASH en codificación listpack
+# (hash-max-listpack-entries / hash-max-listpack-value de redis.conf).
+# En este modo las lecturas también miran las claves del formato anterior, así
+# que se puede activar sin migrar; scripts/migrar_redis.py convierte las que quedan.
+#
+# Con REDIS_NODOS cada sesión vive en el nodo que le toca por su session_id
+# (redis_config.get_redis_client_sesion), junto con su carrito.
+
+TTL_CARRITO = 1800  # 30 minutos, se renueva con cada uso del carrito
+# Las sesiones expiran tras este tiempo sin actividad (TTL deslizante)
+TTL_SESION = int(os.environ.get("SESION_TTL", 7200))
+
+COMPACTO = os.environ.get("REDIS_COMPACTO", "0") == "1"
+# 128 = hash-max-listpack-entries por defecto; 0 = sin límite
+MAX_ITEMS_CARRITO = int(os.environ.get("CARRITO_MAX_ITEMS", 128 if COMPACTO else 0))
+
+
+class CarritoLleno(Exception):
+    """El carrito ya tiene MAX_ITEMS_CARRITO productos distintos."""
+
+
+def clave_carrito(session_id, compacto=COMPACTO):
+    return f"c:{session_id}" if compacto else f"cart:{session_id}"
+
+
+def clave_sesion(session_id, compacto=COMPACTO):
+    return f"s:{session_id}" if compacto else f"session:{session_id}"
+
+
+def _claves(clave, session_id):
+    # La clave del formato actual primero; en modo compacto, también la anterior
+    return [clave(session_id)] + ([clave(session_id, compacto=False)] if COMPACTO else [])
+
+
+def campo_producto(product_id, compacto=COMPACTO):
+    """Campo del HASH del carrito para un producto: 12 bytes en modo compacto, hex si no."""
+    return ObjectId(product_id).binary if compacto else str(product_id)
+
+
+def _id_texto(valor):
+    # 12 bytes = ObjectId binario (modo compacto); si no, el id en hex
+    return str(ObjectId(valor)) if len(valor) == 12 else valor.decode("utf-8")
+
+
+# KEYS = carritos (actual y, en modo compacto, el anterior); ARGV = ttl
+_LUA_VER = """
+local carritos = {}
+for i, clave in ipairs(KEYS) do
+  local items = redis.call('HGETALL', clave)
+  if #items > 0 then
+    redis.call('EXPIRE', clave, ARGV[1])
+  end
+  carritos[i] = items
+end
+return carritos
+"""
+
+# KEYS = sesiones (actual y, en modo compacto, la anterior); ARGV = ttl, compacto (0/1)
+# Lee el usuario y renueva el TTL de la sesión en el mismo round trip.
+# La sesión compacta es un STRING con el user_id; la anterior un HASH.
+_LUA_USUARIO = """
+for i, clave in ipairs(KEYS) do
+  local user_id
+  if i == 1 and ARGV[2] == '1' then
+    user_id = redis.call('GET', clave)
+  else
+    user_id = redis.call('HGET', clave, 'user_id')
+  end
+  if user_id then
+    redis.call('EXPIRE', clave, ARGV[1])
+    return user_id
+  end
+end
+return false
+"""
+
+# KEYS = sesión, carrito (y en modo compacto: sesión anterior, carrito anterior)
+# ARGV = ttl de la sesión, compacto (0/1)
+# Lee el usuario de la sesión y, si está logueado, lee y borra el carrito en el
+# mismo paso: nadie puede modificarlo entre la lectura y el borrado.
+_LUA_TOMAR = """
+local user_id
+for i = 1, #KEYS, 2 do
+  if i == 1 and ARGV[2] == '1' then
+    user_id = redis.call('GET', KEYS[i])
+  else
+    user_id = redis.call('HGET', KEYS[i], 'user_id')
+  end
+  if user_id then
+    redis.call('EXPIRE', KEYS[i], ARGV[1])
+    break
+  end
+end
+if not user_id then
+  return {false, {}}
+end
+local carritos = {}
+for i = 2, #KEYS, 2 do
+  local items = redis.call('HGETALL', KEYS[i])
+  if #items > 0 then
+    redis.call('DEL', KEYS[i])
+  end
+  carritos[#carritos + 1] = items
+end
+return {user_id, carritos}
+"""
+
+# KEYS[1] = carrito; ARGV = ttl, product_id1, cantidad1, product_id2, ...
+# Suma (no reemplaza) por si se agregaron productos mientras tanto
+_LUA_DEVOLVER = """
+for i = 2, #ARGV, 2 do
+  redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return #ARGV
+"""
+
+_scripts = {}
+
+
+def _script(nombre, fuente):
+    # Los scripts se envían con EVALSHA (y EVAL si el servidor no los conoce)
+    if nombre not in _scripts:
+        _scripts[nombre] = get_redis_client().register_script(fuente)
+    return _scripts[nombre]
+
+
+def _decodificar_items(*carritos):
+    # HGETALL en Lua devuelve [campo, valor, campo, valor, ...]; si hay carrito
+    # compacto y anterior a la vez se suman
+    items = {}
+    for carrito in carritos:
+        for i in range(0, len(carrito), 2):
+            product_id = _id_texto(carrito[i])
+            items[product_id] = items.get(product_id, 0) + int(carrito[i + 1])
+    return items
+
+
+def _decodificar_usuario(user_id):
+    return _id_texto(user_id) if user_id else None
+
+
+def _args_tomar(session_id, ttl):
+    # Pares (sesión, carrito): el formato actual y, en modo compacto, el anterior
+    keys = []
+    for sesion, carrito in zip(_claves(clave_sesion, session_id), _claves(clave_carrito, session_id)):
+        keys += [sesion, carrito]
+    return keys, [ttl, "1" if COMPACTO else "0"]
+
+
+def _args_devolver(items, ttl):
+    args = [ttl]
+    for product_id, cantidad in items.items():
+        args += [campo_producto(product_id), cantidad]
+    return args
+
+
+def escribir_sesion(pipe, session_id, user_id, email, ttl=TTL_SESION):
+    """Agrega a `pipe` la escritura de la sesión en el formato configurado."""
+    if COMPACTO:
+        pipe.set(clave_sesion(session_id), ObjectId(user_id).binary, ex=ttl)
+        pipe.delete(clave_sesion(session_id, compacto=False))
+        return
+    pipe.hset(clave_sesion(session_id), mapping={
+        "user_id": str(user_id),
+        "user_email": email,
+    })
+    pipe.expire(clave_sesion(session_id), ttl)
+
+
+def _datos_sesion(compacta, anterior):
+    if compacta is not None:
+        return {"user_id": _id_texto(compacta)}
+    return {k.decode("utf-8"): v.decode("utf-8") for k, v in anterior.items()}
+
+
+# --- Sesiones ---
+
+def guardar_sesion(session_id, user_id, email, ttl=TTL_SESION):
+    pipe = get_redis_client_sesion(session_id).pipeline()
+    escribir_sesion(pipe, session_id, user_id, email, ttl)
+    pipe.execute()
+
+
+def borrar_sesion(session_id):
+    get_redis_client_sesion(session_id).delete(*_claves(clave_sesion, session_id))
+
+
+def datos_sesion(session_id):
+    """Campos de la sesión; en modo compacto solo user_id."""
+    r = get_redis_client_sesion(session_id)
+    compacta = r.get(clave_sesion(session_id)) if COMPACTO else None
+    anterior = {} if compacta is not None else r.hgetall(clave_sesion(session_id, compacto=False))
+    return _datos_sesion(compacta, anterior)
+
+
+def usuario_de_sesion(session_id, ttl=TTL_SESION):
+    """Devuelve el user_id (str) de la sesión o None si no está logueada. Renueva el TTL."""
+    user_id = _script("usuario", _LUA_USUARIO)(
+        keys=_claves(clave_sesion, session_id),
+        args=[ttl, "1" if COMPACTO else "0"],
+        client=get_redis_client_sesion(session_id),
+    )
+    return _decodificar_usuario(user_id)
+
+
+# --- Carritos ---
+
+def ver_carrito(session_id, ttl=TTL_CARRITO):
+    """Devuelve {product_id: cantidad} y renueva el TTL del carrito."""
+    carritos = _script("ver", _LUA_VER)(
+        keys=_claves(clave_carrito, session_id),
+        args=[ttl],
+        client=get_redis_client_sesion(session_id),
+    )
+    return _decodificar_items(*carritos)
+
+
+def tomar_carrito(session_id, ttl_sesion=TTL_SESION):
+    """
+    Lee y borra el carrito de forma atómica, solo si la sesión está logueada.
+    Devuelve (user_id, {product_id: cantidad}); user_id es None sin login, y
+    en ese caso el carrito no se toca.
+    """
+    keys, args = _args_tomar(session_id, ttl_sesion)
+    user_id, carritos = _script("tomar", _LUA_TOMAR)(
+        keys=keys, args=args, client=get_redis_client_sesion(session_id))
+    if not user_id:
+        return None, {}
+    return _decodificar_usuario(user_id), _decodificar_items(*carritos)
+
+
+def devolver_carrito(session_id, items, ttl=TTL_CARRITO):
+    """Vuelve a cargar en el carrito los items tomados (p. ej. si el pedido falló)."""
+    if not items:
+        return
+    _script("devolver", _LUA_DEVOLVER)(
+        keys=[clave_carrito(session_id)],
+        args=_args_devolver(items, ttl),
+        client=get_redis_client_sesion(session_id),
+    )
+
+
+def ttl_carritos(session_ids):
+    """{session_id: TTL del carrito en segundos (<= 0 si no existe)}, un pipeline por nodo."""
+    por_nodo = {}
+    for session_id in session_ids:
+        por_nodo.setdefault(nodo_sesion(session_id), []).append(session_id)
+    ttls = {}
+    for nodo, ids in por_nodo.items():
+        pipe = get_redis_client_nodo(nodo).pipeline(transaction=False)
+        for session_id in ids:
+            for clave in _claves(clave_carrito, session_id):
+                pipe.ttl(clave)
+        respuestas = iter(pipe.execute())
+        for session_id in ids:
+            ttls[session_id] = max(next(respuestas) for _ in _claves(clave_carrito, session_id))
+    return ttls
@@ -0,0 +1,76 @@
+# carrito_repo_async.py
+from redis_config import get_async_redis_client, get_async_redis_client_sesion
+from carrito_repo import (
+    COMPACTO, TTL_CARRITO, TTL_SESION, clave_carrito, clave_sesion, escribir_sesion,
+    _claves, _decodificar_items, _decodificar_usuario, _datos_sesion, _args_tomar, _args_devolver,
+    _LUA_VER, _LUA_USUARIO, _LUA_TOMAR, _LUA_DEVOLVER,
+)
+
+# Versión de carrito_repo para app_async.py (redis.asyncio). Usa los mismos
+# scripts Lua y las mismas claves, así que ambas apps comparten los datos.
+
+_scripts = {}
+
+
+def _script(nombre, fuente):
+    if nombre not in _scripts:
+        _scripts[nombre] = get_async_redis_client().register_script(fuente)
+    return _scripts[nombre]
+
+
+# --- Sesiones ---
+
+async def guardar_sesion(session_id, user_id, email, ttl=TTL_SESION):
+    pipe = get_async_redis_client_sesion(session_id).pipeline()
+    escribir_sesion(pipe, session_id, user_id, email, ttl)
+    await pipe.execute()
+
+
+async def borrar_sesion(session_id):
+    await get_async_redis_client_sesion(session_id).delete(*_claves(clave_sesion, session_id))
+
+
+async def datos_sesion(session_id):
+    r = get_async_redis_client_sesion(session_id)
+    compacta = await r.get(clave_sesion(session_id)) if COMPACTO else None
+    anterior = {} if compacta is not None else await r.hgetall(clave_sesion(session_id, compacto=False))
+    return _datos_sesion(compacta, anterior)
+
+
+async def usuario_de_sesion(session_id, ttl=TTL_SESION):
+    user_id = await _script("usuario", _LUA_USUARIO)(
+        keys=_claves(clave_sesion, session_id),
+        args=[ttl, "1" if COMPACTO else "0"],
+        client=get_async_redis_client_sesion(session_id),
+    )
+    return _decodificar_usuario(user_id)
+
+
+# --- Carritos ---
+
+async def ver_carrito(session_id, ttl=TTL_CARRITO):
+    carritos = await _script("ver", _LUA_VER)(
+        keys=_claves(clave_carrito, session_id),
+        args=[ttl],
+        client=get_async_redis_client_sesion(session_id),
+    )
+    return _decodificar_items(*carritos)
+
+
+async def tomar_carrito(session_id, ttl_sesion=TTL_SESION):
+    keys, args = _args_tomar(session_id, ttl_sesion)
+    user_id, carritos = await _script("tomar", _LUA_TOMAR)(
+        keys=keys, args=args, client=get_async_redis_client_sesion(session_id))
+    if not user_id:
+        return None, {}
+    return _decodificar_usuario(user_id), _decodificar_items(*carritos)
+
+
+async def devolver_carrito(session_id, items, ttl=TTL_CARRITO):
+    if not items:
+        return
+    await _script("devolver", _LUA_DEVOLVER)(
+        keys=[clave_carrito(session_id)],
+        args=_args_devolver(items, ttl),
+        client=get_async_redis_client_sesion(session_id),
+    )
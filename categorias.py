@@ -0,0 +1,290 @@
+# categorias.py
+import logging
+import os
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import redis
+from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import PyMongoError
+
+from db_config import get_mongo_client
+from redis_config import get_redis_client
+
+# Categoría de cliente (TOP / MEDIUM / LOW) calculada a partir de la actividad.
+# Cada usuario guarda sus agregados en el propio documento:
+#   actividad: {pedidos, total_pagado, ultima_compra}
+# confirmar_pedido y facturar_pedido los actualizan con $inc / $max al guardar
+# (registrar_pedido / registrar_pago), y en el mismo paso se reasigna la
+# categoría, sin recorrer pedidos ni pagos. recalcular() y backfill() los
+# rearman desde las colecciones: por usuario o por rangos de _id en paralelo.
+#
+# La categoría de cada usuario también queda en el HASH categorias:usuarios,
+# así leerla en una ruta es un HGET (categoria()). Si falta se lee de MongoDB.
+#
+# Dos pagos simultáneos del mismo usuario pueden terminar en cualquier orden:
+# la categoría se guarda en MongoDB solo si la actividad sigue siendo la que
+# se usó para calcularla, y en Redis solo si su sello (pedidos + total_pagado,
+# que registrar_* solo hace crecer) es mayor que el guardado en categorias:sellos.
+#
+# Umbrales: CATEGORIA_<NIVEL>="total_pagado,pedidos" (hay que alcanzar los dos),
+# por ejemplo CATEGORIA_TOP="1000,5". Sin compras en CATEGORIA_INACTIVO_DIAS
+# días se baja un nivel (lo aplica el próximo recálculo o backfill).
+
+NIVELES = ("TOP", "MEDIUM", "LOW")
+UMBRALES_DEFECTO = {"TOP": (1000, 5), "MEDIUM": (200, 2)}
+INACTIVO_DIAS = int(os.environ.get("CATEGORIA_INACTIVO_DIAS", 180))
+CLAVE = "categorias:usuarios"
+CLAVE_SELLOS = "categorias:sellos"
+TAMANO_RANGO = 5000
+
+log = logging.getLogger(__name__)
+
+# KEYS = categorias, sellos; ARGV = usuario_id, categoria, sello
+# Escribe la categoría salvo que ya haya una calculada con más actividad
+_LUA_GUARDAR = """
+local actual = redis.call('HGET', KEYS[2], ARGV[1])
+if actual and tonumber(actual) >= tonumber(ARGV[3]) then
+  return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+return 1
+"""
+
+_script_guardar = None
+
+
+def _leer_umbral(nivel):
+    valor = os.environ.get(f"CATEGORIA_{nivel}")
+    if not valor:
+        return UMBRALES_DEFECTO[nivel]
+    total, pedidos = valor.split(",")
+    return float(total), int(pedidos)
+
+
+UMBRALES = {nivel: _leer_umbral(nivel) for nivel in UMBRALES_DEFECTO}
+
+
+def calcular(actividad, ahora=None):
+    """Categoría que corresponde a los agregados de un usuario."""
+    actividad = actividad or {}
+    total = actividad.get("total_pagado", 0)
+    pedidos = actividad.get("pedidos", 0)
+    categoria = "LOW"
+    for nivel in NIVELES[:-1]:
+        minimo_total, minimo_pedidos = UMBRALES[nivel]
+        if total >= minimo_total and pedidos >= minimo_pedidos:
+            categoria = nivel
+            break
+    ultima = actividad.get("ultima_compra")
+    ahora = ahora or datetime.utcnow()
+    if categoria != "LOW" and ultima and ahora - ultima > timedelta(days=INACTIVO_DIAS):
+        categoria = NIVELES[NIVELES.index(categoria) + 1]
+    return categoria
+
+
+def _sello(actividad):
+    return actividad.get("pedidos", 0) + actividad.get("total_pagado", 0)
+
+
+def _guardar_en_redis(categorias, sellos):
+    if not categorias:
+        return
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.hset(CLAVE, mapping={str(k): v for k, v in categorias.items()})
+        pipe.hset(CLAVE_SELLOS, mapping={str(k): v for k, v in sellos.items()})
+        pipe.execute()
+    except redis.RedisError:
+        log.warning("No se pudieron guardar en Redis las categorías de %d usuario(s)", len(categorias))
+
+
+def _guardar_si_es_nueva(usuario_id, valor, sello):
+    global _script_guardar
+    try:
+        if _script_guardar is None:
+            _script_guardar = get_redis_client().register_script(_LUA_GUARDAR)
+        _script_guardar(keys=[CLAVE, CLAVE_SELLOS], args=[str(usuario_id), valor, sello])
+    except redis.RedisError:
+        log.warning("No se pudo guardar en Redis la categoría de %s", usuario_id)
+
+
+def categoria(usuario_id):
+    """Categoría del usuario en O(1) desde Redis; None si el usuario no existe."""
+    try:
+        valor = get_redis_client().hget(CLAVE, str(usuario_id))
+        if valor is not None:
+            return valor.decode("utf-8")
+    except redis.RedisError:
+        pass
+    doc = get_mongo_client()["usuarios"].find_one({"_id": ObjectId(usuario_id)}, {"categoria": 1})
+    if not doc:
+        return None
+    valor = doc.get("categoria") or "LOW"
+    try:
+        # HSETNX: no pisa una categoría que registrar_* haya guardado mientras tanto
+        get_redis_client().hsetnx(CLAVE, str(usuario_id), valor)
+    except redis.RedisError:
+        pass
+    return valor
+
+
+def invalidar(*ids):
+    """Quita del HASH las categorías de usuarios modificados o borrados por el CRUD."""
+    if not ids:
+        return
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.hdel(CLAVE, *[str(i) for i in ids])
+        pipe.hdel(CLAVE_SELLOS, *[str(i) for i in ids])
+        pipe.execute()
+    except redis.RedisError:
+        log.warning("No se pudieron invalidar las categorías de %s", ids)
+
+
+async def invalidar_async(r, *ids):
+    if not ids:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.hdel(CLAVE, *[str(i) for i in ids])
+        pipe.hdel(CLAVE_SELLOS, *[str(i) for i in ids])
+        await pipe.execute()
+    except redis.RedisError:
+        log.warning("No se pudieron invalidar las categorías de %s", ids)
+
+
+def _actualizar(usuario_id, incrementos, fecha):
+    coll = get_mongo_client()["usuarios"]
+    doc = coll.find_one_and_update(
+        {"_id": ObjectId(usuario_id)},
+        {"$inc": {f"actividad.{k}": v for k, v in incrementos.items()},
+         "$max": {"actividad.ultima_compra": fecha or datetime.utcnow()}},
+        projection={"actividad": 1, "categoria": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        return None
+    actividad = doc["actividad"]
+    nueva = calcular(actividad)
+    if nueva != doc.get("categoria"):
+        # Si otro registro cambió la actividad mientras tanto, su categoría es la vigente
+        filtro = {"_id": doc["_id"]}
+        filtro.update({f"actividad.{k}": actividad.get(k) for k in ("pedidos", "total_pagado", "ultima_compra")})
+        if coll.update_one(filtro, {"$set": {"categoria": nueva}}).matched_count:
+            _guardar_si_es_nueva(doc["_id"], nueva, _sello(actividad))
+    return nueva
+
+
+def registrar_pedido(usuario_id, fecha=None):
+    """Suma un pedido confirmado a la actividad del usuario. Devuelve la categoría."""
+    try:
+        return _actualizar(usuario_id, {"pedidos": 1}, fecha)
+    except PyMongoError:
+        # La venta ya quedó guardada: el próximo recalcular/backfill corrige el desvío
+        log.warning("No se pudo actualizar la actividad del usuario %s", usuario_id)
+        return None
+
+
+def registrar_pago(usuario_id, monto, fecha=None):
+    """Suma un pago registrado a la actividad del usuario. Devuelve la categoría."""
+    try:
+        return _actualizar(usuario_id, {"total_pagado": monto}, fecha)
+    except PyMongoError:
+        log.warning("No se pudo actualizar la actividad del usuario %s", usuario_id)
+        return None
+
+
+# --- Recálculo desde pedidos y pagos ---
+
+def _agregados(db, filtro_usuario):
+    # Usan los índices usuario_estado y usuario_fecha_pago (prefijo usuario_id)
+    actividad = {}
+    for a in db["pedidos"].aggregate([
+        {"$match": {"usuario_id": filtro_usuario}},
+        {"$group": {"_id": "$usuario_id", "pedidos": {"$sum": 1},
+                    "ultima_compra": {"$max": {"$toDate": "$_id"}}}},
+    ]):
+        actividad[a["_id"]] = {"pedidos": a["pedidos"], "total_pagado": 0,
+                               "ultima_compra": a["ultima_compra"].replace(tzinfo=None)}
+    for a in db["pagos"].aggregate([
+        {"$match": {"usuario_id": filtro_usuario}},
+        {"$group": {"_id": "$usuario_id", "total_pagado": {"$sum": "$total_pagado"},
+                    "ultima_compra": {"$max": "$fecha_pago"}}},
+    ]):
+        datos = actividad.setdefault(a["_id"], {"pedidos": 0, "total_pagado": 0, "ultima_compra": None})
+        datos["total_pagado"] = a["total_pagado"]
+        if datos["ultima_compra"] is None or a["ultima_compra"] > datos["ultima_compra"]:
+            datos["ultima_compra"] = a["ultima_compra"]
+    return actividad
+
+
+def _guardar(db, usuarios, actividad):
+    ahora = datetime.utcnow()
+    vacia = {"pedidos": 0, "total_pagado": 0, "ultima_compra": None}
+    categorias = {}
+    sellos = {}
+    ops = []
+    for usuario_id in usuarios:
+        datos = actividad.get(usuario_id, vacia)
+        categorias[usuario_id] = calcular(datos, ahora)
+        sellos[usuario_id] = _sello(datos)
+        ops.append(UpdateOne({"_id": usuario_id},
+                             {"$set": {"actividad": datos, "categoria": categorias[usuario_id]}}))
+    if ops:
+        db["usuarios"].bulk_write(ops, ordered=False)
+    _guardar_en_redis(categorias, sellos)
+    return categorias
+
+
+def recalcular(*ids):
+    """Rearma actividad y categoría de los usuarios indicados. Devuelve {id: categoria}."""
+    oids = [ObjectId(i) for i in ids]
+    if not oids:
+        return {}
+    db = get_mongo_client()
+    existentes = [d["_id"] for d in db["usuarios"].find({"_id": {"$in": oids}}, {"_id": 1})]
+    return _guardar(db, existentes, _agregados(db, {"$in": existentes}))
+
+
+def rangos(tamano=TAMANO_RANGO):
+    """Parte los usuarios en rangos [desde, hasta) de `tamano` _id recorriendo solo el índice _id."""
+    inicios = []
+    cursor = get_mongo_client()["usuarios"].find({}, {"_id": 1}).sort("_id", 1).batch_size(tamano)
+    for i, doc in enumerate(cursor):
+        if i % tamano == 0:
+            inicios.append(doc["_id"])
+    return [(desde, inicios[i + 1] if i + 1 < len(inicios) else None) for i, desde in enumerate(inicios)]
+
+
+def recalcular_rango(rango):
+    """Recalcula los usuarios con _id en [desde, hasta). Devuelve {categoria: cantidad}."""
+    desde, hasta = rango
+    filtro = {"$gte": desde}
+    if hasta is not None:
+        filtro["$lt"] = hasta
+    db = get_mongo_client()
+    usuarios = [d["_id"] for d in db["usuarios"].find({"_id": filtro}, {"_id": 1})]
+    cuenta = {}
+    for valor in _guardar(db, usuarios, _agregados(db, filtro)).values():
+        cuenta[valor] = cuenta.get(valor, 0) + 1
+    return cuenta
+
+
+def backfill(procesos=4, tamano=TAMANO_RANGO, progreso=None):
+    """
+    Recalcula todos los usuarios por rangos de _id, cada rango en un proceso.
+    Las compras que se registran mientras corre su rango pueden perderse del
+    agregado; conviene correrlo con poco tráfico o repetirlo. Devuelve {categoria: cantidad}.
+    """
+    total = {}
+    lista = rangos(tamano)
+    with Pool(procesos) as pool:
+        for hechos, cuenta in enumerate(pool.imap_unordered(recalcular_rango, lista), 1):
+            for valor, n in cuenta.items():
+                total[valor] = total.get(valor, 0) + n
+            if progreso:
+                progreso(hechos, len(lista))
+    return total
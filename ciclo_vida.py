@@ -0,0 +1,67 @@
+# ciclo_vida.py
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from db_config import get_mongo_connection, close_mongo_client
+from metricas import instrumentar_clientes
+from redis_config import get_redis_pool, close_redis_pool
+
+# Arranque y apagado de cada worker del servidor (ver gunicorn.conf.py).
+# Los checkouts en curso se cuentan para que el apagado espere a que terminen
+# antes de cerrar las conexiones: un pedido a medio confirmar ya descontó
+# stock y tomó el carrito.
+
+log = logging.getLogger(__name__)
+
+_checkouts = 0
+_checkouts_cond = threading.Condition()
+
+
+@contextmanager
+def checkout_en_curso():
+    global _checkouts
+    with _checkouts_cond:
+        _checkouts += 1
+    try:
+        yield
+    finally:
+        with _checkouts_cond:
+            _checkouts -= 1
+            _checkouts_cond.notify_all()
+
+
+def esperar_checkouts(timeout):
+    """Bloquea hasta que no haya checkouts en curso o venza el timeout. Devuelve los pendientes."""
+    limite = time.monotonic() + timeout
+    with _checkouts_cond:
+        while _checkouts:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            _checkouts_cond.wait(restante)
+        return _checkouts
+
+
+def inicializar_worker():
+    # Después del fork: cada worker crea sus propios clientes (los del master,
+    # si existieran, se descartan por cambio de pid) y los conecta de antemano.
+    # Se instrumentan antes: create_app() corre después de este hook.
+    instrumentar_clientes()
+    get_mongo_connection()
+    get_redis_pool()
+
+
+def cerrar_worker(timeout=30):
+    pendientes = esperar_checkouts(timeout)
+    if pendientes:
+        log.warning("Cerrando con %d checkout(s) todavía en curso", pendientes)
+    try:
+        # Las ventas que quedaron en Redis se vuelcan a MongoDB antes de cerrar
+        import inventario
+        inventario.volcar()
+    except Exception:
+        log.exception("No se pudo volcar el inventario al cerrar")
+    close_mongo_client()
+    close_redis_pool()
@@ -0,0 +1,345 @@
+# cola_pedidos.py
+import logging
+import os
+import socket
+import threading
+import time
+
+import bson
+import redis
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import categorias
+import inventario
+import ventas
+from db_config import get_mongo_client
+from redis_config import get_redis_client, get_async_redis_client
+
+# Escrituras diferidas de pedidos y pagos (PEDIDOS_ASINCRONOS=1).
+# confirmar_pedido y facturar_pedido agregan un evento al stream y responden
+# 202 con el id de la operación, sin esperar a MongoDB:
+#   cola:pedidos              STREAM con {tipo: pedido|pago, id, doc (BSON)}
+#   cola:pedidos:muertos      STREAM con los eventos que fallaron MAX_INTENTOS veces
+#   operacion:{id}            HASH {tipo, estado, usuario_id, error} que consulta
+#                             GET /operaciones/<id>; estado: aceptado, procesado o error
+#   operacion:pago:{pedido}   evita encolar dos pagos del mismo pedido
+#
+# Un thread por proceso (iniciar_worker) lee el stream con el grupo de
+# consumidores "escritores" y escribe cada tanda con un bulk_write por
+# colección. Las escrituras son upserts con $setOnInsert sobre el _id generado
+# en el request, así que reprocesar un evento no duplica nada. Los eventos sin
+# confirmar (XACK) se reintentan tras REINTENTO_MS; al llegar a MAX_INTENTOS
+# pasan a cola:pedidos:muertos, desde donde se pueden reprocesar o descartar
+# (descartar un pedido devuelve su stock al inventario).
+
+ASINCRONO = os.environ.get("PEDIDOS_ASINCRONOS") == "1"
+
+STREAM = "cola:pedidos"
+STREAM_MUERTOS = "cola:pedidos:muertos"
+GRUPO = "escritores"
+TTL_OPERACION = 24 * 3600
+BATCH = int(os.environ.get("COLA_PEDIDOS_BATCH", 500))
+BLOQUEO_MS = 1000
+REINTENTO_MS = int(os.environ.get("COLA_PEDIDOS_REINTENTO_MS", 30000))
+MAX_INTENTOS = int(os.environ.get("COLA_PEDIDOS_MAX_INTENTOS", 5))
+
+log = logging.getLogger(__name__)
+
+# KEYS = stream, operación, guarda; ARGV = tipo, id, doc, usuario_id, ttl, usar guarda (0/1)
+# Devuelve el id del evento, o false si la guarda ya existía
+_LUA_ENCOLAR = """
+if ARGV[6] == '1' and not redis.call('SET', KEYS[3], ARGV[2], 'NX', 'EX', ARGV[5]) then
+  return false
+end
+local evento = redis.call('XADD', KEYS[1], '*', 'tipo', ARGV[1], 'id', ARGV[2], 'doc', ARGV[3])
+redis.call('HSET', KEYS[2], 'tipo', ARGV[1], 'estado', 'aceptado', 'usuario_id', ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+return evento
+"""
+
+_scripts = {}
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def _script(nombre, fuente, asincrono=False):
+    clave = (nombre, asincrono)
+    if clave not in _scripts:
+        cliente = get_async_redis_client() if asincrono else get_redis_client()
+        _scripts[clave] = cliente.register_script(fuente)
+    return _scripts[clave]
+
+
+def clave_operacion(operacion_id):
+    return f"operacion:{operacion_id}"
+
+
+def _clave_guarda_pago(pedido_id):
+    return f"operacion:pago:{pedido_id}"
+
+
+def _args_encolar(tipo, doc, usuario_id, guarda):
+    operacion_id = str(doc["_id"])
+    keys = [STREAM, clave_operacion(operacion_id), guarda or clave_operacion(operacion_id)]
+    args = [tipo, operacion_id, bson.encode(doc), str(usuario_id), TTL_OPERACION, "1" if guarda else "0"]
+    return keys, args
+
+
+def encolar_pedido(pedido):
+    """Encola el documento del pedido (con su _id). Devuelve el id del evento."""
+    keys, args = _args_encolar("pedido", pedido, pedido["usuario_id"], None)
+    return _script("encolar", _LUA_ENCOLAR)(keys=keys, args=args, client=get_redis_client())
+
+
+def encolar_pago(pago):
+    """Encola el pago; devuelve None si el pedido ya tiene un pago encolado."""
+    keys, args = _args_encolar("pago", pago, pago["usuario_id"], _clave_guarda_pago(pago["pedido_id"]))
+    return _script("encolar", _LUA_ENCOLAR)(keys=keys, args=args, client=get_redis_client())
+
+
+async def encolar_pedido_async(pedido):
+    keys, args = _args_encolar("pedido", pedido, pedido["usuario_id"], None)
+    return await _script("encolar", _LUA_ENCOLAR, asincrono=True)(
+        keys=keys, args=args, client=get_async_redis_client())
+
+
+async def encolar_pago_async(pago):
+    keys, args = _args_encolar("pago", pago, pago["usuario_id"], _clave_guarda_pago(pago["pedido_id"]))
+    return await _script("encolar", _LUA_ENCOLAR, asincrono=True)(
+        keys=keys, args=args, client=get_async_redis_client())
+
+
+def _decodificar_operacion(datos):
+    return {k.decode("utf-8"): v.decode("utf-8") for k, v in datos.items()}
+
+
+def operacion(operacion_id):
+    """Estado de una operación encolada ({tipo, estado, usuario_id, ...}) o None."""
+    datos = get_redis_client().hgetall(clave_operacion(operacion_id))
+    return _decodificar_operacion(datos) if datos else None
+
+
+async def operacion_async(operacion_id):
+    datos = await get_async_redis_client().hgetall(clave_operacion(operacion_id))
+    return _decodificar_operacion(datos) if datos else None
+
+
+# --- Escritor (consumidor del stream) ---
+
+def _decodificar(mensajes):
+    eventos = []
+    for evento_id, campos in mensajes:
+        eventos.append({
+            "evento": evento_id,
+            "tipo": campos[b"tipo"].decode("utf-8"),
+            "id": campos[b"id"].decode("utf-8"),
+            "doc": bson.decode(campos[b"doc"]),
+        })
+    return eventos
+
+
+def _escribir(coll, eventos, operaciones, fallidos):
+    # Un bulk_write sin orden; los errores por documento quedan en `fallidos`.
+    # Devuelve los eventos cuyo upsert insertó un documento nuevo
+    if not operaciones:
+        return set()
+    try:
+        insertados = coll.bulk_write(operaciones, ordered=False).upserted_ids.keys()
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            fallidos[eventos[error["index"]]["evento"]] = error.get("errmsg", "Error de escritura")
+        insertados = [u["index"] for u in e.details.get("upserted", [])]
+    return {eventos[i]["evento"] for i in insertados}
+
+
+def _alta(doc):
+    # Upsert que solo inserta: reprocesar el evento no modifica lo ya guardado
+    return UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": {k: v for k, v in doc.items() if k != "_id"}},
+                     upsert=True)
+
+
+def procesar(r, mensajes):
+    """Escribe en MongoDB una tanda de eventos y confirma los que se guardaron. Devuelve cuántos."""
+    eventos = _decodificar(mensajes)
+    db = get_mongo_client()
+    pedidos = [e for e in eventos if e["tipo"] == "pedido"]
+    pagos = [e for e in eventos if e["tipo"] == "pago"]
+    fallidos = {}
+
+    # Primero los pedidos: un pago puede llegar en la misma tanda que su pedido
+    pedidos_nuevos = _escribir(db["pedidos"], pedidos, [_alta(e["doc"]) for e in pedidos], fallidos)
+    pagos_nuevos = _escribir(db["pagos"], pagos, [_alta(e["doc"]) for e in pagos], fallidos)
+    pagados = [e for e in pagos if e["evento"] not in fallidos]
+    # Pedidos que ya estaban pagados antes de esta tanda: un pago repetido se
+    # guarda, pero no vuelve a sumar a los rollups
+    ya_pagados = set()
+    if pagados:
+        filtro = {"_id": {"$in": [e["doc"]["pedido_id"] for e in pagados]}, "estado": "pagado"}
+        ya_pagados = {p["_id"] for p in db["pedidos"].find(filtro, {"_id": 1})}
+    _escribir(db["pedidos"], pagados, [
+        UpdateOne({"_id": e["doc"]["pedido_id"]}, {"$set": {"estado": "pagado"}}) for e in pagados
+    ], fallidos)
+
+    completados = [e for e in eventos if e["evento"] not in fallidos]
+    # Un evento puede procesarse dos veces (reintentos): en vez de sumar, se
+    # recalcula la actividad de los clientes de la tanda
+    usuarios = {e["doc"]["usuario_id"] for e in completados}
+    try:
+        categorias.recalcular(*usuarios)
+    except PyMongoError:
+        log.warning("No se pudo recalcular la categoría de %d usuario(s)", len(usuarios))
+    # Los rollups suman: solo cuentan los documentos que esta tanda insertó, y
+    # un solo pago por pedido
+    contados = set(ya_pagados)
+    pagos_ventas = []
+    for e in pagos:
+        pedido_id = e["doc"]["pedido_id"]
+        if e["evento"] in pagos_nuevos and e["evento"] not in fallidos and pedido_id not in contados:
+            contados.add(pedido_id)
+            pagos_ventas.append(e["doc"])
+    try:
+        ventas.registrar_pedidos([e["doc"] for e in pedidos if e["evento"] in pedidos_nuevos])
+        ventas.registrar_pagos(pagos_ventas)
+    except PyMongoError:
+        log.warning("No se pudieron actualizar los rollups de ventas de la tanda")
+
+    pipe = r.pipeline(transaction=False)
+    for e in completados:
+        pipe.hset(clave_operacion(e["id"]), "estado", "procesado")
+    for e in eventos:
+        if e["evento"] in fallidos:
+            pipe.hset(clave_operacion(e["id"]), "error", fallidos[e["evento"]])
+    if completados:
+        ids = [e["evento"] for e in completados]
+        pipe.xack(STREAM, GRUPO, *ids)
+        pipe.xdel(STREAM, *ids)
+    pipe.execute()
+    return len(completados)
+
+
+def _mover_a_muertos(r, evento_id, intentos):
+    mensajes = r.xrange(STREAM, evento_id, evento_id)
+    pipe = r.pipeline()
+    if mensajes:
+        e = _decodificar(mensajes)[0]
+        error = r.hget(clave_operacion(e["id"]), "error") or b"Sin detalle"
+        pipe.xadd(STREAM_MUERTOS, dict(mensajes[0][1], error=error, intentos=intentos))
+        pipe.hset(clave_operacion(e["id"]), "estado", "error")
+        log.error("Evento %s (%s %s) movido a %s tras %d intentos",
+                  evento_id, e["tipo"], e["id"], STREAM_MUERTOS, intentos)
+    pipe.xack(STREAM, GRUPO, evento_id)
+    pipe.xdel(STREAM, evento_id)
+    pipe.execute()
+
+
+def reintentar(r, consumidor):
+    """Reclama los eventos sin confirmar hace más de REINTENTO_MS y los procesa."""
+    pendientes = r.xpending_range(STREAM, GRUPO, min="-", max="+", count=BATCH, idle=REINTENTO_MS)
+    a_reintentar = []
+    for p in pendientes:
+        if p["times_delivered"] >= MAX_INTENTOS:
+            _mover_a_muertos(r, p["message_id"], p["times_delivered"])
+        else:
+            a_reintentar.append(p["message_id"])
+    if not a_reintentar:
+        return 0
+    mensajes = r.xclaim(STREAM, GRUPO, consumidor, REINTENTO_MS, a_reintentar)
+    # Los eventos borrados mientras tanto vuelven como (id, None)
+    return procesar(r, [m for m in mensajes if m[1]])
+
+
+def crear_grupo(r):
+    try:
+        r.xgroup_create(STREAM, GRUPO, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def nombre_consumidor():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def trabajar_una_vez(r, consumidor, bloqueo_ms=BLOQUEO_MS):
+    """Una vuelta del escritor: reintentos y eventos nuevos. Devuelve cuántos escribió."""
+    escritos = reintentar(r, consumidor)
+    respuesta = r.xreadgroup(GRUPO, consumidor, {STREAM: ">"}, count=BATCH, block=bloqueo_ms)
+    for _, mensajes in respuesta or []:
+        escritos += procesar(r, mensajes)
+    return escritos
+
+
+def reprocesar_muertos(cantidad=BATCH):
+    """Vuelve a encolar los eventos descartados. Devuelve cuántos movió."""
+    r = get_redis_client()
+    mensajes = r.xrange(STREAM_MUERTOS, count=cantidad)
+    for evento_id, campos in mensajes:
+        campos = {k: v for k, v in campos.items() if k not in (b"error", b"intentos")}
+        pipe = r.pipeline()
+        pipe.xadd(STREAM, campos)
+        pipe.hset(clave_operacion(campos[b"id"].decode("utf-8")), "estado", "aceptado")
+        pipe.xdel(STREAM_MUERTOS, evento_id)
+        pipe.execute()
+    return len(mensajes)
+
+
+def descartar_muertos(cantidad=BATCH):
+    """
+    Elimina los eventos descartados: los pedidos devuelven su stock al
+    inventario y los pagos liberan la guarda para poder volver a pagar.
+    Devuelve cuántos eliminó.
+    """
+    r = get_redis_client()
+    mensajes = r.xrange(STREAM_MUERTOS, count=cantidad)
+    for e in _decodificar(mensajes):
+        if e["tipo"] == "pedido":
+            inventario.revertir({
+                ObjectId(item["product_id"]): item["cantidad"] for item in e["doc"].get("items", [])
+            })
+        else:
+            r.delete(_clave_guarda_pago(e["doc"]["pedido_id"]))
+        r.xdel(STREAM_MUERTOS, e["evento"])
+    return len(mensajes)
+
+
+def muertos(cantidad=100):
+    """Los eventos descartados más antiguos: [{evento, tipo, id, error, intentos}]."""
+    return [
+        {
+            "evento": evento_id.decode("utf-8"),
+            "tipo": campos[b"tipo"].decode("utf-8"),
+            "id": campos[b"id"].decode("utf-8"),
+            "error": campos.get(b"error", b"").decode("utf-8"),
+            "intentos": int(campos.get(b"intentos", 0)),
+        }
+        for evento_id, campos in get_redis_client().xrange(STREAM_MUERTOS, count=cantidad)
+    ]
+
+
+def _trabajar():
+    consumidor = nombre_consumidor()
+    while True:
+        try:
+            r = get_redis_client()
+            crear_grupo(r)
+            while True:
+                trabajar_una_vez(r, consumidor)
+        except Exception:
+            log.exception("Error en el escritor de pedidos, reintentando")
+            time.sleep(1)
+
+
+def iniciar_worker():
+    """Lanza el escritor de este proceso (uno por pid) si el modo asíncrono está activo."""
+    global _worker_pid
+    if not ASINCRONO or os.environ.get("COLA_PEDIDOS_WORKER", "1") != "1":
+        return
+    pid = os.getpid()
+    if _worker_pid == pid:
+        return
+    with _worker_lock:
+        if _worker_pid != pid:
+            threading.Thread(target=_trabajar, name="cola-pedidos", daemon=True).start()
+            _worker_pid = pid
@@ -0,0 +1,294 @@
+# crud/crud_async.py
+import asyncio
+from contextlib import asynccontextmanager
+from quart import Blueprint, Response, request, jsonify, current_app
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from db_config import get_motor_client
+from redis_config import get_async_redis_client
+from crud.paginacion import leer_parametros, cabeceras_siguiente, leer_object_id, ParametroInvalido, BATCH_STREAM
+from crud.crud_productos import CAMPOS_PRODUCTO, OCULTOS_PRODUCTO, _nuevo_producto
+from crud.crud_usuarios import CAMPOS_USUARIO, _nuevo_usuario, _validar_cambios_usuario
+from crud.crud_pedidos import CAMPOS_PEDIDO, CAMPOS_PUT_PEDIDO, _nuevo_pedido
+from crud import lotes
+import busqueda
+import cache_productos
+import categorias
+import inventario
+
+# Versiones asíncronas (Quart + motor) de los blueprints de productos, usuarios
+# y pedidos, para app_async.py. Exponen las mismas rutas y respuestas que los
+# blueprints síncronos; como los tres CRUD son iguales salvo por la colección,
+# los campos y los filtros, se generan con crear_blueprint_crud().
+
+
+@asynccontextmanager
+async def _sin_envoltura(campos):
+    yield
+
+
+def crear_blueprint_crud(nombre, coleccion, campos, nuevo_documento, ocultos=(),
+                         filtros=None, al_modificar=None, al_leer_varios=None, campos_put=None,
+                         envolver_cambios=_sin_envoltura, validar_cambios=None):
+    """
+    nombre/coleccion: nombre del blueprint y de la colección en MongoDB.
+    campos: campos permitidos en la proyección (y en PUT, salvo que se indique campos_put).
+    nuevo_documento(data): arma el documento a insertar en el POST.
+    ocultos: campos internos que no se devuelven en los listados.
+    filtros(args): arma el filtro del listado a partir del query string.
+    al_modificar(*ids): se llama tras cada alta, cambio o baja (individual o por lote).
+    al_leer_varios(db, oids): reemplaza la lectura por ids ({oid: doc}), por ejemplo con cache.
+    envolver_cambios(campos): context manager asíncrono alrededor de cada PUT
+    (individual o por lote) y su al_modificar, según los campos que escribe.
+    validar_cambios(campos): valida los campos de cada PUT, individual o por lote (ver lotes.preparar_cambios).
+    """
+    bp = Blueprint(f"{nombre}_async", __name__)
+    campos_put = campos_put or campos
+
+    @bp.route("/", methods=["GET", "POST"])
+    async def listado():
+        coll = get_motor_client()[coleccion]
+
+        if request.method == "GET":
+            try:
+                filtro = filtros(request.args) if filtros else {}
+                stream, limite, proyeccion, filtro = leer_parametros(request.args, filtro, campos, ocultos)
+            except ParametroInvalido as e:
+                return jsonify({"error": str(e)}), 400
+
+            cursor = coll.find(filtro, proyeccion).sort("_id", 1)
+            if stream:
+                if limite:
+                    cursor = cursor.limit(limite)
+                cursor = cursor.batch_size(BATCH_STREAM)
+                dumps = current_app.json.dumps_bytes
+
+                async def generar():
+                    yield b"["
+                    primero = True
+                    async for doc in cursor:
+                        if not primero:
+                            yield b","
+                        yield dumps(doc)
+                        primero = False
+                    yield b"]"
+
+                return Response(generar(), mimetype="application/json")
+
+            docs = await cursor.limit(limite + 1).to_list(None)
+            hay_mas = len(docs) > limite
+            docs = docs[:limite]
+            respuesta = jsonify(docs)
+            if hay_mas:
+                respuesta.headers.update(cabeceras_siguiente(
+                    request.base_url, request.args.to_dict(), str(docs[-1]["_id"]), limite))
+            return respuesta, 200
+
+        data = await request.get_json()
+        try:
+            resultado = await coll.insert_one(nuevo_documento(data or {}))
+        except lotes.ERRORES_DOCUMENTO as e:
+            return jsonify({"error": f"Documento inválido: {e}"}), 400
+        except DuplicateKeyError:
+            # Índices únicos, p. ej. usuarios.email_unico
+            return jsonify({"error": "Ya existe un documento con esos datos"}), 409
+        if al_modificar:
+            await al_modificar(resultado.inserted_id)
+        return jsonify({"_id": resultado.inserted_id}), 201
+
+    @bp.route("/<string:doc_id>", methods=["GET", "PUT", "DELETE"])
+    async def por_id(doc_id):
+        db = get_motor_client()
+        coll = db[coleccion]
+        etiqueta = nombre[:-1].capitalize()  # "productos" -> "Producto"
+
+        if request.method == "GET":
+            if al_leer_varios:
+                doc = (await al_leer_varios(db, [ObjectId(doc_id)])).get(ObjectId(doc_id))
+            else:
+                doc = await coll.find_one({"_id": ObjectId(doc_id)})
+            if not doc:
+                return jsonify({"error": f"{etiqueta} no encontrado"}), 404
+            return jsonify(doc), 200
+
+        if request.method == "PUT":
+            data = await request.get_json()
+            update_fields = {campo: data[campo] for campo in campos_put if campo in data}
+            if not update_fields:
+                return jsonify({"error": "No hay campos para actualizar"}), 400
+            if validar_cambios:
+                try:
+                    validar_cambios(update_fields)
+                except lotes.ERRORES_DOCUMENTO as e:
+                    return jsonify({"error": str(e)}), 400
+            async with envolver_cambios(update_fields):
+                try:
+                    resultado = await coll.update_one({"_id": ObjectId(doc_id)}, {"$set": update_fields})
+                except DuplicateKeyError:
+                    return jsonify({"error": "Ya existe un documento con esos datos"}), 409
+                if resultado.matched_count == 0:
+                    return jsonify({"error": f"{etiqueta} no encontrado"}), 404
+                if al_modificar:
+                    await al_modificar(doc_id)
+            return jsonify({"message": f"{etiqueta} actualizado"}), 200
+
+        resultado = await coll.delete_one({"_id": ObjectId(doc_id)})
+        if resultado.deleted_count == 0:
+            return jsonify({"error": f"{etiqueta} no encontrado"}), 404
+        if al_modificar:
+            await al_modificar(doc_id)
+        return jsonify({"message": f"{etiqueta} eliminado"}), 200
+
+    # --- Operaciones por lote (mismo contrato que crud/lotes.py) ---
+
+    async def _ejecutar(operacion):
+        try:
+            return getattr(await operacion, "bulk_api_result", {})
+        except BulkWriteError as e:
+            return e.details
+
+    async def _existentes(coll, oids):
+        return {doc["_id"] async for doc in coll.find({"_id": {"$in": oids}}, {"_id": 1})}
+
+    async def _buscar(db, ids):
+        resultados, pendientes = lotes.preparar_ids(ids, ordered=False)
+        oids = [oid for _, oid in pendientes]
+        if not oids:
+            encontrados = {}
+        elif al_leer_varios:
+            encontrados = await al_leer_varios(db, oids)
+        else:
+            proyeccion = {campo: 0 for campo in ocultos} or None
+            encontrados = {doc["_id"]: doc async for doc in db[coleccion].find({"_id": {"$in": oids}}, proyeccion)}
+        return jsonify(lotes.resumir(lotes.completar_lecturas(resultados, pendientes, encontrados))), 200
+
+    @bp.route("/lote", methods=["GET", "POST", "PUT", "DELETE"])
+    async def lote():
+        db = get_motor_client()
+        coll = db[coleccion]
+        try:
+            if request.method == "GET":
+                return await _buscar(db, lotes.ids_de_consulta(request.args))
+
+            data = await request.get_json(silent=True)
+            if request.method == "POST":
+                documentos, ordered = lotes.leer_lote(data, "documentos")
+                resultados, docs, indices = lotes.preparar_altas(documentos, nuevo_documento, ordered)
+                detalles = await _ejecutar(coll.insert_many(docs, ordered=ordered)) if docs else {}
+                resultados = lotes.completar_altas(resultados, docs, indices, detalles, ordered)
+                creados = [r["_id"] for r in resultados if r["estado"] == "creado"]
+                if al_modificar and creados:
+                    await al_modificar(*creados)
+                return jsonify(lotes.resumir(resultados)), 200
+
+            if request.method == "PUT":
+                documentos, ordered = lotes.leer_lote(data, "documentos")
+                upsert = data.get("upsert") is True
+                resultados, pendientes = lotes.preparar_cambios(
+                    documentos, campos_put, ordered, validar_cambios)
+                existentes = await _existentes(coll, [oid for _, oid, _ in pendientes]) if pendientes else set()
+                ops, ejecutados = lotes.operaciones_cambios(resultados, pendientes, existentes, upsert)
+                envoltura = envolver_cambios(lotes.campos_de_cambios(pendientes) if ops else set())
+                async with envoltura:
+                    detalles = await _ejecutar(coll.bulk_write(ops, ordered=ordered)) if ops else {}
+                    resultados = lotes.completar_cambios(resultados, ejecutados, existentes, detalles, ordered)
+                    if al_modificar and ejecutados:
+                        await al_modificar(*[oid for _, oid in ejecutados])
+                return jsonify(lotes.resumir(resultados)), 200
+
+            ids, ordered = lotes.leer_lote(data, "ids")
+            resultados, pendientes = lotes.preparar_ids(ids, ordered)
+            existentes = await _existentes(coll, [oid for _, oid in pendientes]) if pendientes else set()
+            if existentes:
+                await coll.delete_many({"_id": {"$in": list(existentes)}})
+                if al_modificar:
+                    await al_modificar(*existentes)
+            return jsonify(lotes.resumir(lotes.completar_bajas(resultados, pendientes, existentes))), 200
+        except lotes.LoteInvalido as e:
+            return jsonify({"error": str(e)}), 400
+
+    @bp.route("/lote/buscar", methods=["POST"])
+    async def buscar_lote():
+        try:
+            ids, _ = lotes.leer_lote(await request.get_json(silent=True), "ids")
+        except lotes.LoteInvalido as e:
+            return jsonify({"error": str(e)}), 400
+        return await _buscar(get_motor_client(), ids)
+
+    return bp
+
+
+# --- Productos ---
+
+async def _leer_productos(db, oids):
+    return await cache_productos.obtener_productos_async(oids, db, get_async_redis_client())
+
+
+async def _invalidar_productos(*ids):
+    await cache_productos.invalidar_async(get_async_redis_client(), *ids)
+    await inventario.recargar_async(*ids)
+    # El índice de autocompletado usa el cliente síncrono (ver busqueda.py)
+    await asyncio.to_thread(busqueda.reindexar, *ids)
+
+
+@asynccontextmanager
+async def _cambio_productos(campos):
+    # Como crud_productos._cambio_productos: un $set de stock espera a que se
+    # vuelquen las ventas pendientes y no deja volcar hasta recargar el contador
+    if "stock" not in campos:
+        yield
+        return
+    token = await asyncio.to_thread(inventario.retener_volcado)
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(inventario.soltar_volcado, token)
+
+
+productos_async_bp = crear_blueprint_crud(
+    "productos", "productos", CAMPOS_PRODUCTO, _nuevo_producto, OCULTOS_PRODUCTO,
+    al_modificar=_invalidar_productos,
+    al_leer_varios=_leer_productos,
+    envolver_cambios=_cambio_productos,
+)
+
+
+@productos_async_bp.route("/cache/stats", methods=["GET"])
+async def cache_stats():
+    return jsonify(cache_productos.estadisticas()), 200
+
+
+# --- Usuarios ---
+
+def _filtros_usuarios(args):
+    return {"categoria": args["categoria"]} if args.get("categoria") else {}
+
+
+async def _invalidar_usuarios(*ids):
+    await categorias.invalidar_async(get_async_redis_client(), *ids)
+
+
+usuarios_async_bp = crear_blueprint_crud(
+    "usuarios", "usuarios", CAMPOS_USUARIO, _nuevo_usuario,
+    filtros=_filtros_usuarios,
+    al_modificar=_invalidar_usuarios,
+    validar_cambios=_validar_cambios_usuario,
+)
+
+
+# --- Pedidos ---
+
+def _filtros_pedidos(args):
+    filtro = {}
+    if args.get("estado"):
+        filtro["estado"] = args["estado"]
+    if args.get("usuario_id"):
+        filtro["usuario_id"] = leer_object_id(args["usuario_id"], "usuario_id")
+    return filtro
+
+
+pedidos_async_bp = crear_blueprint_crud(
+    "pedidos", "pedidos", CAMPOS_PEDIDO, _nuevo_pedido,
+    filtros=_filtros_pedidos,
+    campos_put=CAMPOS_PUT_PEDIDO,
+)
@@ -1,61 +1,133 @@
+# crud/crud_facturacion.py
+from datetime import datetime
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
 from db_config import get_mongo_client
+from crud.paginacion import listar_paginado, leer_object_id, ParametroInvalido
+import categorias
+import ventas
 
 facturas_bp = Blueprint("facturas", __name__)
 
-db = get_mongo_client()
-facturas_coll = db["facturas"]
-pagos_coll = db["pagos"]
+CAMPOS_FACTURA = ["usuario_id", "pedido_id", "monto", "estado", "fecha"]
+CAMPOS_PUT_FACTURA = ["monto", "estado", "fecha"]
+PROYECCION_PAGO = {"factura_id": 1, "pedido_id": 1, "total_pagado": 1, "metodo_pago": 1, "fecha_pago": 1}
+
+# Las facturas de los pedidos pagados las crea el lote de facturacion.py
+# (python scripts/cli_facturacion.py); estas rutas listan, consultan y registran
+# pagos de facturas. ?incluir=pagos agrega los pagos de cada factura con una
+# sola consulta $in por página.
+
+
+def _fecha(valor):
+    if not valor:
+        return datetime.utcnow()
+    try:
+        fecha = datetime.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise ParametroInvalido("'fecha' debe ser una fecha ISO 8601")
+    if fecha.tzinfo:
+        fecha = (fecha - fecha.utcoffset()).replace(tzinfo=None)
+    return fecha
+
+
+def _monto(valor):
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)) or valor < 0:
+        raise ParametroInvalido("'monto' debe ser un número mayor o igual a 0")
+    return valor
+
+
+def _nueva_factura(data):
+    factura = {
+        "usuario_id": leer_object_id(data.get("usuario_id"), "usuario_id"),
+        "monto": _monto(data.get("monto", 0.0)),
+        "estado": data.get("estado", "pendiente"),
+        "fecha": _fecha(data.get("fecha")),
+    }
+    if data.get("pedido_id"):
+        factura["pedido_id"] = leer_object_id(data["pedido_id"], "pedido_id")
+    return factura
+
+
+def _con_pagos(facturas):
+    # Una consulta para todas las facturas de la página (índice factura_id)
+    pagos = {}
+    ids = [f["_id"] for f in facturas]
+    for pago in get_mongo_client()["pagos"].find({"factura_id": {"$in": ids}}, PROYECCION_PAGO):
+        pagos.setdefault(pago["factura_id"], []).append(pago)
+    for factura in facturas:
+        factura["pagos"] = pagos.get(factura["_id"], [])
+    return facturas
+
+
+def _incluir_pagos(args):
+    return "pagos" in args.get("incluir", "").split(",")
+
 
 @facturas_bp.route("/", methods=["GET", "POST"])
 def facturas():
-    # Lista todas las facturas almacenadas
+    db = get_mongo_client()
+    facturas_coll = db["facturas"]
+
+    # Lista las facturas paginando por _id (?estado=, ?usuario_id=, ?incluir=pagos)
     if request.method == "GET":
-        cursor = facturas_coll.find({})
-        resultados = []
-        for factura in cursor:
-            factura["_id"] = str(factura["_id"])
-            factura["usuario_id"] = str(factura["usuario_id"])
-            resultados.append(factura)
-        return jsonify(resultados), 200
+        filtro = {}
+        try:
+            if request.args.get("estado"):
+                filtro["estado"] = request.args["estado"]
+            if request.args.get("usuario_id"):
+                filtro["usuario_id"] = leer_object_id(request.args["usuario_id"], "usuario_id")
+            if _incluir_pagos(request.args) and request.args.get("stream") in ("1", "true"):
+                raise ParametroInvalido("'incluir=pagos' no se puede usar con 'stream'")
+        except ParametroInvalido as e:
+            return jsonify({"error": str(e)}), 400
+        completar = _con_pagos if _incluir_pagos(request.args) else None
+        return listar_paginado(facturas_coll, filtro, CAMPOS_FACTURA, completar=completar)
 
     # Crea una nueva factura con estado inicial pendiente
     elif request.method == "POST":
-        data = request.json
-        nueva_factura = {
-            "usuario_id": ObjectId(data["usuario_id"]),
-            "monto": data.get("monto", 0.0),
-            "estado": data.get("estado", "pendiente"),
-            "fecha": data.get("fecha", "")
-        }
+        try:
+            nueva_factura = _nueva_factura(request.json or {})
+        except ParametroInvalido as e:
+            return jsonify({"error": str(e)}), 400
         resultado = facturas_coll.insert_one(nueva_factura)
-        return jsonify({"_id": str(resultado.inserted_id)}), 201
+        return jsonify({"_id": resultado.inserted_id}), 201
 
 @facturas_bp.route("/<string:factura_id>", methods=["GET", "PUT", "DELETE"])
 def factura_por_id(factura_id):
-    # Obtiene una factura por ID
+    db = get_mongo_client()
+    facturas_coll = db["facturas"]
+    try:
+        oid = leer_object_id(factura_id, "factura_id")
+    except ParametroInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Obtiene una factura por ID (?incluir=pagos agrega sus pagos)
     if request.method == "GET":
-        factura = facturas_coll.find_one({"_id": ObjectId(factura_id)})
+        factura = facturas_coll.find_one({"_id": oid})
         if not factura:
             return jsonify({"error": "Factura no encontrada"}), 404
-        factura["_id"] = str(factura["_id"])
-        factura["usuario_id"] = str(factura["usuario_id"])
+        if _incluir_pagos(request.args):
+            _con_pagos([factura])
         return jsonify(factura), 200
 
     # Actualizar campos de una factura por ID
     elif request.method == "PUT":
-        data = request.json
-        update_fields = {}
-        for campo in ["monto", "estado", "fecha"]:
-            if campo in data:
-                update_fields[campo] = data[campo]
+        data = request.json or {}
+        try:
+            update_fields = {campo: data[campo] for campo in CAMPOS_PUT_FACTURA if campo in data}
+            if "monto" in update_fields:
+                update_fields["monto"] = _monto(update_fields["monto"])
+            if "fecha" in update_fields:
+                update_fields["fecha"] = _fecha(update_fields["fecha"])
+        except ParametroInvalido as e:
+            return jsonify({"error": str(e)}), 400
 
         if not update_fields:
             return jsonify({"error": "No hay campos para actualizar"}), 400
 
         resultado = facturas_coll.update_one(
-            {"_id": ObjectId(factura_id)},
+            {"_id": oid},
             {"$set": update_fields}
         )
         if resultado.matched_count == 0:
@@ -64,34 +136,78 @@ def factura_por_id(factura_id):
 
     # Eliminar una factura por ID
     elif request.method == "DELETE":
-        resultado = facturas_coll.delete_one({"_id": ObjectId(factura_id)})
+        resultado = facturas_coll.delete_one({"_id": oid})
         if resultado.deleted_count == 0:
             return jsonify({"error": "Factura no encontrada"}), 404
+        # Sus pagos y su pedido quedan sin factura: el próximo lote puede volver a facturarlo
+        db["pagos"].update_many({"factura_id": oid}, {"$unset": {"factura_id": ""}})
+        db["pedidos"].update_many({"factura_id": oid}, {"$unset": {"factura_id": ""}})
         return jsonify({"message": "Factura eliminada"}), 200
 
 # Registra pago asociado a factura y actualiza estado a pagado
 @facturas_bp.route("/<string:factura_id>/pago", methods=["POST"])
 def registrar_pago(factura_id):
-    data = request.json
+    db = get_mongo_client()
+    facturas_coll = db["facturas"]
+    pagos_coll = db["pagos"]
+    data = request.json or {}
+    try:
+        oid = leer_object_id(factura_id, "factura_id")
+        fecha_pago = _fecha(data.get("fecha"))
+        monto = _monto(data["monto"]) if "monto" in data else None
+    except ParametroInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    # La factura pasa a pagada de forma atómica: dos pagos simultáneos no
+    # pueden cobrarla dos veces
+    pago_id = ObjectId()
+    factura = facturas_coll.find_one_and_update(
+        {"_id": oid, "estado": {"$ne": "pagado"}},
+        {"$set": {"estado": "pagado", "pago_id": pago_id}},
+    )
+    if not factura:
+        if facturas_coll.count_documents({"_id": oid}, limit=1):
+            return jsonify({"error": "La factura ya fue pagada"}), 409
+        return jsonify({"error": "Factura no encontrada"}), 404
+
+    # Mismo formato que los pagos de facturar_pedido (historial_pagos los lista)
     pago = {
-        "factura_id": ObjectId(factura_id),
-        "monto": data.get("monto", 0.0),
-        "fecha": data.get("fecha", "")
+        "_id": pago_id,
+        "factura_id": oid,
+        "usuario_id": factura["usuario_id"],
+        "total_pagado": factura.get("monto", 0.0) if monto is None else monto,
+        "metodo_pago": data.get("metodo_pago", "Tarjeta de Crédito"),
+        "fecha_pago": fecha_pago,
     }
-    resultado = pagos_coll.insert_one(pago)
-    facturas_coll.update_one(
-        {"_id": ObjectId(factura_id)},
-        {"$set": {"estado": "pagado"}}
-    )
-    return jsonify({"_id": str(resultado.inserted_id), "message": "Pago registrado"}), 201
+    if factura.get("pedido_id"):
+        pago["pedido_id"] = factura["pedido_id"]
+    try:
+        pagos_coll.insert_one(pago)
+    except Exception:
+        facturas_coll.update_one({"_id": oid, "pago_id": pago_id},
+                                 {"$set": {"estado": factura.get("estado", "pendiente")},
+                                  "$unset": {"pago_id": ""}})
+        raise
+
+    categorias.registrar_pago(factura["usuario_id"], pago["total_pagado"], fecha_pago)
+    if factura.get("pedido_id"):
+        # El pedido de la factura también queda pagado (y cuenta en los rollups)
+        pedido = db["pedidos"].find_one_and_update(
+            {"_id": factura["pedido_id"], "estado": {"$ne": "pagado"}},
+            {"$set": {"estado": "pagado", "factura_id": oid}},
+            projection={"fecha": 1, "estado": 1},
+        )
+        if pedido:
+            ventas.registrar_pago(pedido, pago)
+    return jsonify({"_id": pago_id, "message": "Pago registrado"}), 201
 
 # Lista pagos asociados a una factura
 @facturas_bp.route("/<string:factura_id>/pagos", methods=["GET"])
 def listar_pagos(factura_id):
-    cursor = pagos_coll.find({"factura_id": ObjectId(factura_id)})
-    pagos = []
-    for pago in cursor:
-        pago["_id"] = str(pago["_id"])
-        pago["factura_id"] = str(pago["factura_id"])
-        pagos.append(pago)
+    try:
+        oid = leer_object_id(factura_id, "factura_id")
+    except ParametroInvalido as e:
+        return jsonify({"error": str(e)}), 400
+    pagos_coll = get_mongo_client()["pagos"]
+    pagos = list(pagos_coll.find({"factura_id": oid}, PROYECCION_PAGO))
     return jsonify(pagos), 200
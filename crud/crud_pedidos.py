@@ -1,45 +1,57 @@
 # crud/crud_pedidos.py
+from datetime import datetime
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
 from db_config import get_mongo_client
+from crud.paginacion import listar_paginado, leer_object_id, ParametroInvalido
+from crud.lotes import registrar_lotes
 
 pedidos_bp = Blueprint("pedidos", __name__)
 
+CAMPOS_PEDIDO = ["usuario_id", "items", "total", "estado", "fecha", "factura_id"]
+CAMPOS_PUT_PEDIDO = ["items", "total", "estado"]
+
+
+def _nuevo_pedido(data):
+    # data es algo como:
+    # {
+    #   "usuario_id": "63ff...",
+    #   "items": [
+    #     {"product_id": "...", "cantidad": 2, "precio_unitario": 10, "subtotal": 20},
+    #   ],
+    #   "total": 20,
+    #   "estado": "pendiente"
+    # }
+    return {
+        "usuario_id": ObjectId(data["usuario_id"]),
+        "items": data.get("items", []),
+        "total": data.get("total", 0.0),
+        "estado": data.get("estado", "pendiente"),
+        "fecha": datetime.utcnow()
+    }
+
+
 @pedidos_bp.route("/", methods=["GET", "POST"])
 def pedidos():
     db = get_mongo_client()
     pedidos_coll = db["pedidos"]
 
     if request.method == "GET":
-        # READ - obtener todos los pedidos
-        cursor = pedidos_coll.find({})
-        resultados = []
-        for p in cursor:
-            p["_id"] = str(p["_id"])
-            p["usuario_id"] = str(p["usuario_id"])
-            resultados.append(p)
-        return jsonify(resultados), 200
+        # READ - listar pedidos paginando por _id (filtros ?estado= y ?usuario_id=)
+        filtro = {}
+        if request.args.get("estado"):
+            filtro["estado"] = request.args["estado"]
+        if request.args.get("usuario_id"):
+            try:
+                filtro["usuario_id"] = leer_object_id(request.args["usuario_id"], "usuario_id")
+            except ParametroInvalido as e:
+                return jsonify({"error": str(e)}), 400
+        return listar_paginado(pedidos_coll, filtro, CAMPOS_PEDIDO)
 
     elif request.method == "POST":
         # CREATE - crear un pedido
-        data = request.json
-        # data es algo como:
-        # {
-        #   "usuario_id": "63ff...",
-        #   "items": [
-        #     {"product_id": "...", "cantidad": 2, "precio_unitario": 10, "subtotal": 20},
-        #   ],
-        #   "total": 20,
-        #   "estado": "pendiente"
-        # }
-        nuevo_pedido = {
-            "usuario_id": ObjectId(data["usuario_id"]),
-            "items": data.get("items", []),
-            "total": data.get("total", 0.0),
-            "estado": data.get("estado", "pendiente")
-        }
-        resultado = pedidos_coll.insert_one(nuevo_pedido)
-        return jsonify({"_id": str(resultado.inserted_id)}), 201
+        resultado = pedidos_coll.insert_one(_nuevo_pedido(request.json))
+        return jsonify({"_id": resultado.inserted_id}), 201
 
 @pedidos_bp.route("/<string:pedido_id>", methods=["GET", "PUT", "DELETE"])
 def pedido_por_id(pedido_id):
@@ -51,15 +63,13 @@ def pedido_por_id(pedido_id):
         pedido = pedidos_coll.find_one({"_id": ObjectId(pedido_id)})
         if not pedido:
             return jsonify({"error": "Pedido no encontrado"}), 404
-        pedido["_id"] = str(pedido["_id"])
-        pedido["usuario_id"] = str(pedido["usuario_id"])
         return jsonify(pedido), 200
 
     elif request.method == "PUT":
         # UPDATE - actualizar pedido
         data = request.json
         update_fields = {}
-        for campo in ["items", "total", "estado"]:
+        for campo in CAMPOS_PUT_PEDIDO:
             if campo in data:
                 update_fields[campo] = data[campo]
 
@@ -80,3 +90,7 @@ def pedido_por_id(pedido_id):
         if resultado.deleted_count == 0:
             return jsonify({"error": "Pedido no encontrado"}), 404
         return jsonify({"message": "Pedido eliminado"}), 200
+
+
+# Operaciones por lote: POST/PUT/DELETE/GET /pedidos/lote (ver crud/lotes.py)
+registrar_lotes(pedidos_bp, "pedidos", _nuevo_pedido, CAMPOS_PUT_PEDIDO)
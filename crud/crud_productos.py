@@ -1,35 +1,68 @@
 # crud/crud_productos.py
+from contextlib import nullcontext
+from urllib.parse import urlencode
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
 from db_config import get_mongo_client
+from crud.paginacion import listar_paginado, ParametroInvalido
+from crud.lotes import registrar_lotes
+import busqueda
+import cache_productos
+import inventario
+import versiones
 
 productos_bp = Blueprint("productos", __name__)
 
+CAMPOS_PRODUCTO = ["nombre", "descripcion", "precio", "stock"]
+# Marcas internas del descuento de stock (la de inventario.py hace idempotente
+# el volcado; "reservas" queda en documentos anteriores al inventario en Redis)
+OCULTOS_PRODUCTO = ["reservas", "inventario_lote"]
+
+# GET /productos/buscar pagina por offset (el orden es por relevancia, no por _id)
+LIMITE_BUSQUEDA = 20
+LIMITE_BUSQUEDA_MAXIMO = 100
+OFFSET_MAXIMO = 10000
+LIMITE_AUTOCOMPLETAR_MAXIMO = 50
+
+
+def _cambio_productos(campos):
+    # Un $set de stock no puede quedar debajo de ventas sin volcar: el volcado
+    # las descontaría otra vez del valor nuevo (ver inventario.sin_pendientes)
+    return inventario.sin_pendientes() if "stock" in campos else nullcontext()
+
+
+def _nuevo_producto(data):
+    return {
+        "nombre": data.get("nombre", ""),
+        "descripcion": data.get("descripcion", ""),
+        "precio": data.get("precio", 0.0),
+        "stock": data.get("stock", 0)
+    }
+
+
 @productos_bp.route("/", methods=["GET", "POST"])
 def productos():
     db = get_mongo_client()
     productos_coll = db["productos"]
 
     if request.method == "GET":
-        # READ - obtener todos los productos
-        cursor = productos_coll.find({})
-        resultados = []
-        for prod in cursor:
-            prod["_id"] = str(prod["_id"])
-            resultados.append(prod)
-        return jsonify(resultados), 200
+        # READ - listar productos paginando por _id. Con el ETag vigente se
+        # responde 304 sin consultar MongoDB (ver versiones.py)
+        etag, modificado, no_modificado = versiones.comprobar(
+            [versiones.clave_coleccion("productos")], versiones.variante_consulta())
+        if no_modificado:
+            return no_modificado
+        respuesta = listar_paginado(productos_coll, {}, CAMPOS_PRODUCTO, OCULTOS_PRODUCTO)
+        return versiones.agregar_cabeceras(respuesta, etag, modificado)
 
     elif request.method == "POST":
         # CREATE - crear un nuevo producto
-        data = request.json
-        nuevo_producto = {
-            "nombre": data.get("nombre", ""),
-            "descripcion": data.get("descripcion", ""),
-            "precio": data.get("precio", 0.0),
-            "stock": data.get("stock", 0)
-        }
-        resultado = productos_coll.insert_one(nuevo_producto)
-        return jsonify({"_id": str(resultado.inserted_id)}), 201
+        nuevo = _nuevo_producto(request.json)
+        resultado = productos_coll.insert_one(nuevo)
+        # Cambia la versión del catálogo (ETag de los listados)
+        cache_productos.invalidar(resultado.inserted_id)
+        busqueda.indexar(resultado.inserted_id, nuevo["nombre"])
+        return jsonify({"_id": resultado.inserted_id}), 201
 
 @productos_bp.route("/<string:producto_id>", methods=["GET", "PUT", "DELETE"])
 def producto_por_id(producto_id):
@@ -37,12 +70,15 @@ def producto_por_id(producto_id):
     productos_coll = db["productos"]
 
     if request.method == "GET":
-        # READ - un producto por ID
-        producto = productos_coll.find_one({"_id": ObjectId(producto_id)})
+        # READ - un producto por ID: 304 si no cambió; si no, LRU local -> Redis -> MongoDB
+        etag, modificado, no_modificado = versiones.comprobar(
+            [versiones.clave_documento("productos", producto_id)])
+        if no_modificado:
+            return no_modificado
+        producto = cache_productos.obtener_producto(producto_id)
         if not producto:
             return jsonify({"error": "Producto no encontrado"}), 404
-        producto["_id"] = str(producto["_id"])
-        return jsonify(producto), 200
+        return versiones.agregar_cabeceras((jsonify(producto), 200), etag, modificado)
 
     elif request.method == "PUT":
         # UPDATE - actualizar producto
@@ -55,12 +91,19 @@ def producto_por_id(producto_id):
         if not update_fields:
             return jsonify({"error": "No hay campos para actualizar"}), 400
 
-        resultado = productos_coll.update_one(
-            {"_id": ObjectId(producto_id)},
-            {"$set": update_fields}
-        )
-        if resultado.matched_count == 0:
-            return jsonify({"error": "Producto no encontrado"}), 404
+        with _cambio_productos(update_fields):
+            resultado = productos_coll.update_one(
+                {"_id": ObjectId(producto_id)},
+                {"$set": update_fields}
+            )
+            if resultado.matched_count == 0:
+                return jsonify({"error": "Producto no encontrado"}), 404
+            if "stock" in update_fields:
+                # El contador de Redis se vuelve a cargar desde el stock nuevo
+                inventario.recargar(producto_id)
+        cache_productos.invalidar(producto_id)
+        if "nombre" in update_fields:
+            busqueda.indexar(producto_id, update_fields["nombre"])
         return jsonify({"message": "Producto actualizado"}), 200
 
     elif request.method == "DELETE":
@@ -68,4 +111,112 @@ def producto_por_id(producto_id):
         resultado = productos_coll.delete_one({"_id": ObjectId(producto_id)})
         if resultado.deleted_count == 0:
             return jsonify({"error": "Producto no encontrado"}), 404
+        cache_productos.invalidar(producto_id)
+        inventario.recargar(producto_id)
+        busqueda.desindexar(producto_id)
         return jsonify({"message": "Producto eliminado"}), 200
+
+
+def _entero(args, nombre, defecto, minimo, maximo):
+    valor = args.get(nombre)
+    if valor is None:
+        return defecto
+    try:
+        valor = int(valor)
+    except ValueError:
+        raise ParametroInvalido(f"'{nombre}' debe ser un entero")
+    if valor < minimo:
+        raise ParametroInvalido(f"'{nombre}' debe ser mayor o igual a {minimo}")
+    return min(valor, maximo)
+
+
+def filtros_busqueda(args):
+    """Filtro de precio y stock: ?precio_min=&precio_max=&en_stock=1"""
+    filtro = {}
+    precio = {}
+    for nombre, operador in (("precio_min", "$gte"), ("precio_max", "$lte")):
+        if args.get(nombre):
+            try:
+                precio[operador] = float(args[nombre])
+            except ValueError:
+                raise ParametroInvalido(f"'{nombre}' debe ser un número")
+    if precio:
+        filtro["precio"] = precio
+    if args.get("en_stock") in ("1", "true"):
+        filtro["stock"] = {"$gt": 0}
+    return filtro
+
+
+@productos_bp.route("/buscar", methods=["GET"])
+def buscar():
+    # ?q=texto ordena por relevancia con el índice de texto (nombre pesa más
+    # que descripción) y pagina con ?offset=; sin q es el listado paginado por
+    # _id con los filtros de precio y stock
+    try:
+        filtro = filtros_busqueda(request.args)
+        q = request.args.get("q", "").strip()
+        if q:
+            limite = _entero(request.args, "limit", LIMITE_BUSQUEDA, 1, LIMITE_BUSQUEDA_MAXIMO)
+            offset = _entero(request.args, "offset", 0, 0, OFFSET_MAXIMO)
+    except ParametroInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    etag, modificado, no_modificado = versiones.comprobar(
+        [versiones.clave_coleccion("productos")], versiones.variante_consulta())
+    if no_modificado:
+        return no_modificado
+
+    productos_coll = get_mongo_client()["productos"]
+    if not q:
+        respuesta = listar_paginado(productos_coll, filtro, CAMPOS_PRODUCTO, OCULTOS_PRODUCTO)
+        return versiones.agregar_cabeceras(respuesta, etag, modificado)
+
+    filtro["$text"] = {"$search": q}
+    proyeccion = {"score": {"$meta": "textScore"}}
+    proyeccion.update({campo: 0 for campo in OCULTOS_PRODUCTO})
+    cursor = (productos_coll.find(filtro, proyeccion)
+              .sort([("score", {"$meta": "textScore"}), ("_id", 1)])
+              .skip(offset).limit(limite + 1))
+    docs = list(cursor)
+    hay_mas = len(docs) > limite and offset + limite <= OFFSET_MAXIMO
+    docs = docs[:limite]
+
+    respuesta = jsonify(docs)
+    if hay_mas:
+        args = request.args.to_dict()
+        args.update({"offset": str(offset + limite), "limit": str(limite)})
+        respuesta.headers["X-Next-Offset"] = args["offset"]
+        respuesta.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return versiones.agregar_cabeceras((respuesta, 200), etag, modificado)
+
+
+@productos_bp.route("/autocompletar", methods=["GET"])
+def autocompletar():
+    # ?q=prefijo: productos con alguna palabra del nombre que empieza con el
+    # prefijo, desde el índice de Redis (ver busqueda.py)
+    try:
+        limite = _entero(request.args, "limit", 10, 1, LIMITE_AUTOCOMPLETAR_MAXIMO)
+    except ParametroInvalido as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(busqueda.autocompletar(request.args.get("q", ""), limite)), 200
+
+
+@productos_bp.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    # Contadores de hits/misses del cache de productos de este proceso
+    return jsonify(cache_productos.estadisticas()), 200
+
+
+def _al_modificar_lote(*ids):
+    cache_productos.invalidar(*ids)
+    inventario.recargar(*ids)
+    busqueda.reindexar(*ids)
+
+
+# Operaciones por lote: POST/PUT/DELETE/GET /productos/lote (ver crud/lotes.py)
+registrar_lotes(
+    productos_bp, "productos", _nuevo_producto, CAMPOS_PRODUCTO, OCULTOS_PRODUCTO,
+    al_modificar=_al_modificar_lote,
+    leer_varios=cache_productos.obtener_productos,
+    envolver_cambios=_cambio_productos,
+)
@@ -1,34 +1,60 @@
 # crud/crud_usuarios.py
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from db_config import get_mongo_client
+from crud.paginacion import listar_paginado
+from crud.lotes import registrar_lotes
+import categorias
 
 usuarios_bp = Blueprint("usuarios", __name__)
 
+CAMPOS_USUARIO = ["nombre", "email", "categoria"]
+EMAIL_DUPLICADO = "Ya existe un usuario con ese email"
+
+
+def _email(valor):
+    # El índice email_unico (indices.py) no admite repetidos, tampoco ""
+    if not isinstance(valor, str) or not valor.strip():
+        raise ValueError("'email' es obligatorio")
+    return valor
+
+
+def _validar_cambios_usuario(campos):
+    # Lo que se acepta en un PUT (individual o por lote)
+    if "email" in campos:
+        _email(campos["email"])
+
+
+def _nuevo_usuario(data):
+    return {
+        "nombre": data.get("nombre", ""),
+        "email": _email(data.get("email")),
+        "categoria": data.get("categoria", "LOW")
+    }
+
+
 @usuarios_bp.route("/", methods=["GET", "POST"])
 def usuarios():
     db = get_mongo_client()
     usuarios_coll = db["usuarios"]
 
     if request.method == "GET":
-        # READ - obtener todos los usuarios
-        cursor = usuarios_coll.find({})
-        resultados = []
-        for usr in cursor:
-            usr["_id"] = str(usr["_id"])
-            resultados.append(usr)
-        return jsonify(resultados), 200
+        # READ - listar usuarios paginando por _id (filtro opcional ?categoria=)
+        filtro = {}
+        if request.args.get("categoria"):
+            filtro["categoria"] = request.args["categoria"]
+        return listar_paginado(usuarios_coll, filtro, CAMPOS_USUARIO)
 
     elif request.method == "POST":
         # CREATE - crear un nuevo usuario
-        data = request.json
-        nuevo_usuario = {
-            "nombre": data.get("nombre", ""),
-            "email": data.get("email", ""),
-            "categoria": data.get("categoria", "LOW")
-        }
-        resultado = usuarios_coll.insert_one(nuevo_usuario)
-        return jsonify({"_id": str(resultado.inserted_id)}), 201
+        try:
+            resultado = usuarios_coll.insert_one(_nuevo_usuario(request.json or {}))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except DuplicateKeyError:
+            return jsonify({"error": EMAIL_DUPLICADO}), 409
+        return jsonify({"_id": resultado.inserted_id}), 201
 
 @usuarios_bp.route("/<string:usuario_id>", methods=["GET", "PUT", "DELETE"])
 def usuario_por_id(usuario_id):
@@ -40,7 +66,6 @@ def usuario_por_id(usuario_id):
         usuario = usuarios_coll.find_one({"_id": ObjectId(usuario_id)})
         if not usuario:
             return jsonify({"error": "Usuario no encontrado"}), 404
-        usuario["_id"] = str(usuario["_id"])
         return jsonify(usuario), 200
 
     elif request.method == "PUT":
@@ -53,13 +78,22 @@ def usuario_por_id(usuario_id):
 
         if not update_fields:
             return jsonify({"error": "No hay campos para actualizar"}), 400
+        try:
+            _validar_cambios_usuario(update_fields)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        resultado = usuarios_coll.update_one(
-            {"_id": ObjectId(usuario_id)},
-            {"$set": update_fields}
-        )
+        try:
+            resultado = usuarios_coll.update_one(
+                {"_id": ObjectId(usuario_id)},
+                {"$set": update_fields}
+            )
+        except DuplicateKeyError:
+            return jsonify({"error": EMAIL_DUPLICADO}), 409
         if resultado.matched_count == 0:
             return jsonify({"error": "Usuario no encontrado"}), 404
+        # La categoría en Redis se vuelve a leer de MongoDB (ver categorias.py)
+        categorias.invalidar(usuario_id)
         return jsonify({"message": "Usuario actualizado"}), 200
 
     elif request.method == "DELETE":
@@ -67,4 +101,10 @@ def usuario_por_id(usuario_id):
         resultado = usuarios_coll.delete_one({"_id": ObjectId(usuario_id)})
         if resultado.deleted_count == 0:
             return jsonify({"error": "Usuario no encontrado"}), 404
+        categorias.invalidar(usuario_id)
         return jsonify({"message": "Usuario eliminado"}), 200
+
+
+# Operaciones por lote: POST/PUT/DELETE/GET /usuarios/lote (ver crud/lotes.py)
+registrar_lotes(usuarios_bp, "usuarios", _nuevo_usuario, CAMPOS_USUARIO,
+                al_modificar=categorias.invalidar, validar_cambios=_validar_cambios_usuario)
@@ -0,0 +1,99 @@
+# crud/crud_ventas.py
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify
+from crud.paginacion import leer_object_id, ParametroInvalido
+from crud.crud_productos import _entero
+import ventas
+
+ventas_bp = Blueprint("ventas", __name__)
+
+# Reportes de ventas leídos de los rollups (ver ventas.py), nunca de pedidos:
+#   ?granularidad=dia|hora   (default dia)
+#   ?desde=2025-03-01&hasta=2025-04-01   ISO 8601 en UTC, hasta exclusivo
+# Sin desde/hasta: los últimos RANGO_DEFECTO hasta ahora.
+GRANULARIDADES = {"dia": "d", "hora": "h"}
+RANGO_DEFECTO = {"d": timedelta(days=30), "h": timedelta(hours=48)}
+# Rango máximo por consulta (una respuesta no pasa de unos miles de buckets)
+RANGO_MAXIMO = {"d": timedelta(days=3660), "h": timedelta(days=92)}
+LIMITE_PRODUCTOS = 20
+LIMITE_PRODUCTOS_MAXIMO = 500
+
+
+def _fecha(args, nombre):
+    try:
+        fecha = datetime.fromisoformat(args[nombre])
+    except ValueError:
+        raise ParametroInvalido(f"'{nombre}' debe ser una fecha ISO 8601")
+    if fecha.tzinfo:
+        fecha = (fecha - fecha.utcoffset()).replace(tzinfo=None)
+    return fecha
+
+
+def _leer_rango(args):
+    g = GRANULARIDADES.get(args.get("granularidad", "dia"))
+    if g is None:
+        raise ParametroInvalido("'granularidad' debe ser 'dia' u 'hora'")
+    hasta = _fecha(args, "hasta") if args.get("hasta") else datetime.utcnow()
+    desde = _fecha(args, "desde") if args.get("desde") else hasta - RANGO_DEFECTO[g]
+    if desde >= hasta:
+        raise ParametroInvalido("'desde' debe ser anterior a 'hasta'")
+    if hasta - desde > RANGO_MAXIMO[g]:
+        raise ParametroInvalido(f"El rango máximo para '{args.get('granularidad', 'dia')}' "
+                                f"es de {RANGO_MAXIMO[g].days} días")
+    # Buckets completos: el que contiene a `desde` también entra
+    return g, ventas.inicio_bucket(desde, g), hasta
+
+
+def _mapa(valores):
+    return {clave: {"cantidad": v.get("n", 0), "ingresos": v.get("r", 0)} for clave, v in valores.items()}
+
+
+def _legible(bucket):
+    resultado = {"pedidos": bucket.get("n", 0), "unidades": bucket.get("u", 0), "ingresos": bucket.get("r", 0)}
+    if "t" in bucket:
+        resultado = dict(fecha=bucket["t"], **resultado)
+    if "e" in bucket:
+        resultado["estados"] = _mapa(bucket["e"])
+    if "m" in bucket:
+        resultado["metodos_pago"] = _mapa(bucket["m"])
+    return resultado
+
+
+@ventas_bp.route("/", methods=["GET"])
+def resumen():
+    # Serie por día u hora con pedidos, unidades, ingresos, estados y métodos
+    # de pago, y el total del rango. Con ?product_id= la serie de ese producto.
+    try:
+        g, desde, hasta = _leer_rango(request.args)
+        producto_id = request.args.get("product_id")
+        if producto_id:
+            leer_object_id(producto_id, "product_id")
+    except ParametroInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    if producto_id:
+        buckets = ventas.serie_producto(g, producto_id, desde, hasta)
+    else:
+        buckets = ventas.serie(g, desde, hasta)
+    respuesta = {
+        "desde": desde,
+        "hasta": hasta,
+        "serie": [_legible(b) for b in buckets],
+        "total": _legible(ventas.sumar(buckets)),
+    }
+    if producto_id:
+        respuesta["product_id"] = producto_id
+    return jsonify(respuesta), 200
+
+
+@ventas_bp.route("/productos", methods=["GET"])
+def productos_mas_vendidos():
+    # Ranking de productos por ingresos en el rango (?limit=, default 20)
+    try:
+        g, desde, hasta = _leer_rango(request.args)
+        limite = _entero(request.args, "limit", LIMITE_PRODUCTOS, 1, LIMITE_PRODUCTOS_MAXIMO)
+    except ParametroInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    ranking = [dict(product_id=p["_id"], **_legible(p)) for p in ventas.productos(g, desde, hasta, limite)]
+    return jsonify({"desde": desde, "hasta": hasta, "productos": ranking}), 200
@@ -0,0 +1,300 @@
+# crud/lotes.py
+from collections import Counter
+from contextlib import nullcontext
+from flask import request, jsonify
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from db_config import get_mongo_client
+
+# Operaciones por lote para los blueprints CRUD (muchas altas/cambios/bajas en
+# un solo request y un solo viaje a MongoDB):
+#   POST   /<recurso>/lote          {"documentos": [...], "ordered": true}
+#   PUT    /<recurso>/lote          {"documentos": [{"_id": "...", ...}], "upsert": false, "ordered": true}
+#   DELETE /<recurso>/lote          {"ids": [...]}
+#   GET    /<recurso>/lote?ids=a,b  o  POST /<recurso>/lote/buscar {"ids": [...]}
+# La respuesta trae un resultado por elemento, en el orden del pedido:
+#   {"indice": 0, "_id": "...", "estado": "creado"}
+# Estados: creado, actualizado, eliminado, encontrado, no_encontrado, error
+# (con el mensaje en "error") y no_ejecutado. Con "ordered": true (default) el
+# lote se detiene en el primer error, como insert_many/bulk_write ordenados;
+# con false se procesan todos los elementos válidos.
+#
+# Las funciones preparar_*/completar_* no dependen del driver: las usan tanto
+# los blueprints síncronos (registrar_lotes) como los asíncronos (crud_async).
+
+LOTE_MAXIMO = 1000
+
+# Errores esperables al armar un documento a partir del JSON recibido
+ERRORES_DOCUMENTO = (KeyError, TypeError, ValueError, AttributeError, InvalidId)
+
+
+class LoteInvalido(ValueError):
+    pass
+
+
+def leer_lote(data, clave):
+    """Valida el cuerpo de un lote. Devuelve (elementos, ordered)."""
+    if not isinstance(data, dict) or not isinstance(data.get(clave), list):
+        raise LoteInvalido(f"Se esperaba un objeto con la lista '{clave}'")
+    elementos = data[clave]
+    if len(elementos) > LOTE_MAXIMO:
+        raise LoteInvalido(f"Como máximo {LOTE_MAXIMO} elementos por lote")
+    ordered = data.get("ordered", True)
+    if not isinstance(ordered, bool):
+        raise LoteInvalido("'ordered' debe ser true o false")
+    return elementos, ordered
+
+
+def _oid(valor):
+    # ObjectId(None) generaría un id nuevo: solo se aceptan strings
+    if not isinstance(valor, str):
+        raise InvalidId(f"{valor!r} no es un ObjectId válido")
+    return ObjectId(valor)
+
+
+def _resultado(indice, estado, _id=None, **extra):
+    resultado = {"indice": indice, "estado": estado}
+    if _id is not None:
+        resultado["_id"] = _id
+    resultado.update(extra)
+    return resultado
+
+
+def _error(indice, mensaje):
+    return _resultado(indice, "error", error=mensaje)
+
+
+def _completar(resultados):
+    # Lo que quedó sin resultado no llegó a ejecutarse (modo ordenado)
+    return [r or _resultado(i, "no_ejecutado") for i, r in enumerate(resultados)]
+
+
+def _errores_escritura(detalles):
+    # {posición en la operación: mensaje} a partir de bulk_api_result / BulkWriteError.details
+    return {e["index"]: e.get("errmsg", "Error de escritura") for e in detalles.get("writeErrors", [])}
+
+
+def resumir(resultados):
+    """Cuerpo de la respuesta: los resultados y la cantidad por estado."""
+    return {"resultados": resultados, "resumen": dict(Counter(r["estado"] for r in resultados))}
+
+
+def preparar_ids(ids, ordered):
+    """Convierte los ids a ObjectId. Devuelve (resultados, pendientes=[(indice, oid)])."""
+    resultados = [None] * len(ids)
+    pendientes = []
+    for i, valor in enumerate(ids):
+        try:
+            pendientes.append((i, _oid(valor)))
+        except InvalidId:
+            resultados[i] = _error(i, f"'{valor}' no es un ObjectId válido")
+            if ordered:
+                break
+    return resultados, pendientes
+
+
+# --- Altas ---
+
+def preparar_altas(documentos, nuevo_documento, ordered):
+    """Arma los documentos a insertar. Devuelve (resultados, docs, indices)."""
+    resultados = [None] * len(documentos)
+    docs, indices = [], []
+    for i, data in enumerate(documentos):
+        try:
+            doc = nuevo_documento(data)
+        except ERRORES_DOCUMENTO as e:
+            resultados[i] = _error(i, f"Documento inválido: {e!r}")
+            if ordered:
+                break
+            continue
+        docs.append(doc)
+        indices.append(i)
+    return resultados, docs, indices
+
+
+def completar_altas(resultados, docs, indices, detalles, ordered):
+    # insert_many completa el _id de cada documento
+    fallidos = _errores_escritura(detalles)
+    corte = min(fallidos) if ordered and fallidos else None
+    for pos, (i, doc) in enumerate(zip(indices, docs)):
+        if pos in fallidos:
+            resultados[i] = _error(i, fallidos[pos])
+        elif corte is None or pos < corte:
+            resultados[i] = _resultado(i, "creado", doc["_id"])
+    return _completar(resultados)
+
+
+# --- Cambios (update / upsert) ---
+
+def preparar_cambios(documentos, campos_put, ordered, validar_cambios=None):
+    """
+    Devuelve (resultados, pendientes=[(indice, oid, campos)]).
+    validar_cambios(campos): valida los campos a escribir (los mismos errores que
+    nuevo_documento); lo que lanza queda como error de ese elemento.
+    """
+    resultados = [None] * len(documentos)
+    pendientes = []
+    for i, data in enumerate(documentos):
+        try:
+            oid = _oid(data["_id"])
+            campos = {campo: data[campo] for campo in campos_put if campo in data}
+            if not campos:
+                raise ValueError("No hay campos para actualizar")
+            if validar_cambios:
+                validar_cambios(campos)
+        except ERRORES_DOCUMENTO as e:
+            resultados[i] = _error(i, f"Documento inválido: {e!r}")
+            if ordered:
+                break
+            continue
+        pendientes.append((i, oid, campos))
+    return resultados, pendientes
+
+
+def operaciones_cambios(resultados, pendientes, existentes, upsert):
+    """Marca los inexistentes (sin upsert) y arma los UpdateOne. Devuelve (ops, ejecutados)."""
+    ops, ejecutados = [], []
+    for i, oid, campos in pendientes:
+        if not upsert and oid not in existentes:
+            resultados[i] = _resultado(i, "no_encontrado", oid)
+            continue
+        ops.append(UpdateOne({"_id": oid}, {"$set": campos}, upsert=upsert))
+        ejecutados.append((i, oid))
+    return ops, ejecutados
+
+
+def completar_cambios(resultados, ejecutados, existentes, detalles, ordered):
+    fallidos = _errores_escritura(detalles)
+    corte = min(fallidos) if ordered and fallidos else None
+    for pos, (i, oid) in enumerate(ejecutados):
+        if pos in fallidos:
+            resultados[i] = _error(i, fallidos[pos])
+        elif corte is None or pos < corte:
+            resultados[i] = _resultado(i, "actualizado" if oid in existentes else "creado", oid)
+    return _completar(resultados)
+
+
+# --- Bajas y lecturas ---
+
+def completar_bajas(resultados, pendientes, existentes):
+    for i, oid in pendientes:
+        resultados[i] = _resultado(i, "eliminado" if oid in existentes else "no_encontrado", oid)
+    return _completar(resultados)
+
+
+def completar_lecturas(resultados, pendientes, encontrados):
+    for i, oid in pendientes:
+        doc = encontrados.get(oid)
+        if doc is None:
+            resultados[i] = _resultado(i, "no_encontrado", oid)
+        else:
+            resultados[i] = _resultado(i, "encontrado", oid, documento=doc)
+    return _completar(resultados)
+
+
+def ids_de_consulta(args):
+    """Lee ?ids=a,b,c del query string."""
+    ids = [i for i in args.get("ids", "").split(",") if i]
+    if len(ids) > LOTE_MAXIMO:
+        raise LoteInvalido(f"Como máximo {LOTE_MAXIMO} elementos por lote")
+    return ids
+
+
+# --- Versión síncrona (pymongo) ---
+
+def _ejecutar(operacion):
+    # bulk_api_result y BulkWriteError.details tienen el mismo formato
+    try:
+        return getattr(operacion(), "bulk_api_result", {})
+    except BulkWriteError as e:
+        return e.details
+
+
+def _existentes(coll, oids):
+    return {doc["_id"] for doc in coll.find({"_id": {"$in": oids}}, {"_id": 1})}
+
+
+def campos_de_cambios(pendientes):
+    """Nombres de los campos que escribe un lote de cambios (para envolver_cambios)."""
+    return set().union(*(campos for _, _, campos in pendientes))
+
+
+def registrar_lotes(bp, coleccion, nuevo_documento, campos_put, ocultos=(),
+                    al_modificar=None, leer_varios=None, envolver_cambios=None, validar_cambios=None):
+    """
+    Agrega las rutas /lote y /lote/buscar a un blueprint síncrono.
+    al_modificar(*ids): se llama con los ids creados, actualizados o eliminados.
+    leer_varios(oids): reemplaza la lectura por ids ({oid: doc}), por ejemplo con cache.
+    envolver_cambios(campos): context manager alrededor del bulk_write de un PUT
+    por lote y de al_modificar, según los campos que escribe.
+    validar_cambios(campos): valida cada elemento de un PUT por lote (ver preparar_cambios).
+    """
+    def _leer(coll, oids):
+        if leer_varios:
+            return leer_varios(oids)
+        proyeccion = {campo: 0 for campo in ocultos} or None
+        return {doc["_id"]: doc for doc in coll.find({"_id": {"$in": oids}}, proyeccion)}
+
+    def _buscar(coll, ids):
+        resultados, pendientes = preparar_ids(ids, ordered=False)
+        encontrados = _leer(coll, [oid for _, oid in pendientes]) if pendientes else {}
+        return jsonify(resumir(completar_lecturas(resultados, pendientes, encontrados))), 200
+
+    @bp.route("/lote", methods=["GET", "POST", "PUT", "DELETE"])
+    def lote():
+        coll = get_mongo_client()[coleccion]
+        try:
+            if request.method == "GET":
+                return _buscar(coll, ids_de_consulta(request.args))
+
+            data = request.get_json(silent=True)
+            if request.method == "POST":
+                # CREATE - insert_many
+                documentos, ordered = leer_lote(data, "documentos")
+                resultados, docs, indices = preparar_altas(documentos, nuevo_documento, ordered)
+                detalles = _ejecutar(lambda: coll.insert_many(docs, ordered=ordered)) if docs else {}
+                resultados = completar_altas(resultados, docs, indices, detalles, ordered)
+                creados = [r["_id"] for r in resultados if r["estado"] == "creado"]
+                if al_modificar and creados:
+                    al_modificar(*creados)
+                return jsonify(resumir(resultados)), 200
+
+            if request.method == "PUT":
+                # UPDATE / UPSERT - bulk_write de UpdateOne
+                documentos, ordered = leer_lote(data, "documentos")
+                upsert = data.get("upsert") is True
+                resultados, pendientes = preparar_cambios(documentos, campos_put, ordered, validar_cambios)
+                existentes = _existentes(coll, [oid for _, oid, _ in pendientes]) if pendientes else set()
+                ops, ejecutados = operaciones_cambios(resultados, pendientes, existentes, upsert)
+                envoltura = nullcontext()
+                if envolver_cambios and ops:
+                    envoltura = envolver_cambios(campos_de_cambios(pendientes))
+                with envoltura:
+                    detalles = _ejecutar(lambda: coll.bulk_write(ops, ordered=ordered)) if ops else {}
+                    resultados = completar_cambios(resultados, ejecutados, existentes, detalles, ordered)
+                    if al_modificar and ejecutados:
+                        al_modificar(*[oid for _, oid in ejecutados])
+                return jsonify(resumir(resultados)), 200
+
+            # DELETE - delete_many sobre los ids existentes
+            ids, ordered = leer_lote(data, "ids")
+            resultados, pendientes = preparar_ids(ids, ordered)
+            existentes = _existentes(coll, [oid for _, oid in pendientes]) if pendientes else set()
+            if existentes:
+                coll.delete_many({"_id": {"$in": list(existentes)}})
+                if al_modificar:
+                    al_modificar(*existentes)
+            return jsonify(resumir(completar_bajas(resultados, pendientes, existentes))), 200
+        except LoteInvalido as e:
+            return jsonify({"error": str(e)}), 400
+
+    @bp.route("/lote/buscar", methods=["POST"])
+    def buscar_lote():
+        # Igual que GET /lote, para listas de ids que no entran en la URL
+        try:
+            ids, _ = leer_lote(request.get_json(silent=True), "ids")
+        except LoteInvalido as e:
+            return jsonify({"error": str(e)}), 400
+        return _buscar(get_mongo_client()[coleccion], ids)
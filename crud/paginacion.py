@@ -0,0 +1,127 @@
+# crud/paginacion.py
+from urllib.parse import urlencode
+from flask import Response, request, jsonify, stream_with_context, current_app
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Paginación por cursor (keyset sobre _id) para los listados de los blueprints.
+#   ?limit=N        cantidad de documentos por página (default 100, máximo 1000)
+#   ?after=<id>     devuelve documentos con _id mayor al indicado
+#   ?fields=a,b     proyección; _id se incluye siempre
+#   ?stream=1       escribe el JSON a medida que se lee el cursor (exportaciones)
+# La respuesta sigue siendo una lista JSON; el cursor de la página siguiente
+# viaja en las cabeceras X-Next-After y Link.
+
+LIMITE_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+BATCH_STREAM = 500
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def leer_object_id(valor, nombre):
+    try:
+        return ObjectId(valor)
+    except (InvalidId, TypeError):
+        raise ParametroInvalido(f"'{nombre}' no es un ObjectId válido")
+
+
+def _leer_limite(args, stream):
+    limite = args.get("limit")
+    if limite is None:
+        # En modo stream no hay límite salvo que se pida explícitamente
+        return None if stream else LIMITE_DEFECTO
+    try:
+        limite = int(limite)
+    except ValueError:
+        raise ParametroInvalido("'limit' debe ser un entero")
+    if limite < 1:
+        raise ParametroInvalido("'limit' debe ser mayor a 0")
+    return limite if stream else min(limite, LIMITE_MAXIMO)
+
+
+def _leer_proyeccion(args, campos_permitidos, ocultos):
+    fields = args.get("fields")
+    if not fields:
+        return {campo: 0 for campo in ocultos} or None
+    campos = [c.strip() for c in fields.split(",") if c.strip()]
+    invalidos = [c for c in campos if c not in campos_permitidos]
+    if invalidos:
+        raise ParametroInvalido(f"Campos no permitidos: {', '.join(invalidos)}")
+    return {campo: 1 for campo in campos}
+
+
+def leer_parametros(args, filtro, campos_permitidos, ocultos=()):
+    """
+    Interpreta el query string de un listado. Devuelve (stream, limite,
+    proyeccion, filtro) con el filtro ya extendido por `after`.
+    `ocultos` son campos internos que se excluyen si no se pide `fields`.
+    Lanza ParametroInvalido si algún parámetro no es válido.
+    """
+    stream = args.get("stream") in ("1", "true")
+    limite = _leer_limite(args, stream)
+    proyeccion = _leer_proyeccion(args, campos_permitidos, ocultos)
+    after = args.get("after")
+    if after:
+        filtro = dict(filtro, _id={"$gt": leer_object_id(after, "after")})
+    return stream, limite, proyeccion, filtro
+
+
+def cabeceras_siguiente(base_url, args, siguiente, limite):
+    """Cabeceras que apuntan a la página que empieza después de `siguiente`."""
+    args = dict(args)
+    args.update({"after": siguiente, "limit": str(limite)})
+    return {
+        "X-Next-After": siguiente,
+        "Link": f'<{base_url}?{urlencode(args)}>; rel="next"',
+    }
+
+
+def _generar_json(cursor):
+    # Escribe "[doc,doc,...]" documento a documento, sin armar la lista en memoria
+    dumps = current_app.json.dumps_bytes
+    yield b"["
+    primero = True
+    for doc in cursor:
+        if not primero:
+            yield b","
+        yield dumps(doc)
+        primero = False
+    yield b"]"
+
+
+def listar_paginado(coll, filtro, campos_permitidos, ocultos=(), completar=None):
+    """Responde un listado paginado por _id de `coll` aplicando `filtro`.
+
+    Los documentos se devuelven tal como salen del cursor: el proveedor JSON
+    de la app (serializacion.py) convierte ObjectId y fechas. `completar(docs)`
+    puede agregar datos a la página entera (no se usa en modo stream).
+    """
+    try:
+        stream, limite, proyeccion, filtro = leer_parametros(request.args, filtro, campos_permitidos, ocultos)
+    except ParametroInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = coll.find(filtro, proyeccion).sort("_id", 1)
+
+    if stream:
+        if limite:
+            cursor = cursor.limit(limite)
+        cursor = cursor.batch_size(BATCH_STREAM)
+        return Response(stream_with_context(_generar_json(cursor)),
+                        mimetype="application/json")
+
+    # Se pide un documento de más para saber si existe una página siguiente
+    docs = list(cursor.limit(limite + 1))
+    hay_mas = len(docs) > limite
+    docs = docs[:limite]
+    if completar:
+        docs = completar(docs)
+
+    respuesta = jsonify(docs)
+    if hay_mas:
+        siguiente = str(docs[-1]["_id"])
+        respuesta.headers.update(cabeceras_siguiente(request.base_url, request.args.to_dict(), siguiente, limite))
+    return respuesta, 200
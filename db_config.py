@@ -1,12 +1,113 @@
 # db_config.py
 import os
+import threading
 from pymongo import MongoClient
 
-def get_mongo_client():
+# Registro de clientes por proceso: un único MongoClient (con su pool) compartido
+# por todos los requests. Se guarda el pid para detectar un fork y recrearlo,
+# ya que un MongoClient no debe usarse a través de procesos.
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+
+# Listeners de pymongo de los clientes que se creen; metricas.instrumentar_clientes()
+# agrega los de /metrics. Este módulo no importa metricas, así los scripts que
+# solo usan la base no necesitan Flask ni prometheus_client.
+_listeners = []
+
+
+def agregar_listeners(*listeners):
+    """Agrega listeners a los clientes que se creen desde ahora (no a los ya creados)."""
+    _listeners.extend(listeners)
+
+
+def _opciones_mongo():
+    # Tamaños de pool, timeouts y heartbeat configurables por entorno
+    return {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", 100)),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 60000)),
+        "waitQueueTimeoutMS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)),
+        "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "socketTimeoutMS": int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 10000)),
+        "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        "heartbeatFrequencyMS": int(os.environ.get("MONGO_HEARTBEAT_FREQUENCY_MS", 10000)),
+        "retryWrites": True,
+        # Comandos y uso del pool para /metrics (ver agregar_listeners)
+        "event_listeners": list(_listeners),
+    }
+
+
+def get_mongo_uri():
     # Leer variables de entorno que definen la URI
-    mongo_uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017/mi_ecommerce")
-    client = MongoClient(mongo_uri)
-    # Extraer el nombre de la BD de la URI o usar por defecto
-    db_name = mongo_uri.rsplit('/', 1)[-1]  # "mi_ecommerce" si la URI tiene forma "mongodb://.../mi_ecommerce"
-    db = client[db_name]
-    return db
+    return os.environ.get("MONGO_URI", "mongodb://localhost:27017/mi_ecommerce")
+
+
+def get_mongo_connection():
+    """Devuelve el MongoClient compartido del proceso, creándolo si hace falta."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            # Tras un fork el cliente heredado no se cierra (sus sockets son del
+            # padre); simplemente se descarta y se crea uno nuevo.
+            _client = MongoClient(get_mongo_uri(), **_opciones_mongo())
+            _client_pid = pid
+    return _client
+
+
+def _nombre_db():
+    # Extraer el nombre de la BD de la URI
+    return get_mongo_uri().rsplit('/', 1)[-1].split('?', 1)[0]  # "mi_ecommerce" si la URI tiene forma "mongodb://.../mi_ecommerce"
+
+
+def get_mongo_client():
+    return get_mongo_connection()[_nombre_db()]
+
+
+def ping_mongo():
+    """Health check: True si el servidor responde al comando ping."""
+    try:
+        get_mongo_connection().admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+
+def close_mongo_client():
+    """Cierra el cliente del proceso actual (apagado ordenado)."""
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+# --- Cliente asíncrono (app_async.py) ---
+# motor se importa solo si se usa el modo asíncrono. El cliente queda ligado al
+# event loop del proceso, por eso se crea al arrancar el servidor ASGI.
+_motor_client = None
+_motor_pid = None
+
+
+def get_motor_client():
+    """Devuelve la base de datos de MongoDB sobre un AsyncIOMotorClient compartido."""
+    global _motor_client, _motor_pid
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    pid = os.getpid()
+    if _motor_client is None or _motor_pid != pid:
+        _motor_client = AsyncIOMotorClient(get_mongo_uri(), **_opciones_mongo())
+        _motor_pid = pid
+    return _motor_client[_nombre_db()]
+
+
+def close_motor_client():
+    global _motor_client, _motor_pid
+    if _motor_client is not None and _motor_pid == os.getpid():
+        _motor_client.close()
+    _motor_client = None
+    _motor_pid = None
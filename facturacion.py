@@ -0,0 +1,105 @@
+# facturacion.py
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne, UpdateMany
+from pymongo.errors import BulkWriteError
+
+from db_config import get_mongo_client
+
+# Facturación por lote: convierte los pedidos pagados sin factura en facturas.
+# Cada tanda de BATCH pedidos (recorridos por _id con el índice estado_id):
+#   1. upsert de una factura por pedido (índice único pedido_id): repetir una
+#      tanda no crea facturas duplicadas
+#   2. los pagos del pedido quedan con factura_id (así los lista /facturas)
+#   3. el pedido queda con factura_id: deja de ser candidato
+# Después de cada tanda se guarda el último _id en trabajos.facturacion; si el
+# proceso se corta, la próxima ejecución sigue desde ahí. Al terminar se borra
+# el punto de control y la siguiente corrida vuelve a empezar desde el principio
+# (un pedido viejo puede pagarse tarde).
+
+BATCH = 1000
+TRABAJO = "facturacion"
+CODIGO_DUPLICADO = 11000
+
+log = logging.getLogger(__name__)
+
+
+def _candidatos(db, desde, batch):
+    filtro = {"estado": "pagado", "factura_id": {"$exists": False}}
+    if desde is not None:
+        filtro["_id"] = {"$gt": desde}
+    proyeccion = {"usuario_id": 1, "total": 1}
+    return list(db["pedidos"].find(filtro, proyeccion).sort("_id", 1).limit(batch))
+
+
+def _alta_facturas(coll, ops):
+    # Devuelve cuántas facturas se insertaron. Los duplicados son facturas que
+    # ya existían (otra corrida en paralelo)
+    try:
+        return coll.bulk_write(ops, ordered=False).upserted_count
+    except BulkWriteError as e:
+        if any(err.get("code") != CODIGO_DUPLICADO for err in e.details.get("writeErrors", [])):
+            raise
+        return e.details.get("nUpserted", 0)
+
+
+def facturar_tanda(db, pedidos):
+    """Crea y enlaza las facturas de `pedidos`. Devuelve cuántas facturas nuevas se crearon."""
+    ids = [p["_id"] for p in pedidos]
+    fechas = {}
+    for pago in db["pagos"].find({"pedido_id": {"$in": ids}}, {"pedido_id": 1, "fecha_pago": 1}):
+        fechas[pago["pedido_id"]] = max(fechas.get(pago["pedido_id"], pago["fecha_pago"]), pago["fecha_pago"])
+
+    ahora = datetime.utcnow()
+    creadas = _alta_facturas(db["facturas"], [
+        UpdateOne({"pedido_id": p["_id"]}, {"$setOnInsert": {
+            "usuario_id": p["usuario_id"],
+            "monto": p.get("total", 0.0),
+            "estado": "pagado",
+            "fecha": fechas.get(p["_id"], ahora),
+        }}, upsert=True)
+        for p in pedidos
+    ])
+
+    facturas = {f["pedido_id"]: f["_id"] for f in db["facturas"].find({"pedido_id": {"$in": ids}}, {"pedido_id": 1})}
+    db["pagos"].bulk_write([
+        UpdateMany({"pedido_id": pedido_id}, {"$set": {"factura_id": factura_id}})
+        for pedido_id, factura_id in facturas.items()
+    ], ordered=False)
+    # Último paso: el pedido deja de ser candidato solo si lo anterior terminó
+    db["pedidos"].bulk_write([
+        UpdateOne({"_id": pedido_id}, {"$set": {"factura_id": factura_id}})
+        for pedido_id, factura_id in facturas.items()
+    ], ordered=False)
+    return creadas
+
+
+def facturar_pagados(batch=BATCH, progreso=None):
+    """
+    Factura todos los pedidos pagados sin factura, en tandas de `batch`.
+    Es idempotente y retoma la última ejecución interrumpida.
+    Devuelve (pedidos procesados, facturas creadas).
+    """
+    db = get_mongo_client()
+    trabajos = db["trabajos"]
+    punto = trabajos.find_one({"_id": TRABAJO}) or {}
+    ultimo = punto.get("ultimo_id")
+    if ultimo is not None:
+        log.info("Facturación retomada después del pedido %s", ultimo)
+
+    procesados = creadas = 0
+    while True:
+        pedidos = _candidatos(db, ultimo, batch)
+        if not pedidos:
+            break
+        creadas += facturar_tanda(db, pedidos)
+        procesados += len(pedidos)
+        ultimo = pedidos[-1]["_id"]
+        trabajos.update_one({"_id": TRABAJO}, {"$set": {"ultimo_id": ultimo, "actualizado": datetime.utcnow()}},
+                            upsert=True)
+        if progreso:
+            progreso(procesados, creadas)
+
+    trabajos.delete_one({"_id": TRABAJO})
+    return procesados, creadas
@@ -0,0 +1,54 @@
+# gunicorn.conf.py
+# Servidor de producción (pre-fork): un master y N workers con threads.
+#
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+import multiprocessing
+import os
+
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("WEB_THREADS", 8))
+worker_class = "gthread"
+
+# La app no se carga en el master: cada worker la importa después del fork,
+# así ningún cliente de MongoDB o Redis se comparte entre procesos.
+preload_app = False
+
+timeout = int(os.environ.get("WEB_TIMEOUT", 30))
+keepalive = int(os.environ.get("WEB_KEEPALIVE", 5))
+# Al recibir SIGTERM cada worker deja de aceptar conexiones y tiene este tiempo
+# para terminar los requests en vuelo (incluidos los checkouts)
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+# Reciclar workers de a poco evita que crezca la memoria indefinidamente
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("WEB_MAX_REQUESTS_JITTER", 1000))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Las métricas de cada worker se escriben en PROMETHEUS_MULTIPROC_DIR;
+    # se vacía al arrancar para no mezclar corridas anteriores
+    directorio = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directorio:
+        import shutil
+        shutil.rmtree(directorio, ignore_errors=True)
+        os.makedirs(directorio)
+
+
+def post_fork(server, worker):
+    from ciclo_vida import inicializar_worker
+    inicializar_worker()
+
+
+def worker_exit(server, worker):
+    from ciclo_vida import cerrar_worker
+    cerrar_worker(timeout=graceful_timeout)
+
+
+def child_exit(server, worker):
+    # Modo multiproceso de prometheus_client: descartar los gauges del worker muerto
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
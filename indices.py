@@ -0,0 +1,162 @@
+# indices.py
+import logging
+from datetime import datetime
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+from bson import ObjectId
+
+# Índices declarados por colección. asegurar_indices() los crea si faltan y
+# recrea los que cambiaron de definición; explicar_consultas() verifica que las
+# consultas de cada ruta los usen.
+INDICES = {
+    "productos": [
+        # GET /productos/buscar?q= (relevancia por textScore; el nombre pesa más)
+        IndexModel([("nombre", TEXT), ("descripcion", TEXT)], name="texto_nombre_descripcion",
+                   weights={"nombre": 10, "descripcion": 1}, default_language="spanish"),
+    ],
+    "usuarios": [
+        # POST /login
+        IndexModel([("email", ASCENDING)], name="email_unico", unique=True),
+        # GET /usuarios/?categoria= (paginado por _id)
+        IndexModel([("categoria", ASCENDING), ("_id", ASCENDING)], name="categoria_id"),
+    ],
+    "pedidos": [
+        # GET /pedidos/?usuario_id=&estado=
+        IndexModel([("usuario_id", ASCENDING), ("estado", ASCENDING)], name="usuario_estado"),
+        # GET /pedidos/?estado= (paginado por _id)
+        IndexModel([("estado", ASCENDING), ("_id", ASCENDING)], name="estado_id"),
+    ],
+    "pagos": [
+        # GET /historial_pagos
+        IndexModel([("usuario_id", ASCENDING), ("fecha_pago", DESCENDING)], name="usuario_fecha_pago"),
+        # GET /facturas/<id>/pagos y GET /facturas/?incluir=pagos
+        IndexModel([("factura_id", ASCENDING)], name="factura_id"),
+        # Facturación por lote: pagos de cada pedido (ver facturacion.py)
+        IndexModel([("pedido_id", ASCENDING)], name="pedido_id"),
+    ],
+    "facturas": [
+        # Una factura por pedido: hace idempotente la facturación por lote
+        IndexModel([("pedido_id", ASCENDING)], name="pedido_unico", unique=True,
+                   partialFilterExpression={"pedido_id": {"$exists": True}}),
+        # GET /facturas/?usuario_id= (paginado por _id)
+        IndexModel([("usuario_id", ASCENDING), ("_id", ASCENDING)], name="usuario_id"),
+    ],
+    "ventas_rollup": [
+        # GET /ventas/ (totales, sin p) y GET /ventas/?product_id=
+        IndexModel([("g", ASCENDING), ("p", ASCENDING), ("t", ASCENDING)], name="granularidad_producto_fecha"),
+        # GET /ventas/productos (ranking en un rango de fechas)
+        IndexModel([("g", ASCENDING), ("t", ASCENDING)], name="granularidad_fecha"),
+    ],
+}
+
+# Forma de las consultas de cada ruta: (ruta, colección, filtro, orden)
+_ID_EJEMPLO = ObjectId()
+_FECHA_EJEMPLO = datetime(2025, 1, 1)
+CONSULTAS = [
+    ("GET /productos/buscar?q=", "productos", {"$text": {"$search": "zapatilla"}}, None),
+    ("POST /login", "usuarios", {"email": "alice@example.com"}, None),
+    ("GET /usuarios/?categoria=", "usuarios", {"categoria": "TOP"}, [("_id", ASCENDING)]),
+    ("GET /pedidos/?estado=", "pedidos", {"estado": "pendiente"}, [("_id", ASCENDING)]),
+    ("GET /pedidos/?usuario_id=&estado=", "pedidos",
+     {"usuario_id": _ID_EJEMPLO, "estado": "pendiente"}, [("_id", ASCENDING)]),
+    ("GET /historial_pagos", "pagos", {"usuario_id": _ID_EJEMPLO}, [("fecha_pago", DESCENDING)]),
+    ("GET /facturas/<id>/pagos", "pagos", {"factura_id": _ID_EJEMPLO}, None),
+    ("GET /facturas/?usuario_id=", "facturas", {"usuario_id": _ID_EJEMPLO}, [("_id", ASCENDING)]),
+    ("Facturación por lote", "pagos", {"pedido_id": {"$in": [_ID_EJEMPLO]}}, None),
+    ("POST /facturar_pedido/<id>", "pedidos", {"_id": _ID_EJEMPLO}, None),
+    ("GET /ventas/", "ventas_rollup", {"g": "d", "p": None, "t": {"$gte": _FECHA_EJEMPLO}}, [("t", ASCENDING)]),
+    ("GET /ventas/?product_id=", "ventas_rollup",
+     {"g": "d", "p": _ID_EJEMPLO, "t": {"$gte": _FECHA_EJEMPLO}}, [("t", ASCENDING)]),
+    ("GET /ventas/productos", "ventas_rollup",
+     {"g": "d", "t": {"$gte": _FECHA_EJEMPLO}, "p": {"$ne": None}}, None),
+]
+
+log = logging.getLogger(__name__)
+
+
+def _definicion(spec):
+    # Lo que define a un índice, sin importar el orden de las opciones
+    ignorar = ("key", "name", "v", "ns", "background", "language_override", "textIndexVersion")
+    opciones = {k: v for k, v in spec.items() if k not in ignorar}
+    clave = list(spec["key"].items())
+    texto = [campo for campo, tipo in clave if tipo == "text"]
+    if texto or ("_fts", "text") in clave:
+        # MongoDB lista los índices de texto como {_fts, _ftsx}: se comparan por sus pesos
+        clave = [(campo, tipo) for campo, tipo in clave
+                 if tipo != "text" and campo not in ("_fts", "_ftsx")]
+        opciones["weights"] = dict(opciones.get("weights") or {campo: 1 for campo in texto})
+    return clave, opciones
+
+
+def asegurar_indices(db, eliminar_sobrantes=False):
+    """
+    Reconcilia los índices de cada colección con INDICES. Devuelve un resumen
+    {coleccion: {"creados": [...], "recreados": [...], "sobrantes": [...], "errores": [...]}}.
+    Los índices no declarados solo se eliminan si eliminar_sobrantes=True.
+    """
+    resumen = {}
+    for nombre_coll, modelos in INDICES.items():
+        coll = db[nombre_coll]
+        existentes = {ix["name"]: ix for ix in coll.list_indexes()}
+        estado = {"creados": [], "recreados": [], "sobrantes": [], "errores": []}
+
+        for modelo in modelos:
+            spec = modelo.document
+            nombre = spec["name"]
+            try:
+                if nombre in existentes:
+                    if _definicion(existentes[nombre]) == _definicion(spec):
+                        continue
+                    coll.drop_index(nombre)
+                    coll.create_indexes([modelo])
+                    estado["recreados"].append(nombre)
+                else:
+                    coll.create_indexes([modelo])
+                    estado["creados"].append(nombre)
+            except OperationFailure as e:
+                # Por ejemplo, emails duplicados al crear el índice único
+                log.error("No se pudo crear %s.%s: %s", nombre_coll, nombre, e)
+                estado["errores"].append(f"{nombre}: {e}")
+
+        declarados = {m.document["name"] for m in modelos}
+        for nombre in existentes:
+            if nombre == "_id_" or nombre in declarados:
+                continue
+            if eliminar_sobrantes:
+                coll.drop_index(nombre)
+            estado["sobrantes"].append(nombre)
+
+        resumen[nombre_coll] = estado
+    return resumen
+
+
+def _etapas(plan):
+    # Recorre el árbol del plan (inputStage / inputStages / queryPlan)
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for valor in plan.values():
+            yield from _etapas(valor)
+    elif isinstance(plan, list):
+        for valor in plan:
+            yield from _etapas(valor)
+
+
+def explicar_consultas(db):
+    """Ejecuta explain() sobre la consulta de cada ruta y marca las que hacen COLLSCAN."""
+    reporte = []
+    for ruta, nombre_coll, filtro, orden in CONSULTAS:
+        cursor = db[nombre_coll].find(filtro)
+        if orden:
+            cursor = cursor.sort(orden)
+        explain = cursor.explain()
+        plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        etapas = list(_etapas(plan))
+        reporte.append({
+            "ruta": ruta,
+            "coleccion": nombre_coll,
+            "etapas": etapas,
+            "collscan": "COLLSCAN" in etapas,
+            "sort_en_memoria": "SORT" in etapas,
+        })
+    return reporte
@@ -0,0 +1,735 @@
+# inventario.py
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import redis
+from bson import ObjectId
+from pymongo import UpdateOne
+
+import cache_productos
+import carrito_repo
+from db_config import get_mongo_client
+from redis_config import (
+    REPARTIDO, get_redis_client, get_async_redis_client, get_redis_client_sesion, get_async_redis_client_sesion,
+)
+
+# Inventario en Redis con escritura diferida (write-behind) a MongoDB.
+#   inventario:stock:{id}      unidades que todavía se pueden reservar
+#   inventario:reservados      HASH id -> unidades reservadas en carritos
+#   inventario:pendientes      HASH id -> unidades vendidas que falta descontar en MongoDB
+#   inventario:vencimientos    ZSET session_id -> vencimiento de su carrito (epoch)
+#   reserva:{session_id}       HASH id -> unidades reservadas por ese carrito (sin TTL:
+#                              solo la borran liberar o confirmar, que también
+#                              ajustan inventario:reservados)
+#
+# agregar_carrito reserva con un script Lua (si no alcanza responde 409) y
+# confirmar_pedido convierte la reserva en venta sin tocar MongoDB. Un thread
+# por proceso (iniciar_worker) libera las reservas de carritos vencidos y
+# vuelca las ventas a productos.stock con un bulk_write cada INTERVALO
+# segundos; un lock en Redis evita que dos procesos vuelquen a la vez.
+#
+# Con REDIS_NODOS los carritos viven en el nodo de su sesión y estas claves en
+# el principal, así que reservar no puede ser un solo script: la reserva se
+# hace en el principal y después se suma al carrito en su nodo (si eso falla,
+# la reserva se deshace). Para liberar, el worker lee los TTL de los carritos
+# de cada nodo y los pasa al script.
+#
+# En MongoDB, productos.stock = unidades no vendidas (incluye las reservadas),
+# así que en todo momento:
+#   inventario:stock:{id} = productos.stock - reservados - pendientes
+# Los contadores se cargan desde MongoDB la primera vez que se usan y
+# reconciliar() corrige los que se hayan desviado.
+
+PREFIJO_STOCK = "inventario:stock:"
+PREFIJO_RESERVA = "reserva:"
+CLAVE_RESERVADOS = "inventario:reservados"
+CLAVE_PENDIENTES = "inventario:pendientes"
+CLAVE_VOLCANDO = "inventario:volcando"
+CLAVE_LOTE = "inventario:volcando:lote"
+CLAVE_VENCIMIENTOS = "inventario:vencimientos"
+CLAVE_LOCK = "inventario:lock"
+
+INTERVALO = float(os.environ.get("INVENTARIO_INTERVALO", 1))
+TTL_LOCK_MS = 30000
+LIBERAR_POR_VUELTA = 500
+BATCH_RECONCILIAR = 500
+
+log = logging.getLogger(__name__)
+
+# KEYS = stock, reserva, carrito, reservados, vencimientos
+# ARGV = product_id, cantidad, ttl carrito, vencimiento, session_id,
+#        campo del carrito (carrito_repo.campo_producto), máximo de productos (0 = sin límite)
+# Devuelve {cantidad en el carrito, stock restante}; {-1, 0} si el contador
+# no está cargado, {-2, stock} si no alcanza y {-3, stock} si el carrito está lleno
+_LUA_RESERVAR = """
+local disponible = redis.call('GET', KEYS[1])
+if not disponible then
+  return {-1, 0}
+end
+local cantidad = tonumber(ARGV[2])
+if tonumber(disponible) < cantidad then
+  return {-2, tonumber(disponible)}
+end
+local maximo = tonumber(ARGV[7])
+if maximo > 0 and redis.call('HEXISTS', KEYS[3], ARGV[6]) == 0
+    and redis.call('HLEN', KEYS[3]) >= maximo then
+  return {-3, tonumber(disponible)}
+end
+local restante = redis.call('DECRBY', KEYS[1], cantidad)
+redis.call('HINCRBY', KEYS[4], ARGV[1], cantidad)
+redis.call('HINCRBY', KEYS[2], ARGV[1], cantidad)
+local en_carrito = redis.call('HINCRBY', KEYS[3], ARGV[6], cantidad)
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+redis.call('ZADD', KEYS[5], ARGV[4], ARGV[5])
+return {en_carrito, restante}
+"""
+
+# KEYS = reserva, reservados, pendientes, vencimientos
+# ARGV = parcial (0/1), session_id, prefijo de stock, id1, cantidad1, id2, ...
+# Lo reservado por el carrito se usa primero; lo que falte se toma del stock.
+# Devuelve {0, sin_stock} si se confirmó, {1, ids sin cargar} o {2, sin_stock}
+# si se rechazó (en ambos casos sin modificar nada).
+_LUA_CONFIRMAR = """
+local lineas = {}
+local sin_cargar = {}
+local sin_stock = {}
+for i = 4, #ARGV, 2 do
+  local id = ARGV[i]
+  local cantidad = tonumber(ARGV[i + 1])
+  local reservado = tonumber(redis.call('HGET', KEYS[1], id) or '0')
+  local cubierto = math.min(cantidad, reservado)
+  local linea = {id = id, cantidad = cantidad, cubierto = cubierto, ok = true}
+  if cantidad > cubierto then
+    local disponible = redis.call('GET', ARGV[3] .. id)
+    if not disponible then
+      sin_cargar[#sin_cargar + 1] = id
+    elseif tonumber(disponible) < cantidad - cubierto then
+      sin_stock[#sin_stock + 1] = id
+      linea.ok = false
+    end
+  end
+  lineas[#lineas + 1] = linea
+end
+if #sin_cargar > 0 then
+  return {1, sin_cargar}
+end
+if #sin_stock == #lineas or (#sin_stock > 0 and ARGV[1] ~= '1') then
+  return {2, sin_stock}
+end
+for _, linea in ipairs(lineas) do
+  if linea.cubierto > 0 then
+    redis.call('HINCRBY', KEYS[2], linea.id, -linea.cubierto)
+    if redis.call('HINCRBY', KEYS[1], linea.id, -linea.cubierto) <= 0 then
+      redis.call('HDEL', KEYS[1], linea.id)
+    end
+  end
+  if linea.ok then
+    if linea.cantidad > linea.cubierto then
+      redis.call('DECRBY', ARGV[3] .. linea.id, linea.cantidad - linea.cubierto)
+    end
+    redis.call('HINCRBY', KEYS[3], linea.id, linea.cantidad)
+  elseif linea.cubierto > 0 and redis.call('EXISTS', ARGV[3] .. linea.id) == 1 then
+    -- Línea descartada en un pedido parcial: su reserva vuelve al stock
+    redis.call('INCRBY', ARGV[3] .. linea.id, linea.cubierto)
+  end
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  redis.call('ZREM', KEYS[4], ARGV[2])
+end
+return {0, sin_stock}
+"""
+
+# KEYS[1] = pendientes; ARGV = prefijo de stock, id1, cantidad1, ...
+# Deshace un confirmar (el pedido no se pudo guardar): las unidades vuelven al stock
+_LUA_REVERTIR = """
+for i = 2, #ARGV, 2 do
+  redis.call('HINCRBY', KEYS[1], ARGV[i], -ARGV[i + 1])
+  if redis.call('EXISTS', ARGV[1] .. ARGV[i]) == 1 then
+    redis.call('INCRBY', ARGV[1] .. ARGV[i], ARGV[i + 1])
+  end
+end
+return #ARGV
+"""
+
+# KEYS = stock, reserva, reservados, vencimientos
+# ARGV = product_id, cantidad, vencimiento, session_id
+# Como _LUA_RESERVAR pero sin el carrito (REDIS_NODOS); devuelve {0, stock restante}
+_LUA_RESERVAR_STOCK = """
+local disponible = redis.call('GET', KEYS[1])
+if not disponible then
+  return {-1, 0}
+end
+local cantidad = tonumber(ARGV[2])
+if tonumber(disponible) < cantidad then
+  return {-2, tonumber(disponible)}
+end
+local restante = redis.call('DECRBY', KEYS[1], cantidad)
+redis.call('HINCRBY', KEYS[3], ARGV[1], cantidad)
+redis.call('HINCRBY', KEYS[2], ARGV[1], cantidad)
+redis.call('ZADD', KEYS[4], ARGV[3], ARGV[4])
+return {0, restante}
+"""
+
+# En el nodo de la sesión. KEYS[1] = carrito; ARGV = campo, cantidad, ttl, máximo de productos
+# Devuelve la cantidad en el carrito o -3 si está lleno
+_LUA_SUMAR_CARRITO = """
+local maximo = tonumber(ARGV[4])
+if maximo > 0 and redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0
+    and redis.call('HLEN', KEYS[1]) >= maximo then
+  return -3
+end
+local en_carrito = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return en_carrito
+"""
+
+# KEYS = stock, reserva, reservados; ARGV = product_id, cantidad
+# Deshace una reserva de _LUA_RESERVAR_STOCK que no llegó al carrito
+_LUA_CANCELAR_RESERVA = """
+redis.call('HINCRBY', KEYS[3], ARGV[1], -ARGV[2])
+if redis.call('HINCRBY', KEYS[2], ARGV[1], -ARGV[2]) <= 0 then
+  redis.call('HDEL', KEYS[2], ARGV[1])
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('INCRBY', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+# Devuelve al stock lo reservado por una sesión y la saca de vencimientos
+# (KEYS[1] = vencimientos, KEYS[2] = reservados). reprogramar() pospone el
+# vencimiento de un carrito renovado; el PERSIST quita el TTL que tenían las
+# reservas creadas por versiones anteriores, para que no expiren con las
+# unidades todavía contadas en inventario:reservados.
+_LUA_FUNCION_LIBERAR = """
+local function reprogramar(sid, vencimiento, prefijo_reserva)
+  redis.call('ZADD', KEYS[1], vencimiento, sid)
+  redis.call('PERSIST', prefijo_reserva .. sid)
+end
+
+local function liberar(sid, prefijo_reserva, prefijo_stock)
+  local items = redis.call('HGETALL', prefijo_reserva .. sid)
+  for i = 1, #items, 2 do
+    redis.call('HINCRBY', KEYS[2], items[i], -items[i + 1])
+    if redis.call('EXISTS', prefijo_stock .. items[i]) == 1 then
+      redis.call('INCRBY', prefijo_stock .. items[i], items[i + 1])
+    end
+  end
+  redis.call('DEL', prefijo_reserva .. sid)
+  redis.call('ZREM', KEYS[1], sid)
+end
+"""
+
+# KEYS = vencimientos, reservados; ARGV = ahora, cantidad máxima, prefijos de carrito, reserva y stock,
+#        prefijo de carrito anterior (solo en modo compacto)
+# Los carritos renovados (ver_carrito extiende el TTL) se reprograman; el resto
+# devuelve sus reservas al stock
+_LUA_LIBERAR = _LUA_FUNCION_LIBERAR + """
+local vencidas = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local liberadas = 0
+for _, sid in ipairs(vencidas) do
+  local ttl = redis.call('TTL', ARGV[3] .. sid)
+  if ttl <= 0 and ARGV[6] then
+    ttl = redis.call('TTL', ARGV[6] .. sid)
+  end
+  if ttl > 0 then
+    reprogramar(sid, tonumber(ARGV[1]) + ttl, ARGV[4])
+  else
+    liberar(sid, ARGV[4], ARGV[5])
+    liberadas = liberadas + 1
+  end
+end
+return liberadas
+"""
+
+# KEYS = vencimientos, reservados; ARGV = ahora, prefijos de reserva y stock, sid1, ttl1, sid2, ...
+# Versión de _LUA_LIBERAR con los TTL leídos de los nodos de cada carrito
+# (REDIS_NODOS). Una sesión que volvió a reservar mientras tanto ya tiene un
+# vencimiento posterior y se saltea.
+_LUA_LIBERAR_SESIONES = _LUA_FUNCION_LIBERAR + """
+local liberadas = 0
+for i = 4, #ARGV, 2 do
+  local sid = ARGV[i]
+  local ttl = tonumber(ARGV[i + 1])
+  local vencimiento = redis.call('ZSCORE', KEYS[1], sid)
+  if vencimiento and tonumber(vencimiento) <= tonumber(ARGV[1]) then
+    if ttl > 0 then
+      reprogramar(sid, tonumber(ARGV[1]) + ttl, ARGV[2])
+    else
+      liberar(sid, ARGV[2], ARGV[3])
+      liberadas = liberadas + 1
+    end
+  end
+end
+return liberadas
+"""
+
+# KEYS = reservados, pendientes, volcando; ARGV = prefijo de stock, id1, stock1, id2, ...
+# Crea los contadores que no existen a partir del stock de MongoDB
+_LUA_CARGAR = """
+for i = 2, #ARGV, 2 do
+  local id = ARGV[i]
+  local usado = tonumber(redis.call('HGET', KEYS[1], id) or '0')
+    + tonumber(redis.call('HGET', KEYS[2], id) or '0')
+    + tonumber(redis.call('HGET', KEYS[3], id) or '0')
+  redis.call('SET', ARGV[1] .. id, tonumber(ARGV[i + 1]) - usado, 'NX')
+end
+return #ARGV
+"""
+
+# KEYS = pendientes, volcando, lote; ARGV = id de lote nuevo
+# Pasa las ventas pendientes a "volcando" (o retoma un volcado interrumpido)
+_LUA_TOMAR_PENDIENTES = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+  return {redis.call('GET', KEYS[3]), redis.call('HGETALL', KEYS[2])}
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return {false, {}}
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('SET', KEYS[3], ARGV[1])
+return {ARGV[1], redis.call('HGETALL', KEYS[2])}
+"""
+
+# KEYS = reservados, pendientes; ARGV = corregir (0/1), prefijo de stock, id1, stock1, ...
+# stock -1 = el producto ya no existe. Devuelve [id, actual, esperado, ...] de los desviados
+_LUA_RECONCILIAR = """
+local desvios = {}
+for i = 3, #ARGV, 2 do
+  local id = ARGV[i]
+  local clave = ARGV[2] .. id
+  local actual = redis.call('GET', clave)
+  if actual then
+    local esperado = -1
+    if tonumber(ARGV[i + 1]) >= 0 then
+      esperado = tonumber(ARGV[i + 1])
+        - tonumber(redis.call('HGET', KEYS[1], id) or '0')
+        - tonumber(redis.call('HGET', KEYS[2], id) or '0')
+    end
+    if tonumber(actual) ~= esperado then
+      desvios[#desvios + 1] = id
+      desvios[#desvios + 1] = actual
+      desvios[#desvios + 1] = tostring(esperado)
+      if ARGV[1] == '1' then
+        if tonumber(ARGV[i + 1]) < 0 then
+          redis.call('DEL', clave)
+        else
+          redis.call('SET', clave, esperado)
+        end
+      end
+    end
+  end
+end
+return desvios
+"""
+
+_LUA_SOLTAR_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_scripts = {}
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def _script(nombre, fuente, asincrono=False):
+    clave = (nombre, asincrono)
+    if clave not in _scripts:
+        cliente = get_async_redis_client() if asincrono else get_redis_client()
+        _scripts[clave] = cliente.register_script(fuente)
+    return _scripts[clave]
+
+
+def clave_stock(producto_id):
+    return f"{PREFIJO_STOCK}{producto_id}"
+
+
+def clave_reserva(session_id):
+    return f"{PREFIJO_RESERVA}{session_id}"
+
+
+def _pares(cantidades):
+    args = []
+    for producto_id, cantidad in cantidades.items():
+        args += [str(producto_id), int(cantidad)]
+    return args
+
+
+# --- Carga de contadores ---
+
+def _args_cargar(docs):
+    args = [PREFIJO_STOCK]
+    for doc in docs:
+        args += [str(doc["_id"]), int(doc.get("stock", 0))]
+    return args
+
+
+def cargar(ids):
+    """Crea desde MongoDB los contadores de los productos que no lo tienen."""
+    docs = list(get_mongo_client()["productos"].find(
+        {"_id": {"$in": [ObjectId(i) for i in ids]}}, {"stock": 1}))
+    if docs:
+        _script("cargar", _LUA_CARGAR)(
+            keys=[CLAVE_RESERVADOS, CLAVE_PENDIENTES, CLAVE_VOLCANDO],
+            args=_args_cargar(docs), client=get_redis_client())
+
+
+async def cargar_async(db, ids):
+    docs = await db["productos"].find(
+        {"_id": {"$in": [ObjectId(i) for i in ids]}}, {"stock": 1}).to_list(None)
+    if docs:
+        await _script("cargar", _LUA_CARGAR, asincrono=True)(
+            keys=[CLAVE_RESERVADOS, CLAVE_PENDIENTES, CLAVE_VOLCANDO],
+            args=_args_cargar(docs), client=get_async_redis_client())
+
+
+def recargar(*ids):
+    """Descarta los contadores (p. ej. tras editar el stock): se vuelven a cargar al usarse."""
+    if ids:
+        get_redis_client().delete(*[clave_stock(i) for i in ids])
+
+
+async def recargar_async(*ids):
+    if ids:
+        await get_async_redis_client().delete(*[clave_stock(i) for i in ids])
+
+
+# --- Reservas (agregar_carrito) ---
+
+def _args_reservar(session_id, product_id, cantidad):
+    keys = [clave_stock(product_id), clave_reserva(session_id), carrito_repo.clave_carrito(session_id),
+            CLAVE_RESERVADOS, CLAVE_VENCIMIENTOS]
+    vencimiento = int(time.time()) + carrito_repo.TTL_CARRITO
+    args = [product_id, cantidad, carrito_repo.TTL_CARRITO, vencimiento, session_id,
+            carrito_repo.campo_producto(product_id), carrito_repo.MAX_ITEMS_CARRITO]
+    return keys, args
+
+
+def _resultado_reservar(en_carrito, restante):
+    if en_carrito == -3:
+        raise carrito_repo.CarritoLleno()
+    return (en_carrito if en_carrito >= 0 else None), restante
+
+
+def _args_repartido(session_id, product_id, cantidad):
+    # Reserva en el nodo principal, carrito en el de la sesión y, si hace falta, cancelación
+    reserva = ([clave_stock(product_id), clave_reserva(session_id), CLAVE_RESERVADOS, CLAVE_VENCIMIENTOS],
+               [product_id, cantidad, int(time.time()) + carrito_repo.TTL_CARRITO, session_id])
+    carrito = ([carrito_repo.clave_carrito(session_id)],
+               [carrito_repo.campo_producto(product_id), cantidad, carrito_repo.TTL_CARRITO,
+                carrito_repo.MAX_ITEMS_CARRITO])
+    cancelar = ([clave_stock(product_id), clave_reserva(session_id), CLAVE_RESERVADOS], [product_id, cantidad])
+    return reserva, carrito, cancelar
+
+
+def _reservar_repartido(session_id, product_id, cantidad):
+    (keys, args), carrito, cancelar = _args_repartido(session_id, product_id, cantidad)
+    script = _script("reservar_stock", _LUA_RESERVAR_STOCK)
+    codigo, restante = script(keys=keys, args=args, client=get_redis_client())
+    if codigo == -1:
+        cargar([product_id])
+        codigo, restante = script(keys=keys, args=args, client=get_redis_client())
+    if codigo < 0:
+        return None, restante
+    try:
+        en_carrito = _script("sumar_carrito", _LUA_SUMAR_CARRITO)(
+            keys=carrito[0], args=carrito[1], client=get_redis_client_sesion(session_id))
+    except redis.RedisError:
+        _script("cancelar_reserva", _LUA_CANCELAR_RESERVA)(
+            keys=cancelar[0], args=cancelar[1], client=get_redis_client())
+        raise
+    if en_carrito == -3:
+        _script("cancelar_reserva", _LUA_CANCELAR_RESERVA)(
+            keys=cancelar[0], args=cancelar[1], client=get_redis_client())
+    return _resultado_reservar(en_carrito, restante)
+
+
+async def _reservar_repartido_async(db, session_id, product_id, cantidad):
+    (keys, args), carrito, cancelar = _args_repartido(session_id, product_id, cantidad)
+    script = _script("reservar_stock", _LUA_RESERVAR_STOCK, asincrono=True)
+    codigo, restante = await script(keys=keys, args=args, client=get_async_redis_client())
+    if codigo == -1:
+        await cargar_async(db, [product_id])
+        codigo, restante = await script(keys=keys, args=args, client=get_async_redis_client())
+    if codigo < 0:
+        return None, restante
+    try:
+        en_carrito = await _script("sumar_carrito", _LUA_SUMAR_CARRITO, asincrono=True)(
+            keys=carrito[0], args=carrito[1], client=get_async_redis_client_sesion(session_id))
+    except redis.RedisError:
+        await _script("cancelar_reserva", _LUA_CANCELAR_RESERVA, asincrono=True)(
+            keys=cancelar[0], args=cancelar[1], client=get_async_redis_client())
+        raise
+    if en_carrito == -3:
+        await _script("cancelar_reserva", _LUA_CANCELAR_RESERVA, asincrono=True)(
+            keys=cancelar[0], args=cancelar[1], client=get_async_redis_client())
+    return _resultado_reservar(en_carrito, restante)
+
+
+def reservar(session_id, product_id, cantidad):
+    """
+    Reserva `cantidad` unidades y las suma al carrito en un solo paso.
+    Devuelve (cantidad en el carrito, stock restante); la cantidad es None si
+    no hay stock suficiente (y en ese caso no se modifica nada). Lanza
+    carrito_repo.CarritoLleno si es un producto nuevo y el carrito ya tiene
+    MAX_ITEMS_CARRITO.
+    """
+    if REPARTIDO:
+        return _reservar_repartido(session_id, product_id, cantidad)
+    keys, args = _args_reservar(session_id, product_id, cantidad)
+    script = _script("reservar", _LUA_RESERVAR)
+    en_carrito, restante = script(keys=keys, args=args, client=get_redis_client())
+    if en_carrito == -1:
+        cargar([product_id])
+        en_carrito, restante = script(keys=keys, args=args, client=get_redis_client())
+    return _resultado_reservar(en_carrito, restante)
+
+
+async def reservar_async(db, session_id, product_id, cantidad):
+    if REPARTIDO:
+        return await _reservar_repartido_async(db, session_id, product_id, cantidad)
+    keys, args = _args_reservar(session_id, product_id, cantidad)
+    script = _script("reservar", _LUA_RESERVAR, asincrono=True)
+    en_carrito, restante = await script(keys=keys, args=args, client=get_async_redis_client())
+    if en_carrito == -1:
+        await cargar_async(db, [product_id])
+        en_carrito, restante = await script(keys=keys, args=args, client=get_async_redis_client())
+    return _resultado_reservar(en_carrito, restante)
+
+
+# --- Ventas (confirmar_pedido) ---
+
+def _args_confirmar(session_id, cantidades, parcial):
+    keys = [clave_reserva(session_id), CLAVE_RESERVADOS, CLAVE_PENDIENTES, CLAVE_VENCIMIENTOS]
+    args = ["1" if parcial else "0", session_id, PREFIJO_STOCK] + _pares(cantidades)
+    return keys, args
+
+
+def _resultado_confirmar(ids):
+    return [ObjectId(i.decode("utf-8")) for i in ids]
+
+
+def confirmar(session_id, cantidades, parcial=False):
+    """
+    Convierte en venta las unidades del pedido ({product_id: cantidad}),
+    usando primero lo que el carrito tenía reservado. Devuelve (aceptado,
+    sin_stock): sin parcial, el pedido se rechaza entero si falta alguna línea.
+    """
+    keys, args = _args_confirmar(session_id, cantidades, parcial)
+    script = _script("confirmar", _LUA_CONFIRMAR)
+    codigo, ids = script(keys=keys, args=args, client=get_redis_client())
+    if codigo == 1:
+        cargar(_resultado_confirmar(ids))
+        codigo, ids = script(keys=keys, args=args, client=get_redis_client())
+    return codigo == 0, _resultado_confirmar(ids)
+
+
+async def confirmar_async(db, session_id, cantidades, parcial=False):
+    keys, args = _args_confirmar(session_id, cantidades, parcial)
+    script = _script("confirmar", _LUA_CONFIRMAR, asincrono=True)
+    codigo, ids = await script(keys=keys, args=args, client=get_async_redis_client())
+    if codigo == 1:
+        await cargar_async(db, _resultado_confirmar(ids))
+        codigo, ids = await script(keys=keys, args=args, client=get_async_redis_client())
+    return codigo == 0, _resultado_confirmar(ids)
+
+
+def revertir(cantidades):
+    """Deshace confirmar() para {product_id: cantidad} (el pedido no se guardó)."""
+    if cantidades:
+        _script("revertir", _LUA_REVERTIR)(
+            keys=[CLAVE_PENDIENTES], args=[PREFIJO_STOCK] + _pares(cantidades),
+            client=get_redis_client())
+
+
+async def revertir_async(cantidades):
+    if cantidades:
+        await _script("revertir", _LUA_REVERTIR, asincrono=True)(
+            keys=[CLAVE_PENDIENTES], args=[PREFIJO_STOCK] + _pares(cantidades),
+            client=get_async_redis_client())
+
+
+# --- Trabajo en segundo plano ---
+
+def _liberar_repartido(cantidad):
+    r = get_redis_client()
+    ahora = int(time.time())
+    vencidas = r.zrangebyscore(CLAVE_VENCIMIENTOS, "-inf", ahora, start=0, num=cantidad)
+    vencidas = [sid.decode("utf-8") for sid in vencidas]
+    if not vencidas:
+        return 0
+    args = [ahora, PREFIJO_RESERVA, PREFIJO_STOCK]
+    for session_id, ttl in carrito_repo.ttl_carritos(vencidas).items():
+        args += [session_id, ttl]
+    return _script("liberar_sesiones", _LUA_LIBERAR_SESIONES)(
+        keys=[CLAVE_VENCIMIENTOS, CLAVE_RESERVADOS], args=args, client=r)
+
+
+def liberar_vencidas(cantidad=LIBERAR_POR_VUELTA):
+    """Devuelve al stock las reservas de carritos vencidos. Devuelve cuántas liberó."""
+    if REPARTIDO:
+        return _liberar_repartido(cantidad)
+    args = [int(time.time()), cantidad, carrito_repo.clave_carrito(""), PREFIJO_RESERVA, PREFIJO_STOCK]
+    if carrito_repo.COMPACTO:
+        # Carritos todavía sin migrar (scripts/migrar_redis.py)
+        args.append(carrito_repo.clave_carrito("", compacto=False))
+    return _script("liberar", _LUA_LIBERAR)(
+        keys=[CLAVE_VENCIMIENTOS, CLAVE_RESERVADOS], args=args, client=get_redis_client())
+
+
+def _tomar_lock(r):
+    token = uuid.uuid4().hex
+    return token if r.set(CLAVE_LOCK, token, nx=True, px=TTL_LOCK_MS) else None
+
+
+def _esperar_lock(r):
+    token = _tomar_lock(r)
+    while token is None:
+        time.sleep(0.1)
+        token = _tomar_lock(r)
+    return token
+
+
+def _soltar_lock(r, token):
+    _script("soltar_lock", _LUA_SOLTAR_LOCK)(keys=[CLAVE_LOCK], args=[token], client=r)
+
+
+def _volcar(r):
+    lote, items = _script("tomar_pendientes", _LUA_TOMAR_PENDIENTES)(
+        keys=[CLAVE_PENDIENTES, CLAVE_VOLCANDO, CLAVE_LOTE], args=[uuid.uuid4().hex], client=r)
+    if not lote:
+        return 0
+    lote = lote.decode("utf-8")
+    cantidades = {
+        ObjectId(items[i].decode("utf-8")): int(items[i + 1])
+        for i in range(0, len(items), 2)
+        if int(items[i + 1])
+    }
+    if cantidades:
+        # inventario_lote hace idempotente el reintento de un volcado interrumpido
+        get_mongo_client()["productos"].bulk_write([
+            UpdateOne({"_id": oid, "inventario_lote": {"$ne": lote}},
+                      {"$inc": {"stock": -cantidad}, "$set": {"inventario_lote": lote}})
+            for oid, cantidad in cantidades.items()
+        ], ordered=False)
+    r.delete(CLAVE_VOLCANDO, CLAVE_LOTE)
+    cache_productos.invalidar(*cantidades)
+    return len(cantidades)
+
+
+def volcar():
+    """
+    Descuenta de productos.stock las ventas pendientes con un único bulk_write.
+    Devuelve la cantidad de productos actualizados (0 si otro proceso está volcando).
+    """
+    r = get_redis_client()
+    token = _tomar_lock(r)
+    if not token:
+        return 0
+    try:
+        return _volcar(r)
+    finally:
+        _soltar_lock(r, token)
+
+
+def retener_volcado():
+    """
+    Vuelca las ventas pendientes y se queda con el lock de volcado (esperando si
+    otro proceso está volcando). Devuelve el token para soltar_volcado().
+    """
+    r = get_redis_client()
+    token = _esperar_lock(r)
+    try:
+        _volcar(r)
+    except Exception:
+        _soltar_lock(r, token)
+        raise
+    return token
+
+
+def soltar_volcado(token):
+    _soltar_lock(get_redis_client(), token)
+
+
+@contextmanager
+def sin_pendientes():
+    """
+    Para escribir productos.stock a mano ($set): si quedaran ventas sin volcar,
+    el próximo volcado las descontaría del valor nuevo. Dentro del bloque no
+    hay volcados; hay que llamar a recargar() antes de salir.
+    """
+    token = retener_volcado()
+    try:
+        yield
+    finally:
+        soltar_volcado(token)
+
+
+def reconciliar(corregir=False, batch=BATCH_RECONCILIAR):
+    """
+    Compara cada contador con productos.stock - reservados - pendientes, después
+    de volcar lo pendiente. Devuelve [(id, actual, esperado)]; con corregir=True
+    además los ajusta (y borra los de productos que ya no existen).
+    """
+    r = get_redis_client()
+    token = _esperar_lock(r)
+    try:
+        _volcar(r)
+        productos = get_mongo_client()["productos"]
+        desvios = []
+        ids = []
+        for clave in r.scan_iter(match=PREFIJO_STOCK + "*", count=batch):
+            ids.append(clave.decode("utf-8")[len(PREFIJO_STOCK):])
+            if len(ids) >= batch:
+                desvios += _reconciliar_lote(r, productos, ids, corregir)
+                ids = []
+        if ids:
+            desvios += _reconciliar_lote(r, productos, ids, corregir)
+        return desvios
+    finally:
+        _soltar_lock(r, token)
+
+
+def _reconciliar_lote(r, productos, ids, corregir):
+    stock = {str(doc["_id"]): int(doc.get("stock", 0)) for doc in productos.find(
+        {"_id": {"$in": [ObjectId(i) for i in ids if ObjectId.is_valid(i)]}}, {"stock": 1})}
+    args = ["1" if corregir else "0", PREFIJO_STOCK]
+    for producto_id in ids:
+        args += [producto_id, stock.get(producto_id, -1)]
+    valores = _script("reconciliar", _LUA_RECONCILIAR)(
+        keys=[CLAVE_RESERVADOS, CLAVE_PENDIENTES], args=args, client=r)
+    return [
+        (valores[i].decode("utf-8"), int(valores[i + 1]), int(valores[i + 2]))
+        for i in range(0, len(valores), 3)
+    ]
+
+
+def _trabajar():
+    while True:
+        try:
+            liberar_vencidas()
+            volcar()
+        except Exception:
+            log.exception("Error en el volcado de inventario")
+        time.sleep(INTERVALO)
+
+
+def iniciar_worker():
+    """Lanza el thread de liberación y volcado de este proceso (uno por pid)."""
+    global _worker_pid
+    if os.environ.get("INVENTARIO_WORKER", "1") != "1":
+        return
+    pid = os.getpid()
+    if _worker_pid == pid:
+        return
+    with _worker_lock:
+        if _worker_pid != pid:
+            threading.Thread(target=_trabajar, name="inventario", daemon=True).start()
+            _worker_pid = pid
@@ -0,0 +1,243 @@
+# limites.py
+import logging
+import math
+import os
+import threading
+import time
+
+import redis
+from flask import g, request, jsonify, session
+
+import sesiones
+from metricas import RECHAZOS, mongo_en_uso, redis_en_uso
+from redis_config import get_redis_client, get_async_redis_client
+
+# Control de admisión antes de cada request (before_request):
+#   1. Rate limiting con token buckets en Redis, por ruta y por sesión (o IP
+#      si no hay sesión) y, si hay login, también por usuario. Sin tokens: 429.
+#   2. Descarte de carga por proceso: cada clase de ruta puede ocupar solo una
+#      parte de los requests en vuelo, y cuando los pools de MongoDB o Redis
+#      están casi agotados se rechaza todo lo que no es checkout. Respuesta: 503.
+# Ambas respuestas traen Retry-After. El checkout tiene prioridad: límites más
+# altos y acceso a todos los lugares en vuelo, así la compra sigue siendo
+# rápida cuando la navegación satura los workers.
+#
+# Límites por clase: LIMITE_<CLASE>="capacidad,tokens_por_segundo", por ejemplo
+# LIMITE_CARRITO="30,5". Con LIMITES=0 no se aplica nada. Si Redis no responde
+# el rate limiting se omite (se prefiere atender a rechazar).
+
+ACTIVO = os.environ.get("LIMITES", "1") == "1"
+
+# Endpoint -> clase; el resto es "catalogo" (GET) o "general".
+# Login tiene su propia clase y no es checkout: es el blanco típico de
+# floods y fuerza bruta, y con la prioridad del checkout una ola de logins
+# se comería los lugares reservados para comprar. Su bucket es más estricto
+# y, como las demás clases, se descarta cuando los pools se saturan.
+CLASES_ENDPOINT = {
+    "tienda.confirmar_pedido": "checkout",
+    "tienda.facturar_pedido": "checkout",
+    "tienda.login": "login",
+    "tienda.agregar_carrito": "carrito",
+    "tienda.ver_carrito": "carrito",
+    "confirmar_pedido": "checkout",
+    "facturar_pedido": "checkout",
+    "login": "login",
+    "agregar_carrito": "carrito",
+    "ver_carrito": "carrito",
+}
+EXENTOS = {"tienda.health", "health", "metrics", "static"}
+
+# (capacidad del bucket, tokens por segundo) por identidad y por ruta
+LIMITES_DEFECTO = {
+    "checkout": (20, 2),
+    "login": (5, 0.2),
+    "carrito": (30, 5),
+    "catalogo": (100, 20),
+    "general": (60, 10),
+}
+
+# Requests en vuelo por proceso (los threads del worker). Lo que no es checkout
+# deja siempre RESERVA_CHECKOUT lugares libres, y cada clase usa como mucho su cuota.
+EN_VUELO_MAXIMO = int(os.environ.get("ADMISION_EN_VUELO", os.environ.get("WEB_THREADS", 8)))
+RESERVA_CHECKOUT = int(os.environ.get("ADMISION_RESERVA_CHECKOUT", max(1, EN_VUELO_MAXIMO // 4)))
+CUOTA_EN_VUELO = {"checkout": 1.0, "login": 0.25, "carrito": 0.5, "catalogo": 0.75, "general": 0.5}
+# Uso de los pools a partir del cual solo se admite checkout
+UMBRAL_POOL = float(os.environ.get("ADMISION_UMBRAL_POOL", 0.9))
+MONGO_POOL = int(os.environ.get("MONGO_MAX_POOL_SIZE", 100))
+REDIS_POOL = int(os.environ.get("REDIS_MAX_CONNECTIONS", 100))
+
+log = logging.getLogger(__name__)
+
+# KEYS = buckets; ARGV = ahora (ms), capacidad, tokens por segundo
+# Descuenta un token de cada bucket solo si todos tienen. Devuelve
+# {1, 0} si se admite o {0, ms hasta tener un token en todos}
+_LUA_TOKENS = """
+local ahora = tonumber(ARGV[1])
+local capacidad = tonumber(ARGV[2])
+local tasa = tonumber(ARGV[3]) / 1000
+local tokens = {}
+local espera = 0
+for i, k in ipairs(KEYS) do
+  local datos = redis.call('HMGET', k, 't', 'ts')
+  local t = tonumber(datos[1]) or capacidad
+  local ts = tonumber(datos[2]) or ahora
+  t = math.min(capacidad, t + math.max(0, ahora - ts) * tasa)
+  tokens[i] = t
+  if t < 1 then
+    espera = math.max(espera, math.ceil((1 - t) / tasa))
+  end
+end
+if espera > 0 then
+  return {0, espera}
+end
+local ttl = math.ceil(capacidad / tasa)
+for i, k in ipairs(KEYS) do
+  redis.call('HSET', k, 't', tokens[i] - 1, 'ts', ahora)
+  redis.call('PEXPIRE', k, ttl)
+end
+return {1, 0}
+"""
+
+_scripts = {}
+_en_vuelo = {clase: 0 for clase in LIMITES_DEFECTO}
+_en_vuelo_lock = threading.Lock()
+
+
+def _script(nombre, fuente, asincrono=False):
+    clave = (nombre, asincrono)
+    if clave not in _scripts:
+        cliente = get_async_redis_client() if asincrono else get_redis_client()
+        _scripts[clave] = cliente.register_script(fuente)
+    return _scripts[clave]
+
+
+def _leer_limite(clase):
+    valor = os.environ.get(f"LIMITE_{clase.upper()}")
+    if not valor:
+        return LIMITES_DEFECTO[clase]
+    capacidad, tasa = valor.split(",")
+    return int(capacidad), float(tasa)
+
+
+LIMITES = {clase: _leer_limite(clase) for clase in LIMITES_DEFECTO}
+
+
+def clase_de(endpoint, metodo):
+    if endpoint in CLASES_ENDPOINT:
+        return CLASES_ENDPOINT[endpoint]
+    return "catalogo" if metodo in ("GET", "HEAD") else "general"
+
+
+def claves_bucket(endpoint, session_id, user_id, ip):
+    identidad = f"s:{session_id}" if session_id else f"ip:{ip}"
+    claves = [f"limite:{endpoint}:{identidad}"]
+    if user_id:
+        claves.append(f"limite:{endpoint}:u:{user_id}")
+    return claves
+
+
+def _rechazo(clase, motivo, codigo, segundos):
+    RECHAZOS.labels(clase, motivo).inc()
+    respuesta = jsonify({"error": "Demasiados requests, reintentar más tarde" if codigo == 429
+                         else "Servidor saturado, reintentar más tarde"})
+    respuesta.status_code = codigo
+    respuesta.headers["Retry-After"] = str(max(1, math.ceil(segundos)))
+    return respuesta
+
+
+def _pools_saturados():
+    return (mongo_en_uso() >= MONGO_POOL * UMBRAL_POOL
+            or redis_en_uso() >= REDIS_POOL * UMBRAL_POOL)
+
+
+def _ocupar(clase):
+    # Reserva un lugar en vuelo para la clase; False si ya usó su cuota
+    with _en_vuelo_lock:
+        if _en_vuelo[clase] >= max(1, int(EN_VUELO_MAXIMO * CUOTA_EN_VUELO[clase])):
+            return False
+        if clase != "checkout":
+            otros = sum(n for c, n in _en_vuelo.items() if c != "checkout")
+            if otros >= max(1, EN_VUELO_MAXIMO - RESERVA_CHECKOUT):
+                return False
+        _en_vuelo[clase] += 1
+        return True
+
+
+def _liberar(clase):
+    with _en_vuelo_lock:
+        _en_vuelo[clase] -= 1
+
+
+def _argumentos(clase):
+    capacidad, tasa = LIMITES[clase]
+    return [int(time.time() * 1000), capacidad, tasa]
+
+
+# --- Flask (app.py) ---
+
+def _admitir():
+    endpoint = request.endpoint
+    if not ACTIVO or endpoint is None or endpoint in EXENTOS:
+        return None
+    clase = clase_de(endpoint, request.method)
+
+    if clase != "checkout" and _pools_saturados():
+        return _rechazo(clase, "pool", 503, 1)
+
+    session_id = session.get("user_session_id")
+    try:
+        # El usuario queda resuelto en g para la ruta (sesiones.usuario_actual)
+        user_id = sesiones.usuario_actual() if session_id else None
+        claves = claves_bucket(endpoint, session_id, user_id, request.remote_addr)
+        admitido, espera_ms = _script("tokens", _LUA_TOKENS)(
+            keys=claves, args=_argumentos(clase), client=get_redis_client())
+    except redis.RedisError:
+        log.warning("Rate limiting omitido: Redis no responde")
+        admitido = 1
+    if not admitido:
+        return _rechazo(clase, "tokens", 429, espera_ms / 1000)
+
+    if not _ocupar(clase):
+        return _rechazo(clase, "en_vuelo", 503, 1)
+    g.limites_clase = clase
+    return None
+
+
+def _salir(exc):
+    clase = g.pop("limites_clase", None)
+    if clase:
+        _liberar(clase)
+
+
+def registrar(app):
+    """Agrega el control de admisión a la app (después de instrumentar, para medir los rechazos)."""
+    app.before_request(_admitir)
+    app.teardown_request(_salir)
+
+
+# --- Quart (app_async.py) ---
+
+async def _admitir_async():
+    from quart import request as request_async, session as session_async, jsonify as jsonify_async
+    endpoint = request_async.endpoint
+    if not ACTIVO or endpoint is None or endpoint in EXENTOS:
+        return None
+    clase = clase_de(endpoint, request_async.method)
+
+    # En el modo asíncrono no hay threads que proteger: solo rate limiting
+    session_id = session_async.get("user_session_id")
+    claves = claves_bucket(endpoint, session_id, None, request_async.remote_addr)
+    try:
+        admitido, espera_ms = await _script("tokens", _LUA_TOKENS, asincrono=True)(
+            keys=claves, args=_argumentos(clase), client=get_async_redis_client())
+    except redis.RedisError:
+        admitido = 1
+    if not admitido:
+        RECHAZOS.labels(clase, "tokens").inc()
+        respuesta = jsonify_async({"error": "Demasiados requests, reintentar más tarde"})
+        return respuesta, 429, {"Retry-After": str(max(1, math.ceil(espera_ms / 1000)))}
+    return None
+
+
+def registrar_async(app):
+    app.before_request(_admitir_async)
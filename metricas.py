@@ -0,0 +1,349 @@
+# metricas.py
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as Conteo
+from contextvars import ContextVar
+
+import redis
+from flask import g, request, Response
+from pymongo import monitoring
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess,
+)
+
+import db_config
+import redis_config
+
+# Instrumentación del camino caliente:
+#   - MongoDB: CommandListener (comandos y tiempo) y ConnectionPoolListener (uso del pool)
+#   - Redis: cliente que mide cada comando y cada pipeline
+#   - Por request: tiempo total, tiempo en MongoDB y en Redis, cantidad de comandos
+# Los clientes se instrumentan desde aquí (instrumentar_clientes), no desde
+# db_config / redis_config, que también usan los scripts sin Flask.
+# Todo se expone en GET /metrics en formato Prometheus. Con varios workers
+# (gunicorn) se usa el modo multiproceso de prometheus_client: definir
+# PROMETHEUS_MULTIPROC_DIR apuntando a un directorio vacío.
+#
+# Opcionales:
+#   SERVER_TIMING=1          agrega la cabecera Server-Timing con el desglose
+#   PERFIL_MUESTREO=0.01     fracción de requests a perfilar con el muestreador
+#   PERFIL_UMBRAL_MS=500     solo se reportan los perfilados más lentos que esto
+#   PERFIL_DIR=/tmp/perfiles guarda las pilas (formato "folded", para flamegraphs)
+
+log = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter("http_requests_total", "Requests atendidos", ["ruta", "metodo", "codigo"])
+DURACION = Histogram("http_request_duracion_segundos", "Duración total del request",
+                     ["ruta", "metodo"], buckets=BUCKETS)
+TIEMPO_MONGO = Histogram("http_request_mongo_segundos", "Tiempo en MongoDB por request",
+                         ["ruta"], buckets=BUCKETS)
+TIEMPO_REDIS = Histogram("http_request_redis_segundos", "Tiempo en Redis por request",
+                         ["ruta"], buckets=BUCKETS)
+COMANDOS_POR_REQUEST = Histogram("http_request_comandos", "Comandos a las BD por request",
+                                 ["ruta", "bd"], buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 100))
+
+MONGO_COMANDOS = Counter("mongo_comandos_total", "Comandos enviados a MongoDB", ["comando", "resultado"])
+MONGO_SEGUNDOS = Histogram("mongo_comando_segundos", "Duración de los comandos de MongoDB",
+                           ["comando"], buckets=BUCKETS)
+MONGO_POOL_EN_USO = Gauge("mongo_pool_conexiones_en_uso", "Conexiones de MongoDB prestadas",
+                          multiprocess_mode="livesum")
+MONGO_POOL_ESPERAS = Counter("mongo_pool_checkout_fallidos_total",
+                             "Checkouts del pool de MongoDB que fallaron", ["motivo"])
+
+REDIS_COMANDOS = Counter("redis_comandos_total", "Comandos enviados a Redis", ["comando"])
+REDIS_SEGUNDOS = Histogram("redis_comando_segundos", "Duración de los comandos de Redis",
+                           ["comando"], buckets=BUCKETS)
+REDIS_POOL_EN_USO = Gauge("redis_pool_conexiones_en_uso", "Conexiones de Redis prestadas",
+                          multiprocess_mode="livesum")
+
+CACHE_PRODUCTOS = Counter("cache_productos_consultas_total", "Consultas al cache de productos",
+                          ["resultado"])
+
+RECHAZOS = Counter("http_rechazos_total", "Requests rechazados por limites.py", ["clase", "motivo"])
+
+# Tiempos acumulados del request en curso (None fuera de un request)
+_request_actual = ContextVar("metricas_request", default=None)
+
+
+def _acumular(bd, segundos):
+    datos = _request_actual.get()
+    if datos is not None:
+        datos[bd + "_s"] += segundos
+        datos[bd + "_cmds"] += 1
+
+
+# --- MongoDB ---
+
+class ListenerComandos(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        segundos = event.duration_micros / 1e6
+        MONGO_COMANDOS.labels(event.command_name, "ok").inc()
+        MONGO_SEGUNDOS.labels(event.command_name).observe(segundos)
+        _acumular("mongo", segundos)
+
+    def failed(self, event):
+        segundos = event.duration_micros / 1e6
+        MONGO_COMANDOS.labels(event.command_name, "error").inc()
+        MONGO_SEGUNDOS.labels(event.command_name).observe(segundos)
+        _acumular("mongo", segundos)
+
+
+# Conexiones de MongoDB prestadas en este proceso (el gauge de Prometheus
+# puede ser multiproceso; limites.py necesita el valor local)
+_mongo_en_uso = 0
+_mongo_en_uso_lock = threading.Lock()
+
+
+def _sumar_mongo_en_uso(delta):
+    global _mongo_en_uso
+    with _mongo_en_uso_lock:
+        _mongo_en_uso += delta
+
+
+def mongo_en_uso():
+    return _mongo_en_uso
+
+
+class ListenerPool(monitoring.ConnectionPoolListener):
+    def connection_checked_out(self, event):
+        MONGO_POOL_EN_USO.inc()
+        _sumar_mongo_en_uso(1)
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_EN_USO.dec()
+        _sumar_mongo_en_uso(-1)
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_ESPERAS.labels(str(event.reason)).inc()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+def listeners_mongo():
+    return [ListenerComandos(), ListenerPool()]
+
+
+# --- Redis ---
+
+class PipelineInstrumentado(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            segundos = time.perf_counter() - inicio
+            REDIS_COMANDOS.labels("PIPELINE").inc()
+            REDIS_SEGUNDOS.labels("PIPELINE").observe(segundos)
+            _acumular("redis", segundos)
+
+
+class RedisInstrumentado(redis.Redis):
+    """Cliente de Redis que registra cada comando (los scripts Lua cuentan como EVALSHA)."""
+
+    def execute_command(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            segundos = time.perf_counter() - inicio
+            comando = str(args[0]).upper() if args else "?"
+            REDIS_COMANDOS.labels(comando).inc()
+            REDIS_SEGUNDOS.labels(comando).observe(segundos)
+            _acumular("redis", segundos)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return PipelineInstrumentado(self.connection_pool, self.response_callbacks,
+                                     transaction, shard_hint)
+
+
+def redis_en_uso():
+    """Conexiones del pool de Redis de este proceso prestadas en este momento."""
+    return len(getattr(redis_config.get_redis_pool(), "_in_use_connections", ()))
+
+
+def _actualizar_pool_redis():
+    REDIS_POOL_EN_USO.set(redis_en_uso())
+
+
+# --- Muestreador de perfiles ---
+
+class Muestreador:
+    """
+    Perfilador por muestreo: un thread toma cada `intervalo` segundos la pila
+    de los threads registrados (sys._current_frames) y cuenta cada pila.
+    """
+
+    def __init__(self, intervalo=0.005):
+        self.intervalo = intervalo
+        self._hilos = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _asegurar_thread(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._bucle, name="muestreador-perfil", daemon=True).start()
+
+    def iniciar(self, thread_id):
+        with self._lock:
+            self._asegurar_thread()
+            self._hilos[thread_id] = Conteo()
+
+    def detener(self, thread_id):
+        with self._lock:
+            return self._hilos.pop(thread_id, Conteo())
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.intervalo)
+            with self._lock:
+                if not self._hilos:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, pilas in self._hilos.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        pilas[_pila(frame)] += 1
+
+
+def _pila(frame):
+    partes = []
+    while frame is not None:
+        codigo = frame.f_code
+        partes.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(partes))
+
+
+_muestreador = Muestreador()
+
+
+def _reportar_perfil(ruta, duracion_ms, pilas):
+    total = sum(pilas.values())
+    if not total:
+        return
+    log.warning("Request lento %s (%.1f ms), %d muestras. Pilas más frecuentes:", ruta, duracion_ms, total)
+    for pila, n in pilas.most_common(5):
+        log.warning("  %5.1f%%  %s", 100 * n / total, pila.rsplit(";", 4)[-4:])
+    directorio = os.environ.get("PERFIL_DIR")
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        nombre = f"{int(time.time())}_{os.getpid()}_{ruta.strip('/').replace('/', '_') or 'raiz'}.folded"
+        with open(os.path.join(directorio, nombre), "w") as f:
+            for pila, n in pilas.items():
+                f.write(f"{pila} {n}\n")
+
+
+# --- Integración con Flask ---
+
+def _ruta():
+    return request.url_rule.rule if request.url_rule else "sin_ruta"
+
+
+def _antes():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_token = _request_actual.set({"mongo_s": 0.0, "mongo_cmds": 0, "redis_s": 0.0, "redis_cmds": 0})
+    g.metricas_perfil = random.random() < float(os.environ.get("PERFIL_MUESTREO", 0))
+    if g.metricas_perfil:
+        _muestreador.iniciar(threading.get_ident())
+
+
+def _despues(respuesta):
+    inicio = g.pop("metricas_inicio", None)
+    token = g.pop("metricas_token", None)
+    if inicio is None or token is None:
+        return respuesta
+    duracion = time.perf_counter() - inicio
+    datos = _request_actual.get()
+    _request_actual.reset(token)
+    ruta = _ruta()
+
+    REQUESTS.labels(ruta, request.method, str(respuesta.status_code)).inc()
+    DURACION.labels(ruta, request.method).observe(duracion)
+    TIEMPO_MONGO.labels(ruta).observe(datos["mongo_s"])
+    TIEMPO_REDIS.labels(ruta).observe(datos["redis_s"])
+    COMANDOS_POR_REQUEST.labels(ruta, "mongo").observe(datos["mongo_cmds"])
+    COMANDOS_POR_REQUEST.labels(ruta, "redis").observe(datos["redis_cmds"])
+    _actualizar_pool_redis()
+
+    if os.environ.get("SERVER_TIMING") == "1":
+        app_s = max(0.0, duracion - datos["mongo_s"] - datos["redis_s"])
+        respuesta.headers["Server-Timing"] = (
+            f'mongo;dur={datos["mongo_s"] * 1000:.2f};desc="{datos["mongo_cmds"]} cmds", '
+            f'redis;dur={datos["redis_s"] * 1000:.2f};desc="{datos["redis_cmds"]} cmds", '
+            f'app;dur={app_s * 1000:.2f}, total;dur={duracion * 1000:.2f}'
+        )
+
+    if g.pop("metricas_perfil", False):
+        pilas = _muestreador.detener(threading.get_ident())
+        if duracion * 1000 >= float(os.environ.get("PERFIL_UMBRAL_MS", 500)):
+            _reportar_perfil(ruta, duracion * 1000, pilas)
+    return respuesta
+
+
+def _cerrar(exc):
+    # Si el request falló antes de after_request, igual se limpia el perfil
+    if g.pop("metricas_perfil", False):
+        _muestreador.detener(threading.get_ident())
+
+
+def metrics():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+_clientes_instrumentados = False
+
+
+def instrumentar_clientes():
+    """Mide los clientes de MongoDB y Redis que se creen desde ahora (una vez por proceso)."""
+    global _clientes_instrumentados
+    if _clientes_instrumentados:
+        return
+    db_config.agregar_listeners(*listeners_mongo())
+    redis_config.usar_clase_cliente(RedisInstrumentado)
+    _clientes_instrumentados = True
+
+
+def instrumentar(app):
+    """Registra los hooks de medición y la ruta /metrics en la app."""
+    instrumentar_clientes()
+    app.before_request(_antes)
+    app.after_request(_despues)
+    app.teardown_request(_cerrar)
+    app.add_url_rule("/metrics", "metrics", metrics, methods=["GET"])
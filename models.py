@@ -1,5 +1,6 @@
 # models.py
 from dataclasses import dataclass, field
+from datetime import datetime
 from typing import List, Dict
 from bson import ObjectId
 
@@ -8,7 +9,8 @@ class Usuario:
     _id: ObjectId = field(default_factory=ObjectId)
     nombre: str = ""
     email: str = ""
-    categoria: str = ""  # TOP, MEDIUM, LOW
+    categoria: str = ""  # TOP, MEDIUM, LOW (la reasigna categorias.py)
+    actividad: Dict = field(default_factory=dict)  # {pedidos, total_pagado, ultima_compra}
 
 @dataclass
 class Producto:
@@ -25,3 +27,4 @@ class Pedido:
     items: List[Dict] = field(default_factory=list)  # [{product_id, cantidad, precio_unitario}, ...]
     total: float = 0.0
     estado: str = "pendiente"  # pendiente, pagado, enviado, etc.
+    fecha: datetime = field(default_factory=datetime.utcnow)
@@ -0,0 +1,138 @@
+# negociacion.py
+import gzip
+import os
+
+from flask import Request
+from werkzeug.exceptions import BadRequest
+
+from serializacion import MIMETYPES_MSGPACK, loads_msgpack, msgpack
+
+try:
+    import zstandard
+except ImportError:  # sin zstandard solo se comprime con gzip
+    zstandard = None
+
+# Formato de los cuerpos de request y compresión de las respuestas:
+#   - Los POST/PUT pueden enviar el cuerpo en MessagePack con
+#     "Content-Type: application/msgpack"; request.json / get_json() lo
+#     decodifican igual que un JSON, así los handlers no cambian.
+#   - Las respuestas de más de COMPRESION_MINIMO bytes se comprimen con zstd o
+#     gzip según Accept-Encoding (zstd primero si está instalado). Por debajo
+#     del umbral la compresión cuesta más CPU de lo que ahorra en la red.
+# El formato de la respuesta (JSON o MessagePack) lo elige serializacion.py.
+#
+# COMPRESION_MINIMO=0 desactiva la compresión (por ejemplo, si ya comprime un proxy).
+
+COMPRESION_MINIMO = int(os.environ.get("COMPRESION_MINIMO", 1024))
+NIVEL_GZIP = int(os.environ.get("COMPRESION_NIVEL_GZIP", 5))
+NIVEL_ZSTD = int(os.environ.get("COMPRESION_NIVEL_ZSTD", 3))
+COMPRIMIBLES = ("application/json",) + MIMETYPES_MSGPACK
+
+
+def _es_msgpack(mimetype):
+    return mimetype in MIMETYPES_MSGPACK
+
+
+def _decodificar(datos, silent):
+    if msgpack is None:
+        if silent:
+            return None
+        raise BadRequest("MessagePack no disponible en el servidor")
+    try:
+        return loads_msgpack(datos)
+    except Exception:
+        if silent:
+            return None
+        raise BadRequest("Cuerpo MessagePack inválido")
+
+
+class RequestNegociado(Request):
+    """Request de Flask que también acepta cuerpos en MessagePack."""
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if not _es_msgpack(self.mimetype):
+            return super().get_json(force=force, silent=silent, cache=cache)
+        return _decodificar(self.get_data(cache=cache), silent)
+
+
+def elegir_codificacion(accept_encodings):
+    if zstandard is not None and accept_encodings["zstd"]:
+        return "zstd"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def comprimir(datos, codificacion):
+    if codificacion == "zstd":
+        return zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(datos)
+    return gzip.compress(datos, compresslevel=NIVEL_GZIP)
+
+
+def _comprimible(respuesta):
+    return (COMPRESION_MINIMO > 0
+            and respuesta.status_code not in (204, 206, 304)
+            and respuesta.mimetype in COMPRIMIBLES
+            and "Content-Encoding" not in respuesta.headers)
+
+
+def _aplicar(respuesta, datos, codificacion):
+    respuesta.set_data(comprimir(datos, codificacion))
+    respuesta.headers["Content-Encoding"] = codificacion
+
+
+# --- Flask (app.py) ---
+
+def _comprimir_respuesta(respuesta):
+    from flask import request
+    if not _comprimible(respuesta) or respuesta.is_streamed or respuesta.direct_passthrough:
+        return respuesta
+    # Aunque no se comprima (cliente sin gzip/zstd o cuerpo chico), otra
+    # versión de la misma URL sí podría: un cache compartido no debe mezclarlas
+    respuesta.vary.add("Accept-Encoding")
+    datos = respuesta.get_data()
+    if len(datos) < COMPRESION_MINIMO:
+        return respuesta
+    codificacion = elegir_codificacion(request.accept_encodings)
+    if codificacion:
+        _aplicar(respuesta, datos, codificacion)
+    return respuesta
+
+
+def registrar(app):
+    """Cuerpos de request en MessagePack y compresión de respuestas grandes."""
+    app.request_class = RequestNegociado
+    app.after_request(_comprimir_respuesta)
+
+
+# --- Quart (app_async.py) ---
+
+def _request_quart():
+    from quart.wrappers import Request as RequestQuart
+
+    class RequestNegociadoAsync(RequestQuart):
+        async def get_json(self, force=False, silent=False, cache=True):
+            if not _es_msgpack(self.mimetype):
+                return await super().get_json(force=force, silent=silent, cache=cache)
+            return _decodificar(await self.get_data(cache=cache), silent)
+
+    return RequestNegociadoAsync
+
+
+async def _comprimir_respuesta_async(respuesta):
+    from quart import request as request_async
+    if not _comprimible(respuesta) or not hasattr(respuesta.response, "data"):
+        return respuesta  # los streams (generadores) se envían sin comprimir
+    respuesta.vary.add("Accept-Encoding")
+    datos = await respuesta.get_data()
+    if len(datos) < COMPRESION_MINIMO:
+        return respuesta
+    codificacion = elegir_codificacion(request_async.accept_encodings)
+    if codificacion:
+        _aplicar(respuesta, datos, codificacion)
+    return respuesta
+
+
+def registrar_async(app):
+    app.request_class = _request_quart()
+    app.after_request(_comprimir_respuesta_async)
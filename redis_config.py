@@ -1,11 +1,242 @@
 # redis_config.py
+import bisect
+import hashlib
 import os
+import threading
 import redis
 
-def get_redis_client():
+# Un único ConnectionPool por proceso, compartido por todos los clientes.
+# Igual que en db_config, se recrea si cambia el pid (fork).
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+# Clase de los clientes síncronos: metricas.instrumentar_clientes() pone
+# RedisInstrumentado. Los scripts usan redis.Redis y no necesitan Flask ni
+# prometheus_client.
+_clase_cliente = redis.Redis
+
+
+def usar_clase_cliente(clase):
+    """Clase (subclase de redis.Redis) de los clientes que se pidan desde ahora."""
+    global _clase_cliente
+    _clase_cliente = clase
+
+
+def _opciones_redis():
     # Leer variables de entorno
-    redis_host = os.environ.get("REDIS_HOST", "localhost")
-    redis_port = int(os.environ.get("REDIS_PORT", 6379))
-    redis_db = int(os.environ.get("REDIS_DB", 0))
-    r = redis.Redis(host=redis_host, port=redis_port, db=redis_db)
-    return r
+    return {
+        "host": os.environ.get("REDIS_HOST", "localhost"),
+        "port": int(os.environ.get("REDIS_PORT", 6379)),
+        "db": int(os.environ.get("REDIS_DB", 0)),
+        "max_connections": int(os.environ.get("REDIS_MAX_CONNECTIONS", 100)),
+        "socket_timeout": float(os.environ.get("REDIS_SOCKET_TIMEOUT", 2.0)),
+        "socket_connect_timeout": float(os.environ.get("REDIS_CONNECT_TIMEOUT", 2.0)),
+        "socket_keepalive": True,
+        "health_check_interval": int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30)),
+        "retry_on_timeout": True,
+    }
+
+
+def _crear_pool():
+    return redis.ConnectionPool(**_opciones_redis())
+
+
+def get_redis_pool():
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = _crear_pool()
+            _pool_pid = pid
+    return _pool
+
+
+def get_redis_client():
+    # Los clientes son livianos: todos comparten el pool del proceso.
+    # En la app miden cada comando para /metrics (ver usar_clase_cliente).
+    return _clase_cliente(connection_pool=get_redis_pool())
+
+
+def ping_redis():
+    """Health check: True si Redis responde a PING."""
+    try:
+        return bool(get_redis_client().ping())
+    except Exception:
+        return False
+
+
+def close_redis_pool():
+    """Desconecta el pool del proceso actual (apagado ordenado)."""
+    global _pool, _pool_pid, _pools_nodos, _pools_nodos_pid
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.disconnect()
+        _pool = None
+        _pool_pid = None
+        if _pools_nodos_pid == os.getpid():
+            for pool in _pools_nodos.values():
+                pool.disconnect()
+        _pools_nodos = {}
+        _pools_nodos_pid = None
+
+
+# --- Carritos y sesiones en varios nodos ---
+# REDIS_NODOS="host:puerto[/db],host:puerto[/db],..." reparte las claves de
+# carrito_repo (carritos y sesiones) entre esos nodos con hashing consistente
+# sobre el session_id: la sesión y su carrito quedan siempre en el mismo nodo,
+# así los scripts Lua y pipelines de carrito_repo siguen siendo de un solo
+# nodo. Todo lo demás (inventario, colas, límites, cache) sigue en el nodo
+# principal (REDIS_HOST/REDIS_PORT), que también puede estar en la lista.
+# Al agregar o quitar un nodo cambia de dueño ~1/N de las sesiones;
+# scripts/rebalancear_redis.py las mueve. Sin REDIS_NODOS, todo va al principal.
+
+REPLICAS_ANILLO = int(os.environ.get("REDIS_ANILLO_REPLICAS", 160))
+
+
+def leer_nodos(valor):
+    """'host:puerto[/db],...' -> ['host:puerto/db', ...] (sin repetidos, en orden)."""
+    nodos = []
+    for nodo in (n.strip() for n in valor.split(",")):
+        if not nodo:
+            continue
+        direccion, _, db = nodo.partition("/")
+        host, _, puerto = direccion.rpartition(":")
+        if not host or not puerto.isdigit() or (db and not db.isdigit()):
+            raise ValueError(f"Nodo de Redis inválido: {nodo!r} (se espera host:puerto[/db])")
+        nodo = f"{host}:{puerto}/{db or 0}"
+        if nodo not in nodos:
+            nodos.append(nodo)
+    return nodos
+
+
+def _hash(texto):
+    # Estable entre procesos y reinicios (hash() de Python no lo es)
+    return int.from_bytes(hashlib.md5(texto.encode("utf-8")).digest()[:8], "big")
+
+
+class AnilloConsistente:
+    """Anillo de hashing consistente con `replicas` puntos virtuales por nodo."""
+
+    def __init__(self, nodos, replicas=REPLICAS_ANILLO):
+        if not nodos:
+            raise ValueError("El anillo necesita al menos un nodo")
+        self.nodos = list(nodos)
+        puntos = sorted((_hash(f"{nodo}#{i}"), nodo) for nodo in self.nodos for i in range(replicas))
+        self._hashes = [h for h, _ in puntos]
+        self._nodos = [nodo for _, nodo in puntos]
+
+    def nodo(self, clave):
+        i = bisect.bisect(self._hashes, _hash(clave)) % len(self._hashes)
+        return self._nodos[i]
+
+
+NODOS = leer_nodos(os.environ.get("REDIS_NODOS", ""))
+REPARTIDO = bool(NODOS)
+_anillo = AnilloConsistente(NODOS) if REPARTIDO else None
+_pools_nodos = {}
+_pools_nodos_pid = None
+
+
+def nodo_principal():
+    opciones = _opciones_redis()
+    return f"{opciones['host']}:{opciones['port']}/{opciones['db']}"
+
+
+def nodo_sesion(session_id):
+    """Nodo ('host:puerto/db') que guarda la sesión y el carrito de `session_id`."""
+    return _anillo.nodo(str(session_id)) if REPARTIDO else nodo_principal()
+
+
+def _opciones_nodo(nodo):
+    direccion, _, db = nodo.partition("/")
+    host, _, puerto = direccion.rpartition(":")
+    return dict(_opciones_redis(), host=host, port=int(puerto), db=int(db))
+
+
+def _pool_nodo(nodo):
+    global _pools_nodos, _pools_nodos_pid
+    pid = os.getpid()
+    with _lock:
+        if _pools_nodos_pid != pid:
+            _pools_nodos = {}
+            _pools_nodos_pid = pid
+        if nodo not in _pools_nodos:
+            _pools_nodos[nodo] = redis.ConnectionPool(**_opciones_nodo(nodo))
+    return _pools_nodos[nodo]
+
+
+def get_redis_client_nodo(nodo):
+    if nodo == nodo_principal():
+        return get_redis_client()
+    return _clase_cliente(connection_pool=_pool_nodo(nodo))
+
+
+def get_redis_client_sesion(session_id):
+    """Cliente del nodo de la sesión; sin REDIS_NODOS es get_redis_client()."""
+    if not REPARTIDO:
+        return get_redis_client()
+    return get_redis_client_nodo(nodo_sesion(session_id))
+
+
+def nodos_redis(extra=()):
+    """Todos los nodos en uso (principal primero), para scripts que recorren el keyspace."""
+    nodos = [nodo_principal()]
+    for nodo in list(NODOS) + list(extra):
+        if nodo not in nodos:
+            nodos.append(nodo)
+    return nodos
+
+
+# --- Cliente asíncrono (app_async.py) ---
+_async_pool = None
+_async_pool_pid = None
+
+
+def get_async_redis_client():
+    """Cliente de redis.asyncio sobre un pool compartido por el proceso."""
+    global _async_pool, _async_pool_pid
+    import redis.asyncio
+
+    pid = os.getpid()
+    if _async_pool is None or _async_pool_pid != pid:
+        _async_pool = redis.asyncio.ConnectionPool(**_opciones_redis())
+        _async_pool_pid = pid
+    return redis.asyncio.Redis(connection_pool=_async_pool)
+
+
+_async_pools_nodos = {}
+_async_pools_nodos_pid = None
+
+
+def get_async_redis_client_sesion(session_id):
+    """Versión asíncrona de get_redis_client_sesion."""
+    global _async_pools_nodos, _async_pools_nodos_pid
+    import redis.asyncio
+
+    if not REPARTIDO:
+        return get_async_redis_client()
+    nodo = nodo_sesion(session_id)
+    if nodo == nodo_principal():
+        return get_async_redis_client()
+    if _async_pools_nodos_pid != os.getpid():
+        _async_pools_nodos = {}
+        _async_pools_nodos_pid = os.getpid()
+    if nodo not in _async_pools_nodos:
+        _async_pools_nodos[nodo] = redis.asyncio.ConnectionPool(**_opciones_nodo(nodo))
+    return redis.asyncio.Redis(connection_pool=_async_pools_nodos[nodo])
+
+
+async def close_async_redis_pool():
+    global _async_pool, _async_pool_pid, _async_pools_nodos, _async_pools_nodos_pid
+    if _async_pool is not None and _async_pool_pid == os.getpid():
+        await _async_pool.disconnect()
+    if _async_pools_nodos_pid == os.getpid():
+        for pool in _async_pools_nodos.values():
+            await pool.disconnect()
+    _async_pool = None
+    _async_pool_pid = None
+    _async_pools_nodos = {}
+    _async_pools_nodos_pid = None
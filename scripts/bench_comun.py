@@ -0,0 +1,106 @@
+# scripts/bench_comun.py
+# Piezas compartidas por los benchmarks: clientes (HTTP o en proceso), registro
+# de latencias por endpoint y cálculo de percentiles.
+import http.cookiejar
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    return valores_ordenados[min(len(valores_ordenados) - 1, int(len(valores_ordenados) * p / 100))]
+
+
+class ClienteHTTP:
+    """Cliente con su propia cookie de sesión contra un servidor real."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def pedir(self, metodo, ruta, form=None, json_body=None):
+        headers = {}
+        datos = None
+        if json_body is not None:
+            datos = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif form is not None:
+            datos = urllib.parse.urlencode(form).encode()
+        req = urllib.request.Request(self.base_url + ruta, data=datos, method=metodo, headers=headers)
+        try:
+            with self._opener.open(req, timeout=30) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class ClienteEnProceso:
+    """Mismo contrato que ClienteHTTP, pero usando el test client de Flask (sin red)."""
+
+    def __init__(self, app):
+        self._cliente = app.test_client()
+
+    def pedir(self, metodo, ruta, form=None, json_body=None):
+        resp = self._cliente.open(ruta, method=metodo, data=form, json=json_body)
+        return resp.status_code, resp.get_data()
+
+
+class Registro:
+    """Latencias (ms) y errores por endpoint, seguro entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = {}
+        self.errores = {}
+
+    def medir(self, cliente, endpoint, metodo, ruta, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            estado, cuerpo = cliente.pedir(metodo, ruta, **kwargs)
+        except OSError:
+            estado, cuerpo = 599, b""
+        duracion = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.latencias.setdefault(endpoint, []).append(duracion)
+            if estado >= 500:
+                self.errores[endpoint] = self.errores.get(endpoint, 0) + 1
+        return estado, cuerpo
+
+    def resumen(self, segundos):
+        filas = {}
+        with self._lock:
+            for endpoint, valores in self.latencias.items():
+                valores = sorted(valores)
+                filas[endpoint] = {
+                    "requests": len(valores),
+                    "errores": self.errores.get(endpoint, 0),
+                    "req_s": round(len(valores) / segundos, 1),
+                    "p50_ms": round(percentil(valores, 50), 2),
+                    "p95_ms": round(percentil(valores, 95), 2),
+                    "p99_ms": round(percentil(valores, 99), 2),
+                }
+            todos = sorted(v for valores in self.latencias.values() for v in valores)
+        filas["TOTAL"] = {
+            "requests": len(todos),
+            "errores": sum(self.errores.values()),
+            "req_s": round(len(todos) / segundos, 1),
+            "p50_ms": round(percentil(todos, 50), 2),
+            "p95_ms": round(percentil(todos, 95), 2),
+            "p99_ms": round(percentil(todos, 99), 2),
+        }
+        return filas
+
+
+COLUMNAS = ["requests", "errores", "req_s", "p50_ms", "p95_ms", "p99_ms"]
+
+
+def imprimir_tabla(filas, ancho=34):
+    print(f"{'':{ancho}}" + "".join(f"{c:>10}" for c in COLUMNAS))
+    for nombre, fila in filas.items():
+        print(f"{nombre:{ancho}}" + "".join(f"{fila[c]:>10}" for c in COLUMNAS))
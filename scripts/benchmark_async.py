@@ -0,0 +1,61 @@
+# scripts/benchmark_async.py
+# Compara app.py (síncrona) y app_async.py bajo la misma carga. Ambas apps
+# deben correr con SESSION_COOKIE_SECURE=0 para que la cookie viaje por http.
+# Solo usa rutas que sirven las dos (ver app_async.SOLO_SINCRONO); para que el
+# control de admisión no difiera, conviene arrancar ambas con LIMITES=0. La
+# síncrona igual consulta la versión del catálogo (ETag) y mide cada request.
+#
+#   python app.py                                      # :5000
+#   hypercorn app_async:app --bind 0.0.0.0:5001        # :5001
+#   python scripts/benchmark_async.py --sync http://localhost:5000 \
+#       --async http://localhost:5001 --usuarios 200 --segundos 30
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.bench_comun import ClienteHTTP, Registro, imprimir_tabla
+
+
+def _usuario_virtual(base_url, email, hasta, registro):
+    cliente = ClienteHTTP(base_url)
+    cliente.pedir("POST", "/login", form={"email": email})
+    _, cuerpo = cliente.pedir("GET", "/productos/?limit=20")
+    productos = [p["_id"] for p in json.loads(cuerpo or b"[]")]
+    i = 0
+    while time.monotonic() < hasta:
+        registro.medir(cliente, "listado", "GET", "/productos/?limit=20")
+        if productos:
+            producto_id = productos[i % len(productos)]
+            registro.medir(cliente, "detalle", "GET", f"/productos/{producto_id}")
+            registro.medir(cliente, "agregar", "POST", "/agregar_carrito",
+                           form={"product_id": producto_id, "cantidad": 1})
+        registro.medir(cliente, "ver_carrito", "GET", "/ver_carrito")
+        i += 1
+
+
+def correr(base_url, usuarios, segundos, email):
+    registro = Registro()
+    hasta = time.monotonic() + segundos
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(max_workers=usuarios) as pool:
+        for _ in range(usuarios):
+            pool.submit(_usuario_virtual, base_url, email, hasta, registro)
+    return registro.resumen(time.monotonic() - inicio)["TOTAL"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark app síncrona vs asíncrona")
+    parser.add_argument("--sync", default="http://localhost:5000")
+    parser.add_argument("--async", dest="async_url", default="http://localhost:5001")
+    parser.add_argument("--usuarios", type=int, default=100, help="Usuarios concurrentes")
+    parser.add_argument("--segundos", type=int, default=20)
+    parser.add_argument("--email", default="alice@example.com")
+    args = parser.parse_args()
+
+    resultados = {}
+    for nombre, url in (("sync", args.sync), ("async", args.async_url)):
+        print(f"Corriendo {nombre} ({url}) con {args.usuarios} usuarios durante {args.segundos}s...")
+        resultados[nombre] = correr(url, args.usuarios, args.segundos, args.email)
+
+    imprimir_tabla(resultados, ancho=8)
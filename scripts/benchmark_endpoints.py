@@ -0,0 +1,220 @@
+# scripts/benchmark_endpoints.py
+# Prueba de carga sobre las rutas reales con recorridos de usuario guionados.
+# Informa throughput y p50/p95/p99 por endpoint, y guarda/compara una línea
+# base en JSON para detectar regresiones entre versiones.
+#
+#   # contra un servidor corriendo (con SESSION_COOKIE_SECURE=0)
+#   python scripts/benchmark_endpoints.py --url http://localhost:5000 \
+#       --usuarios 50 --segundos 60 --guardar bench/base.json
+#   # en proceso, sin servidor HTTP (mongod y redis-server locales)
+#   python scripts/benchmark_endpoints.py --en-proceso --comparar bench/base.json
+#   # en proceso y con mongomock + fakeredis (requieren lupa para los scripts Lua)
+#   python scripts/benchmark_endpoints.py --memoria
+#
+# Los usuarios de prueba se loguean como usuario{i}@example.com (los que crea
+# scripts/generar_datos.py); con --emails se puede indicar otra lista.
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from scripts.bench_comun import ClienteHTTP, ClienteEnProceso, Registro, imprimir_tabla
+from scripts.verificar_scripts import colisiones
+
+MEZCLA_DEFECTO = "comprador=2,navegante=7,admin=1"
+
+
+def _json(cuerpo):
+    try:
+        return json.loads(cuerpo)
+    except ValueError:
+        return None
+
+
+def recorrido_navegante(cliente, registro, rnd, ctx):
+    registro.medir(cliente, "GET /productos/", "GET", "/productos/?limit=20")
+    producto_id = rnd.choice(ctx["productos"])
+    registro.medir(cliente, "GET /productos/<id>", "GET", f"/productos/{producto_id}")
+    registro.medir(cliente, "POST /agregar_carrito", "POST", "/agregar_carrito",
+                   form={"product_id": producto_id, "cantidad": 1})
+    registro.medir(cliente, "GET /ver_carrito", "GET", "/ver_carrito")
+
+
+def recorrido_comprador(cliente, registro, rnd, ctx):
+    registro.medir(cliente, "POST /login", "POST", "/login", form={"email": rnd.choice(ctx["emails"])})
+    registro.medir(cliente, "GET /productos/", "GET", "/productos/?limit=20")
+    for producto_id in rnd.sample(ctx["productos"], min(2, len(ctx["productos"]))):
+        registro.medir(cliente, "GET /productos/<id>", "GET", f"/productos/{producto_id}")
+        registro.medir(cliente, "POST /agregar_carrito", "POST", "/agregar_carrito",
+                       form={"product_id": producto_id, "cantidad": 1})
+    registro.medir(cliente, "GET /ver_carrito", "GET", "/ver_carrito")
+    estado, cuerpo = registro.medir(cliente, "POST /confirmar_pedido", "POST", "/confirmar_pedido",
+                                    form={"parcial": "1"})
+    pedido = _json(cuerpo) or {}
+    if estado == 200 and pedido.get("pedido_id"):
+        registro.medir(cliente, "POST /facturar_pedido/<id>", "POST",
+                       f"/facturar_pedido/{pedido['pedido_id']}", form={"metodo_pago": "Tarjeta de Crédito"})
+    registro.medir(cliente, "GET /historial_pagos", "GET", "/historial_pagos")
+
+
+def recorrido_admin(cliente, registro, rnd, ctx):
+    estado, cuerpo = registro.medir(cliente, "POST /productos/", "POST", "/productos/", json_body={
+        "nombre": f"Bench {rnd.random():.6f}", "descripcion": "producto de benchmark",
+        "precio": 10.0, "stock": 100,
+    })
+    nuevo = (_json(cuerpo) or {}).get("_id")
+    if nuevo:
+        registro.medir(cliente, "PUT /productos/<id>", "PUT", f"/productos/{nuevo}", json_body={"precio": 12.5})
+    registro.medir(cliente, "GET /usuarios/", "GET", "/usuarios/?limit=50")
+    registro.medir(cliente, "GET /pedidos/", "GET", "/pedidos/?limit=50&estado=pagado")
+    registro.medir(cliente, "GET /usuarios/<id>", "GET", f"/usuarios/{rnd.choice(ctx['usuarios'])}")
+    if nuevo:
+        registro.medir(cliente, "DELETE /productos/<id>", "DELETE", f"/productos/{nuevo}")
+
+
+RECORRIDOS = {
+    "navegante": recorrido_navegante,
+    "comprador": recorrido_comprador,
+    "admin": recorrido_admin,
+}
+
+
+def _usuario_virtual(n, crear_cliente, registro, hasta, mezcla, ctx, seed):
+    rnd = random.Random(seed + n)
+    cliente = crear_cliente()
+    nombres = list(mezcla)
+    pesos = [mezcla[nombre] for nombre in nombres]
+    while time.monotonic() < hasta:
+        RECORRIDOS[rnd.choices(nombres, pesos)[0]](cliente, registro, rnd, ctx)
+
+
+def _preparar(crear_cliente, args):
+    # Ids reales de productos y usuarios para armar los recorridos
+    cliente = crear_cliente()
+    _, cuerpo = cliente.pedir("GET", "/productos/?limit=500&fields=nombre")
+    productos = [p["_id"] for p in _json(cuerpo) or []]
+    _, cuerpo = cliente.pedir("GET", "/usuarios/?limit=500&fields=email")
+    usuarios = _json(cuerpo) or []
+    emails = args.emails.split(",") if args.emails else [u["email"] for u in usuarios if u.get("email")]
+    if not productos or not emails:
+        sys.exit("No hay productos o usuarios: cargá datos con scripts/generar_datos.py")
+    return {"productos": productos, "usuarios": [u["_id"] for u in usuarios], "emails": emails}
+
+
+def _usar_memoria():
+    # mongomock y fakeredis en lugar de mongod y redis-server
+    import mongomock
+    import fakeredis
+    import redis
+    import db_config
+    import redis_config
+
+    db_config._client = mongomock.MongoClient()
+    db_config._client_pid = os.getpid()
+    redis_config._pool = redis.ConnectionPool(
+        connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer())
+    redis_config._pool_pid = os.getpid()
+    from scripts.cargar_documentos import cargar_documentos_de_ejemplo
+    cargar_documentos_de_ejemplo()
+
+
+def _commit_actual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, base, tolerancia):
+    """Imprime las diferencias con la línea base. Devuelve True si hay regresiones."""
+    hay_regresion = False
+    print(f"\nComparación con la línea base (tolerancia {tolerancia:.0%}):")
+    for endpoint, fila in actual.items():
+        previo = base.get(endpoint)
+        if not previo:
+            continue
+        delta_p95 = (fila["p95_ms"] - previo["p95_ms"]) / previo["p95_ms"] if previo["p95_ms"] else 0.0
+        delta_rps = (fila["req_s"] - previo["req_s"]) / previo["req_s"] if previo["req_s"] else 0.0
+        regresion = delta_p95 > tolerancia or delta_rps < -tolerancia
+        hay_regresion = hay_regresion or regresion
+        marca = "REGRESIÓN" if regresion else "ok"
+        print(f"  [{marca:9}] {endpoint:34} p95 {delta_p95:+7.1%}   req/s {delta_rps:+7.1%}")
+    return hay_regresion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de endpoints con percentiles")
+    destino = parser.add_mutually_exclusive_group()
+    destino.add_argument("--url", default="http://localhost:5000", help="Servidor a probar")
+    destino.add_argument("--en-proceso", action="store_true", help="Usa create_app() sin servidor HTTP")
+    destino.add_argument("--memoria", action="store_true", help="En proceso, con mongomock y fakeredis")
+    parser.add_argument("--usuarios", type=int, default=20, help="Usuarios virtuales concurrentes")
+    parser.add_argument("--segundos", type=int, default=30)
+    parser.add_argument("--mezcla", default=MEZCLA_DEFECTO, help="Peso de cada recorrido")
+    parser.add_argument("--emails", help="Emails para login, separados por coma")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--guardar", help="Guarda los resultados como línea base (JSON)")
+    parser.add_argument("--comparar", help="Línea base (JSON) contra la cual comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    args = parser.parse_args()
+
+    mezcla = {nombre: float(peso) for nombre, peso in
+              (parte.split("=") for parte in args.mezcla.split(","))}
+
+    if args.memoria or args.en_proceso:
+        # Un script con el nombre de un módulo de la raíz rompería el import de app
+        tapados = colisiones()
+        if tapados:
+            parser.error("scripts/ tapa módulos de la raíz: " + ", ".join(tapados)
+                         + " (ver scripts/verificar_scripts.py)")
+        if args.memoria:
+            _usar_memoria()
+        os.environ["SESSION_COOKIE_SECURE"] = "0"
+        # Todos los usuarios virtuales comparten un proceso: sin límites de admisión
+        os.environ.setdefault("LIMITES", "0")
+        from app import create_app
+        app = create_app()
+        crear_cliente = lambda: ClienteEnProceso(app)
+        destino = "memoria" if args.memoria else "en-proceso"
+    else:
+        crear_cliente = lambda: ClienteHTTP(args.url)
+        destino = args.url
+
+    ctx = _preparar(crear_cliente, args)
+    print(f"Destino {destino}: {args.usuarios} usuarios, {args.segundos}s, mezcla {mezcla}")
+
+    registro = Registro()
+    inicio = time.monotonic()
+    hasta = inicio + args.segundos
+    with ThreadPoolExecutor(max_workers=args.usuarios) as pool:
+        for n in range(args.usuarios):
+            pool.submit(_usuario_virtual, n, crear_cliente, registro, hasta, mezcla, ctx, args.seed)
+    filas = registro.resumen(time.monotonic() - inicio)
+    imprimir_tabla(filas)
+
+    if args.guardar:
+        os.makedirs(os.path.dirname(args.guardar) or ".", exist_ok=True)
+        with open(args.guardar, "w") as f:
+            json.dump({
+                "fecha": datetime.utcnow().isoformat(timespec="seconds"),
+                "commit": _commit_actual(),
+                "parametros": {"destino": destino, "usuarios": args.usuarios,
+                               "segundos": args.segundos, "mezcla": mezcla, "seed": args.seed},
+                "resultados": filas,
+            }, f, indent=2)
+        print(f"Línea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            base = json.load(f)
+        if comparar(filas, base["resultados"], args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
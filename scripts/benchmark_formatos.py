@@ -0,0 +1,107 @@
+# scripts/benchmark_formatos.py
+# Bytes en la red y tiempo de codificación de las respuestas grandes según el
+# formato (JSON o MessagePack) y la compresión (sin comprimir, gzip, zstd),
+# tal como los arma la app (ver serializacion.py y negociacion.py).
+#
+#   # con documentos reales de MongoDB
+#   python scripts/benchmark_formatos.py --coleccion pedidos --limite 500
+#   # sin base de datos: pedidos sintéticos con items
+#   python scripts/benchmark_formatos.py --sinteticos 500 --items 5
+#
+# El tiempo es la mediana de --repeticiones codificaciones de la misma página.
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId, Decimal128
+from flask import Flask
+
+import negociacion
+import serializacion
+
+
+def pedidos_sinteticos(cantidad, items, seed=42):
+    rnd = random.Random(seed)
+    inicio = datetime(2025, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "usuario_id": ObjectId(),
+            "fecha": inicio + timedelta(minutes=rnd.randrange(500000)),
+            "estado": rnd.choice(["pendiente", "pagado", "enviado"]),
+            "total": Decimal128(f"{rnd.uniform(10, 500):.2f}"),
+            "items": [
+                {"producto_id": ObjectId(), "nombre": f"Producto {rnd.randrange(10000)}",
+                 "cantidad": rnd.randint(1, 4), "precio": round(rnd.uniform(1, 200), 2)}
+                for _ in range(items)
+            ],
+        }
+        for _ in range(cantidad)
+    ]
+
+
+def documentos_mongo(coleccion, limite):
+    from db_config import get_mongo_client
+    return list(get_mongo_client()[coleccion].find().sort("_id", 1).limit(limite))
+
+
+def _medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, statistics.median(tiempos)
+
+
+def medir_formatos(docs, repeticiones):
+    proveedor = serializacion.ProveedorJSONBSON(Flask(__name__))
+    codificadores = {"json": proveedor.dumps_bytes}
+    if serializacion.msgpack is not None:
+        codificadores["msgpack"] = serializacion.dumps_msgpack
+    compresiones = [None, "gzip"] + (["zstd"] if negociacion.zstandard is not None else [])
+
+    filas = []
+    for formato, codificar in codificadores.items():
+        cuerpo, ms_codificar = _medir(lambda: codificar(docs), repeticiones)
+        for compresion in compresiones:
+            if compresion is None:
+                datos, ms_comprimir = cuerpo, 0.0
+            else:
+                datos, ms_comprimir = _medir(lambda: negociacion.comprimir(cuerpo, compresion), repeticiones)
+            filas.append({
+                "formato": formato + (f"+{compresion}" if compresion else ""),
+                "bytes": len(datos),
+                "ms_codificar": ms_codificar,
+                "ms_total": ms_codificar + ms_comprimir,
+            })
+    return filas
+
+
+def imprimir(filas):
+    base = filas[0]["bytes"]
+    print(f"{'formato':<16}{'bytes':>12}{'% de json':>11}{'ms cod.':>10}{'ms total':>10}")
+    for f in filas:
+        print(f"{f['formato']:<16}{f['bytes']:>12}{f['bytes'] * 100 / base:>10.1f}%"
+              f"{f['ms_codificar']:>10.2f}{f['ms_total']:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tamaño y tiempo de codificación por formato de respuesta")
+    parser.add_argument("--coleccion", default="pedidos", help="colección de la que leer la página")
+    parser.add_argument("--limite", type=int, default=500, help="documentos por página")
+    parser.add_argument("--sinteticos", type=int, default=0, help="usar N pedidos sintéticos en vez de MongoDB")
+    parser.add_argument("--items", type=int, default=5, help="items por pedido sintético")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.sinteticos:
+        docs = pedidos_sinteticos(args.sinteticos, args.items)
+    else:
+        docs = documentos_mongo(args.coleccion, args.limite)
+    if serializacion.msgpack is None:
+        print("msgpack no está instalado: solo se mide JSON")
+    print(f"{len(docs)} documentos")
+    imprimir(medir_formatos(docs, args.repeticiones))
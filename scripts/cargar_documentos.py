@@ -14,17 +14,24 @@ def cargar_documentos_de_ejemplo():
     usuario1 = Usuario(nombre="Alice", email="alice@example.com", categoria="TOP")
     usuario2 = Usuario(nombre="Bob", email="bob@example.com", categoria="MEDIUM")
 
-    # Insertar usuarios en MongoDB
-    usuarios_coll.insert_one(usuario1.__dict__)
-    usuarios_coll.insert_one(usuario2.__dict__)
+    # Insertar usuarios en MongoDB (upsert por email: el script puede correr en
+    # cada arranque sin duplicar documentos, y respeta el índice único de email)
+    for usuario in (usuario1, usuario2):
+        datos = dict(usuario.__dict__)
+        _id = datos.pop("_id")
+        usuarios_coll.update_one({"email": usuario.email},
+                                 {"$setOnInsert": dict(datos, _id=_id)}, upsert=True)
 
     # Crear ejemplos de productos
     producto1 = Producto(nombre="Laptop Gamer", descripcion="Laptop muy potente", precio=1500.99, stock=10)
     producto2 = Producto(nombre="Smartphone X", descripcion="Gama alta", precio=999.99, stock=5)
 
-    # Insertar productos en MongoDB
-    productos_coll.insert_one(producto1.__dict__)
-    productos_coll.insert_one(producto2.__dict__)
+    # Insertar productos en MongoDB (upsert por nombre)
+    for producto in (producto1, producto2):
+        datos = dict(producto.__dict__)
+        _id = datos.pop("_id")
+        productos_coll.update_one({"nombre": producto.nombre},
+                                  {"$setOnInsert": dict(datos, _id=_id)}, upsert=True)
 
     print("Documentos de ejemplo cargados con éxito.")
 
@@ -0,0 +1,39 @@
+# scripts/cli_categorias.py
+import argparse
+import time
+
+import categorias
+
+
+def backfill(procesos, tamano):
+    inicio = time.perf_counter()
+
+    def progreso(hechos, total):
+        print(f"\r{hechos}/{total} rango(s)", end="", flush=True)
+
+    cuenta = categorias.backfill(procesos, tamano, progreso)
+    print()
+    for nivel in categorias.NIVELES:
+        print(f"{nivel:<8}{cuenta.get(nivel, 0):>10}")
+    print(f"{sum(cuenta.values())} usuario(s) en {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Categorías de clientes (TOP / MEDIUM / LOW)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_backfill = sub.add_parser("backfill", help="Recalcula todos los usuarios por rangos de _id en paralelo")
+    p_backfill.add_argument("--procesos", type=int, default=4)
+    p_backfill.add_argument("--rango", type=int, default=categorias.TAMANO_RANGO, help="usuarios por rango")
+    p_recalcular = sub.add_parser("recalcular", help="Recalcula los usuarios indicados")
+    p_recalcular.add_argument("ids", nargs="+")
+    p_ver = sub.add_parser("ver", help="Muestra la categoría de un usuario (desde Redis)")
+    p_ver.add_argument("id")
+    args = parser.parse_args()
+
+    if args.comando == "backfill":
+        backfill(args.procesos, args.rango)
+    elif args.comando == "recalcular":
+        for usuario_id, nivel in categorias.recalcular(*args.ids).items():
+            print(f"{usuario_id}: {nivel}")
+    else:
+        print(categorias.categoria(args.id) or "Usuario no encontrado")
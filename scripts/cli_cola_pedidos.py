@@ -0,0 +1,51 @@
+# scripts/cli_cola_pedidos.py
+import argparse
+
+import cola_pedidos
+from redis_config import get_redis_client
+
+
+def estado():
+    r = get_redis_client()
+    cola_pedidos.crear_grupo(r)
+    pendientes = r.xpending(cola_pedidos.STREAM, cola_pedidos.GRUPO)
+    print(f"En cola: {r.xlen(cola_pedidos.STREAM)}")
+    print(f"Leídos sin confirmar: {pendientes['pending']}")
+    for consumidor in pendientes.get("consumers", []):
+        print(f"  {consumidor['name'].decode('utf-8')}: {consumidor['pending']}")
+    print(f"Muertos: {r.xlen(cola_pedidos.STREAM_MUERTOS)}")
+
+
+def trabajar():
+    r = get_redis_client()
+    cola_pedidos.crear_grupo(r)
+    consumidor = cola_pedidos.nombre_consumidor()
+    print(f"Escritor {consumidor} leyendo {cola_pedidos.STREAM}", flush=True)
+    while True:
+        escritos = cola_pedidos.trabajar_una_vez(r, consumidor)
+        if escritos:
+            print(f"{escritos} evento(s) escritos", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cola de pedidos y pagos (PEDIDOS_ASINCRONOS=1)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("estado", help="Eventos en cola, sin confirmar y muertos")
+    sub.add_parser("trabajar", help="Escritor en un proceso aparte (COLA_PEDIDOS_WORKER=0 en la app)")
+    sub.add_parser("muertos", help="Lista los eventos descartados")
+    sub.add_parser("reprocesar", help="Vuelve a encolar los eventos descartados")
+    sub.add_parser("descartar", help="Elimina los eventos descartados (los pedidos devuelven su stock)")
+    args = parser.parse_args()
+
+    if args.comando == "estado":
+        estado()
+    elif args.comando == "trabajar":
+        trabajar()
+    elif args.comando == "muertos":
+        for evento in cola_pedidos.muertos():
+            print(f"{evento['evento']} {evento['tipo']} {evento['id']} "
+                  f"({evento['intentos']} intentos): {evento['error']}")
+    elif args.comando == "reprocesar":
+        print(f"{cola_pedidos.reprocesar_muertos()} evento(s) reencolados.")
+    else:
+        print(f"{cola_pedidos.descartar_muertos()} evento(s) eliminados.")
@@ -0,0 +1,20 @@
+# scripts/cli_facturacion.py
+import argparse
+import time
+
+import facturacion
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Factura los pedidos pagados que no tienen factura")
+    parser.add_argument("--batch", type=int, default=facturacion.BATCH, help="pedidos por tanda")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+
+    def progreso(procesados, creadas):
+        print(f"\r{procesados} pedido(s), {creadas} factura(s) nueva(s)", end="", flush=True)
+
+    procesados, creadas = facturacion.facturar_pagados(args.batch, progreso)
+    print(f"\n{procesados} pedido(s) procesado(s), {creadas} factura(s) creada(s) "
+          f"en {time.perf_counter() - inicio:.1f}s")
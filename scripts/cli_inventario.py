@@ -0,0 +1,45 @@
+# scripts/cli_inventario.py
+import argparse
+import sys
+import time
+
+import inventario
+
+
+def reconciliar(corregir):
+    desvios = inventario.reconciliar(corregir=corregir)
+    for producto_id, actual, esperado in desvios:
+        print(f"{producto_id}: contador {actual}, esperado {esperado}")
+    accion = "corregido(s)" if corregir else "encontrado(s)"
+    print(f"{len(desvios)} desvío(s) {accion}.")
+    return 1 if desvios and not corregir else 0
+
+
+def trabajar(intervalo):
+    while True:
+        liberadas = inventario.liberar_vencidas()
+        volcados = inventario.volcar()
+        if liberadas or volcados:
+            print(f"{liberadas} reserva(s) liberada(s), {volcados} producto(s) volcado(s)", flush=True)
+        time.sleep(intervalo)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inventario en Redis (reservas y volcado a MongoDB)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("volcar", help="Descuenta en MongoDB las ventas pendientes")
+    sub.add_parser("liberar", help="Devuelve al stock las reservas de carritos vencidos")
+    p_reconciliar = sub.add_parser("reconciliar", help="Compara los contadores con el stock de MongoDB")
+    p_reconciliar.add_argument("--corregir", action="store_true", help="Ajusta los contadores desviados")
+    p_trabajar = sub.add_parser("trabajar", help="Libera y vuelca en un ciclo (INVENTARIO_WORKER=0 en la app)")
+    p_trabajar.add_argument("--intervalo", type=float, default=inventario.INTERVALO)
+    args = parser.parse_args()
+
+    if args.comando == "volcar":
+        print(f"{inventario.volcar()} producto(s) volcado(s).")
+    elif args.comando == "liberar":
+        print(f"{inventario.liberar_vencidas()} reserva(s) liberada(s).")
+    elif args.comando == "reconciliar":
+        sys.exit(reconciliar(args.corregir))
+    else:
+        trabajar(args.intervalo)
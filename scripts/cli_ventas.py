@@ -0,0 +1,19 @@
+# scripts/cli_ventas.py
+import argparse
+import time
+from datetime import datetime
+
+import ventas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rollups de ventas por hora y por día")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_reconstruir = sub.add_parser("reconstruir", help="Rearma los rollups desde pedidos y pagos")
+    p_reconstruir.add_argument("--desde", type=datetime.fromisoformat,
+                               help="solo desde este día (UTC, por ejemplo 2025-03-01)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    buckets = ventas.reconstruir(args.desde)
+    print(f"{buckets} bucket(s) en {time.perf_counter() - inicio:.1f}s")
@@ -0,0 +1,299 @@
+# scripts/generar_datos.py
+# Genera datos sintéticos a escala (usuarios, productos, pedidos y pagos) y los
+# carga con insert_many desordenado desde varios procesos.
+#
+#   python scripts/generar_datos.py --escala 1 --procesos 8 --seed 42
+#   python scripts/generar_datos.py --usuarios 2000000 --productos 100000 \
+#       --pedidos 5000000 --carritos 100000 --sesiones 50000 --limpiar
+#
+# Distribuciones:
+#   - Popularidad de productos tipo Zipf (pocos productos concentran las ventas).
+#   - Usuarios TOP (10%), MEDIUM (30%) y LOW (60%); un TOP compra 5 veces más
+#     seguido que un LOW y un MEDIUM 2 veces más.
+#   - 70% de los pedidos quedan pagados (con su documento en "pagos").
+#
+# Los _id son deterministas (índice + tipo, con la fecha en los 4 bytes de
+# tiempo del ObjectId), así cada proceso genera su tramo sin coordinarse con
+# los demás y con la misma semilla se obtienen siempre los mismos datos.
+import argparse
+import bisect
+import itertools
+import random
+import struct
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from multiprocessing import Pool
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from db_config import get_mongo_client
+from redis_config import get_redis_client_nodo, nodo_sesion
+from carrito_repo import clave_carrito, campo_producto, escribir_sesion, TTL_CARRITO
+
+BASE = {"usuarios": 100_000, "productos": 20_000, "pedidos": 500_000}
+TIPOS = {"usuarios": 1, "productos": 2, "pedidos": 3, "pagos": 4}
+CATEGORIAS = [("TOP", 1, 5), ("MEDIUM", 3, 2), ("LOW", 6, 1)]  # (nombre, de cada 10 usuarios, peso de compra)
+METODOS_PAGO = [("Tarjeta de Crédito", 55), ("Tarjeta de Débito", 25), ("Transferencia", 15), ("Efectivo", 5)]
+PALABRAS = [
+    "laptop", "gamer", "smartphone", "auriculares", "monitor", "teclado", "mouse",
+    "tablet", "parlante", "cámara", "cargador", "reloj", "impresora", "router",
+    "consola", "silla", "escritorio", "lámpara", "mochila", "disco", "memoria",
+    "inalámbrico", "bluetooth", "portátil", "profesional", "compacto", "ultra",
+    "pro", "max", "mini", "negro", "blanco", "rojo", "azul", "gama", "alta", "media",
+]
+FECHA_FIN = datetime(2025, 1, 1, tzinfo=timezone.utc)
+TAMANO_TAREA = 50_000
+
+
+def _oid(tipo, indice, fecha=None):
+    # 4 bytes de tiempo + 1 byte de tipo + 7 bytes de índice
+    segundos = int((fecha or FECHA_FIN).timestamp())
+    return ObjectId(struct.pack(">IB", segundos, tipo) + indice.to_bytes(7, "big"))
+
+
+def _rng(seed, tipo, indice):
+    return random.Random(seed * 1_000_003 + tipo * 7_919 + indice)
+
+
+def _producto(seed, i):
+    rnd = _rng(seed, TIPOS["productos"], i)
+    palabras = rnd.sample(PALABRAS, 6)
+    return {
+        "_id": _oid(TIPOS["productos"], i),
+        "nombre": f"{palabras[0].capitalize()} {palabras[1]} {i}",
+        "descripcion": " ".join(palabras[2:]),
+        "precio": round(rnd.lognormvariate(4.0, 1.0) + 1, 2),
+        "stock": rnd.randint(0, 500),
+    }
+
+
+def _categoria(i):
+    resto = i % 10
+    acumulado = 0
+    for nombre, cantidad, _ in CATEGORIAS:
+        acumulado += cantidad
+        if resto < acumulado:
+            return nombre
+
+
+def _usuario(i):
+    return {
+        "_id": _oid(TIPOS["usuarios"], i),
+        "nombre": f"Usuario {i}",
+        "email": f"usuario{i}@example.com",
+        "categoria": _categoria(i),
+    }
+
+
+class _Contexto:
+    """Tablas que cada proceso arma una sola vez para generar pedidos."""
+
+    def __init__(self, args):
+        self.args = args
+        n = args.productos
+        # Zipf con s=1.1: peso del producto de rango k = 1 / k^s. El rango se
+        # mezcla con la semilla para que los populares no sean siempre los primeros.
+        orden = list(range(n))
+        random.Random(args.seed).shuffle(orden)
+        self.por_rango = orden
+        self.acumulado = list(itertools.accumulate(1 / (k + 1) ** 1.1 for k in range(n)))
+        self.precios = {}
+        self.acumulado_categorias = list(itertools.accumulate(
+            cantidad * peso for _, cantidad, peso in CATEGORIAS))
+        self.acumulado_metodos = list(itertools.accumulate(p for _, p in METODOS_PAGO))
+
+    def producto_popular(self, rnd):
+        rango = bisect.bisect_left(self.acumulado, rnd.random() * self.acumulado[-1])
+        return self.por_rango[min(rango, len(self.por_rango) - 1)]
+
+    def datos_producto(self, i):
+        if i not in self.precios:
+            prod = _producto(self.args.seed, i)
+            self.precios[i] = (prod["nombre"], prod["precio"])
+        return self.precios[i]
+
+    def usuario_al_azar(self, rnd):
+        # Primero la categoría (ponderada por cantidad y frecuencia de compra),
+        # después un usuario de esa categoría
+        c = bisect.bisect_left(self.acumulado_categorias, rnd.random() * self.acumulado_categorias[-1])
+        inicio = sum(cantidad for _, cantidad, _ in CATEGORIAS[:c])
+        cantidad = CATEGORIAS[c][1]
+        decenas = max(1, self.args.usuarios // 10)
+        i = 10 * rnd.randrange(decenas) + inicio + rnd.randrange(cantidad)
+        return min(i, self.args.usuarios - 1)
+
+    def metodo_pago(self, rnd):
+        m = bisect.bisect_left(self.acumulado_metodos, rnd.random() * self.acumulado_metodos[-1])
+        return METODOS_PAGO[m][0]
+
+
+_ctx = None
+
+
+def _init_proceso(args):
+    global _ctx
+    _ctx = _Contexto(args)
+
+
+def _pedido_y_pago(i):
+    args = _ctx.args
+    rnd = _rng(args.seed, TIPOS["pedidos"], i)
+    fecha = FECHA_FIN - timedelta(seconds=rnd.randrange(args.dias * 86400))
+    usuario = _ctx.usuario_al_azar(rnd)
+    items, total = [], 0
+    for p in {_ctx.producto_popular(rnd) for _ in range(rnd.randint(1, 5))}:
+        nombre, precio = _ctx.datos_producto(p)
+        cantidad = rnd.choice((1, 1, 1, 2, 2, 3))
+        subtotal = round(precio * cantidad, 2)
+        total += subtotal
+        items.append({
+            "product_id": str(_oid(TIPOS["productos"], p)),
+            "nombre": nombre,
+            "cantidad": cantidad,
+            "precio_unitario": precio,
+            "subtotal": subtotal,
+        })
+    pagado = rnd.random() < 0.7
+    pedido = {
+        "_id": _oid(TIPOS["pedidos"], i, fecha),
+        "usuario_id": _oid(TIPOS["usuarios"], usuario),
+        "items": items,
+        "total": round(total, 2),
+        "estado": "pagado" if pagado else "pendiente",
+        "fecha": fecha.replace(tzinfo=None),
+    }
+    pago = None
+    if pagado:
+        fecha_pago = fecha + timedelta(minutes=rnd.randint(1, 120))
+        pago = {
+            "_id": _oid(TIPOS["pagos"], i, fecha_pago),
+            "pedido_id": pedido["_id"],
+            "usuario_id": pedido["usuario_id"],
+            "total_pagado": pedido["total"],
+            "metodo_pago": _ctx.metodo_pago(rnd),
+            "fecha_pago": fecha_pago.replace(tzinfo=None),
+        }
+    return pedido, pago
+
+
+def _insertar(coll, docs, batch):
+    insertados = 0
+    for inicio in range(0, len(docs), batch):
+        try:
+            insertados += len(coll.insert_many(docs[inicio:inicio + batch], ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            # Con ordered=False sigue con el resto; los duplicados (re-ejecución) se ignoran
+            insertados += e.details.get("nInserted", 0)
+    return insertados
+
+
+def _tarea(tarea):
+    tipo, inicio, fin = tarea
+    args = _ctx.args
+    db = get_mongo_client()
+    t0 = time.perf_counter()
+    if tipo == "usuarios":
+        cuenta = {"usuarios": _insertar(db["usuarios"], [_usuario(i) for i in range(inicio, fin)], args.batch)}
+    elif tipo == "productos":
+        cuenta = {"productos": _insertar(db["productos"], [_producto(args.seed, i) for i in range(inicio, fin)], args.batch)}
+    else:
+        pedidos, pagos = [], []
+        for i in range(inicio, fin):
+            pedido, pago = _pedido_y_pago(i)
+            pedidos.append(pedido)
+            if pago:
+                pagos.append(pago)
+        cuenta = {
+            "pedidos": _insertar(db["pedidos"], pedidos, args.batch),
+            "pagos": _insertar(db["pagos"], pagos, args.batch),
+        }
+    return cuenta, time.perf_counter() - t0
+
+
+def _tareas(tipo, total):
+    return [(tipo, inicio, min(inicio + TAMANO_TAREA, total)) for inicio in range(0, total, TAMANO_TAREA)]
+
+
+def _cargar_redis(args):
+    # Carritos anónimos y sesiones de usuarios logueados, en pipelines (uno por
+    # nodo si las sesiones están repartidas con REDIS_NODOS)
+    rnd = random.Random(args.seed)
+    ctx = _Contexto(args)
+    t0 = time.perf_counter()
+    pipes = {}
+    claves = 0
+    for n in range(args.carritos + args.sesiones):
+        session_id = str(uuid.UUID(int=rnd.getrandbits(128), version=4))
+        nodo = nodo_sesion(session_id)
+        if nodo not in pipes:
+            pipes[nodo] = get_redis_client_nodo(nodo).pipeline(transaction=False)
+        pipe = pipes[nodo]
+        if n < args.sesiones:
+            u = rnd.randrange(args.usuarios)
+            escribir_sesion(pipe, session_id, _oid(TIPOS["usuarios"], u), f"usuario{u}@example.com")
+            claves += 1
+        if n >= args.sesiones or rnd.random() < 0.5:
+            carrito = {campo_producto(_oid(TIPOS["productos"], ctx.producto_popular(rnd))): rnd.randint(1, 3)
+                       for _ in range(rnd.randint(1, 6))}
+            pipe.hset(clave_carrito(session_id), mapping=carrito)
+            pipe.expire(clave_carrito(session_id), TTL_CARRITO)
+            claves += 1
+        if n % 1000 == 999:
+            for pipe in pipes.values():
+                pipe.execute()
+    for pipe in pipes.values():
+        pipe.execute()
+    return claves, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador y cargador masivo de datos sintéticos")
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help=f"Multiplica las cantidades base {BASE}")
+    parser.add_argument("--usuarios", type=int)
+    parser.add_argument("--productos", type=int)
+    parser.add_argument("--pedidos", type=int)
+    parser.add_argument("--dias", type=int, default=365, help="Rango de fechas de los pedidos")
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=5000, help="Documentos por insert_many")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--carritos", type=int, default=0, help="Carritos anónimos a crear en Redis")
+    parser.add_argument("--sesiones", type=int, default=0, help="Sesiones logueadas a crear en Redis")
+    parser.add_argument("--limpiar", action="store_true", help="Vacía las colecciones antes de cargar")
+    args = parser.parse_args()
+    for nombre, base in BASE.items():
+        if getattr(args, nombre) is None:
+            setattr(args, nombre, max(1, int(base * args.escala)))
+
+    db = get_mongo_client()
+    if args.limpiar:
+        for nombre in ("usuarios", "productos", "pedidos", "pagos"):
+            db[nombre].delete_many({})
+
+    print(f"Generando {args.usuarios} usuarios, {args.productos} productos y "
+          f"{args.pedidos} pedidos con {args.procesos} procesos (seed={args.seed})")
+    totales = {}
+    inicio = time.perf_counter()
+    with Pool(args.procesos, initializer=_init_proceso, initargs=(args,)) as pool:
+        # Usuarios y productos primero; los pedidos solo los referencian por _id
+        for fase in (_tareas("usuarios", args.usuarios) + _tareas("productos", args.productos),
+                     _tareas("pedidos", args.pedidos)):
+            for cuenta, _ in pool.imap_unordered(_tarea, fase):
+                for coleccion, n in cuenta.items():
+                    totales[coleccion] = totales.get(coleccion, 0) + n
+    duracion = time.perf_counter() - inicio
+
+    for coleccion, n in totales.items():
+        print(f"  {coleccion:10} {n:>12,} documentos")
+    total = sum(totales.values())
+    print(f"Total: {total:,} documentos en {duracion:.1f}s ({total / duracion:,.0f} docs/s)")
+
+    if args.carritos or args.sesiones:
+        claves, duracion = _cargar_redis(args)
+        print(f"Redis: {claves:,} claves en {duracion:.1f}s ({claves / duracion:,.0f} claves/s)")
+
+
+if __name__ == "__main__":
+    main()
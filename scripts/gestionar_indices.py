@@ -0,0 +1,45 @@
+# scripts/gestionar_indices.py
+import argparse
+import sys
+
+from db_config import get_mongo_client
+from indices import asegurar_indices, explicar_consultas
+
+
+def aplicar(eliminar_sobrantes):
+    resumen = asegurar_indices(get_mongo_client(), eliminar_sobrantes=eliminar_sobrantes)
+    hubo_errores = False
+    for coleccion, estado in resumen.items():
+        for accion in ("creados", "recreados", "sobrantes", "errores"):
+            for nombre in estado[accion]:
+                print(f"{coleccion}: {accion} {nombre}")
+        hubo_errores = hubo_errores or bool(estado["errores"])
+    print("Índices al día." if not hubo_errores else "Hubo errores al crear índices.")
+    return 1 if hubo_errores else 0
+
+
+def explicar():
+    reporte = explicar_consultas(get_mongo_client())
+    con_collscan = 0
+    for fila in reporte:
+        marca = "COLLSCAN" if fila["collscan"] else "ok"
+        if fila["sort_en_memoria"]:
+            marca += " (SORT en memoria)"
+        print(f"[{marca}] {fila['ruta']} -> {fila['coleccion']}: {' > '.join(fila['etapas'])}")
+        con_collscan += fila["collscan"]
+    print(f"{con_collscan} consulta(s) con COLLSCAN de {len(reporte)}.")
+    return 1 if con_collscan else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gestión de índices de MongoDB")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_aplicar = sub.add_parser("aplicar", help="Crea o actualiza los índices declarados en indices.py")
+    p_aplicar.add_argument("--eliminar-sobrantes", action="store_true",
+                           help="Elimina los índices que no están declarados")
+    sub.add_parser("explicar", help="Ejecuta explain() sobre las consultas de cada ruta")
+    args = parser.parse_args()
+
+    if args.comando == "aplicar":
+        sys.exit(aplicar(args.eliminar_sobrantes))
+    sys.exit(explicar())
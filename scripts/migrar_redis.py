@@ -0,0 +1,144 @@
+# scripts/migrar_redis.py
+# Convierte carritos y sesiones al formato compacto de carrito_repo (o lo
+# revierte). Cada clave se convierte con un script Lua: la app nunca ve un
+# carrito a medio migrar, y el TTL se conserva.
+#
+#   cart:{sid}     HASH hex -> cantidad        =>  c:{sid}  HASH 12 bytes -> cantidad
+#   session:{sid}  HASH user_id, user_email    =>  s:{sid}  STRING user_id (12 bytes)
+#
+# Orden para migrar sin cortar el servicio:
+#   1. python scripts/reporte_memoria.py --comparar     (bytes por clave antes/después)
+#   2. desplegar la app con REDIS_COMPACTO=1            (lee ambos formatos)
+#   3. REDIS_COMPACTO=1 python scripts/migrar_redis.py
+# Para volver atrás: --revertir con la app todavía en modo compacto, desplegar
+# sin REDIS_COMPACTO y repetir --revertir. Las sesiones revertidas no
+# recuperan el email (/ver_sesion lo lee de MongoDB).
+import argparse
+import time
+
+import carrito_repo
+from redis_config import get_redis_client_nodo, nodos_redis
+
+LOTE = 500
+
+# Funciones de conversión de campos; ARGV[1] = '1' compactar, '0' revertir
+_LUA_CONVERTIR = """
+local function convertir(valor)
+  if ARGV[1] == '1' then
+    if #valor == 24 and valor:match('^%x+$') then
+      return (valor:gsub('..', function(par) return string.char(tonumber(par, 16)) end))
+    end
+  elseif #valor == 12 then
+    return (valor:gsub('.', function(c) return string.format('%02x', string.byte(c)) end))
+  end
+  return valor
+end
+"""
+
+# KEYS[1] = carrito origen, KEYS[2] = carrito destino
+# Suma en el destino (la app pudo haber agregado productos allí) y borra el origen
+_LUA_CARRITO = _LUA_CONVERTIR + """
+local items = redis.call('HGETALL', KEYS[1])
+if #items == 0 then
+  return 0
+end
+local ttl = redis.call('PTTL', KEYS[1])
+for i = 1, #items, 2 do
+  redis.call('HINCRBY', KEYS[2], convertir(items[i]), items[i + 1])
+end
+redis.call('DEL', KEYS[1])
+if ttl > 0 and redis.call('PTTL', KEYS[2]) < ttl then
+  redis.call('PEXPIRE', KEYS[2], ttl)
+end
+return 1
+"""
+
+# KEYS[1] = sesión origen, KEYS[2] = sesión destino
+# Si el destino ya existe (login posterior) gana el destino
+_LUA_SESION = _LUA_CONVERTIR + """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+  redis.call('DEL', KEYS[1])
+  return 0
+end
+local user_id
+if ARGV[1] == '1' then
+  user_id = redis.call('HGET', KEYS[1], 'user_id')
+else
+  user_id = redis.call('GET', KEYS[1])
+end
+if not user_id then
+  return 0
+end
+local ttl = redis.call('PTTL', KEYS[1])
+if ARGV[1] == '1' then
+  redis.call('SET', KEYS[2], convertir(user_id))
+else
+  redis.call('HSET', KEYS[2], 'user_id', convertir(user_id))
+end
+if ttl > 0 then
+  redis.call('PEXPIRE', KEYS[2], ttl)
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+TIPOS = {
+    "carritos": (carrito_repo.clave_carrito, _LUA_CARRITO),
+    "sesiones": (carrito_repo.clave_sesion, _LUA_SESION),
+}
+
+
+def migrar(r, compactar=True, lote=LOTE, progreso=None):
+    """Convierte todas las claves del formato de origen. Devuelve {tipo: (revisadas, convertidas)}."""
+    resultado = {}
+    for tipo, (clave, fuente) in TIPOS.items():
+        script = r.register_script(fuente)
+        prefijo = clave("", compacto=not compactar)
+        revisadas = convertidas = 0
+        pendientes = []
+
+        def _convertir(pendientes):
+            pipe = r.pipeline(transaction=False)
+            for origen in pendientes:
+                session_id = origen[len(prefijo):].decode("utf-8")
+                script(keys=[origen, clave(session_id, compacto=compactar)],
+                       args=["1" if compactar else "0"], client=pipe)
+            return sum(pipe.execute())
+
+        for origen in r.scan_iter(match=prefijo + "*", count=lote):
+            pendientes.append(origen)
+            if len(pendientes) >= lote:
+                convertidas += _convertir(pendientes)
+                revisadas += len(pendientes)
+                pendientes = []
+                if progreso:
+                    progreso(tipo, revisadas)
+        if pendientes:
+            convertidas += _convertir(pendientes)
+            revisadas += len(pendientes)
+        resultado[tipo] = (revisadas, convertidas)
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra carritos y sesiones de Redis al formato compacto")
+    parser.add_argument("--revertir", action="store_true", help="Vuelve del formato compacto al anterior")
+    parser.add_argument("--lote", type=int, default=LOTE, help="Claves por pipeline")
+    args = parser.parse_args()
+
+    if not carrito_repo.COMPACTO:
+        print("Aviso: REDIS_COMPACTO no está activo; la app debe correr en modo compacto durante la migración")
+
+    def progreso(tipo, revisadas):
+        print(f"\r{tipo}: {revisadas} clave(s)", end="", flush=True)
+
+    inicio = time.perf_counter()
+    # Cada clave se convierte en su propio nodo: el session_id no cambia
+    for nodo in nodos_redis():
+        print(f"Nodo {nodo}")
+        resultado = migrar(get_redis_client_nodo(nodo), compactar=not args.revertir, lote=args.lote,
+                           progreso=progreso)
+        print()
+        for tipo, (revisadas, convertidas) in resultado.items():
+            print(f"{tipo:<10}{revisadas:>10} revisada(s){convertidas:>10} convertida(s)")
+    print(f"Listo en {time.perf_counter() - inicio:.1f}s")
@@ -0,0 +1,186 @@
+# scripts/rebalancear_redis.py
+# Mueve carritos y sesiones al nodo que les toca según REDIS_NODOS, después de
+# agregar o quitar nodos (o de pasar de un solo Redis a varios). Con hashing
+# consistente solo cambia de dueño ~1/N de las sesiones; el resto no se toca.
+#
+#   REDIS_NODOS=localhost:7001,localhost:7002,localhost:7003 \
+#       python scripts/rebalancear_redis.py --anteriores localhost:7001,localhost:7002
+#
+# Se corre apenas se despliega la app con la lista nueva: hasta que termina,
+# las sesiones que cambiaron de nodo aparecen sin login y con el carrito vacío.
+# --anteriores agrega nodos a recorrer además de los actuales (los que se
+# quitaron). Cada clave se copia con DUMP/RESTORE conservando el TTL; si el
+# destino ya tiene esa clave (la app escribió ahí en el medio), los carritos
+# se suman (quedándose con el TTL mayor) y en las sesiones gana la del destino.
+#
+# Las reservas y inventario:vencimientos viven en el nodo principal. Después de
+# mover carritos se corre su vencimiento si el carrito dura más (ver_carrito
+# pudo renovarlo en el nodo anterior), para que el worker no libere la reserva
+# de un carrito vivo. Los carritos movidos que ya no tienen reserva se cuentan:
+# al confirmar toman las unidades del stock.
+import argparse
+import math
+import time
+
+import redis
+
+import carrito_repo
+import inventario
+from redis_config import REPARTIDO, get_redis_client, get_redis_client_nodo, leer_nodos, nodo_sesion, nodos_redis
+
+LOTE = 500
+PREFIJOS_CARRITO = (carrito_repo.clave_carrito("", compacto=False), carrito_repo.clave_carrito("", compacto=True))
+PREFIJOS_SESION = (carrito_repo.clave_sesion("", compacto=False), carrito_repo.clave_sesion("", compacto=True))
+
+# KEYS[1] = carrito en el destino; ARGV = ttl del origen (ms), campo1, cantidad1, ...
+# Suma el carrito del origen y conserva el TTL mayor (como _LUA_CARRITO de
+# migrar_redis.py). Devuelve el TTL resultante (ms)
+_LUA_SUMAR = """
+for i = 2, #ARGV, 2 do
+  redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+local ttl = tonumber(ARGV[1])
+if ttl > 0 and redis.call('PTTL', KEYS[1]) < ttl then
+  redis.call('PEXPIRE', KEYS[1], ttl)
+end
+return redis.call('PTTL', KEYS[1])
+"""
+
+# En el nodo principal. KEYS[1] = vencimientos; ARGV = ahora, prefijo de reserva, sid1, ttl1 (s), ...
+# Corre el vencimiento de los carritos movidos que duran más que lo anotado.
+# Devuelve cuántos ya no tenían reserva
+_LUA_VENCIMIENTOS = """
+local sin_reserva = 0
+for i = 3, #ARGV, 2 do
+  if redis.call('EXISTS', ARGV[2] .. ARGV[i]) == 1 then
+    local vence = tonumber(ARGV[1]) + tonumber(ARGV[i + 1])
+    local actual = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if not actual or tonumber(actual) < vence then
+      redis.call('ZADD', KEYS[1], vence, ARGV[i])
+    end
+  else
+    sin_reserva = sin_reserva + 1
+  end
+end
+return sin_reserva
+"""
+
+
+def _session_id(clave):
+    return clave.split(b":", 1)[1].decode("utf-8")
+
+
+def _es_carrito(clave):
+    return clave.decode("utf-8").startswith(PREFIJOS_CARRITO)
+
+
+def _ajustar_vencimientos(ttls):
+    """{session_id: ttl en ms} de carritos movidos. Devuelve cuántos no tenían reserva."""
+    args = [int(time.time()), inventario.PREFIJO_RESERVA]
+    for session_id, ttl in ttls.items():
+        if ttl > 0:
+            args += [session_id, math.ceil(ttl / 1000)]
+    if len(args) == 2:
+        return 0
+    r = get_redis_client()
+    return r.register_script(_LUA_VENCIMIENTOS)(keys=[inventario.CLAVE_VENCIMIENTOS], args=args, client=r)
+
+
+def mover(origen, destino, claves):
+    """Mueve `claves` de un nodo a otro. Devuelve (movidas, carritos movidos sin reserva)."""
+    pipe = origen.pipeline(transaction=False)
+    for clave in claves:
+        pipe.dump(clave)
+        pipe.pttl(clave)
+    respuestas = pipe.execute()
+
+    pipe = destino.pipeline(transaction=False)
+    copiadas = []
+    for i, clave in enumerate(claves):
+        volcado, ttl = respuestas[2 * i], respuestas[2 * i + 1]
+        if volcado is None:
+            continue  # venció mientras tanto
+        pipe.restore(clave, max(ttl, 0), volcado)
+        copiadas.append(clave)
+    ttl_origen = {clave: respuestas[2 * i + 1] for i, clave in enumerate(claves)}
+    ttls = {}
+    ocupadas = []
+    for clave, resultado in zip(copiadas, pipe.execute(raise_on_error=False)):
+        if isinstance(resultado, redis.ResponseError) and "BUSYKEY" in str(resultado):
+            ocupadas.append(clave)
+        elif isinstance(resultado, Exception):
+            raise resultado
+        elif _es_carrito(clave):
+            ttls[_session_id(clave)] = ttl_origen[clave]
+
+    sumar = destino.register_script(_LUA_SUMAR)
+    for clave in ocupadas:
+        if _es_carrito(clave):
+            args = [ttl_origen[clave]]
+            for campo, cantidad in origen.hgetall(clave).items():
+                args += [campo, int(cantidad)]
+            ttls[_session_id(clave)] = sumar(keys=[clave], args=args, client=destino)
+    if copiadas:
+        origen.delete(*copiadas)
+    return len(copiadas), _ajustar_vencimientos(ttls)
+
+
+def rebalancear(nodos, simular=False, lote=LOTE, progreso=None):
+    """
+    Recorre `nodos` y mueve las claves que pertenecen a otro.
+    Devuelve {nodo: (revisadas, movidas, carritos movidos sin reserva)}.
+    """
+    resultado = {}
+    for nodo in nodos:
+        r = get_redis_client_nodo(nodo)
+        revisadas = movidas = sin_reserva = 0
+        for prefijo in PREFIJOS_CARRITO + PREFIJOS_SESION:
+            por_destino = {}
+            for clave in r.scan_iter(match=prefijo + "*", count=lote):
+                revisadas += 1
+                destino = nodo_sesion(_session_id(clave))
+                if destino == nodo:
+                    continue
+                if simular:
+                    movidas += 1
+                    continue
+                pendientes = por_destino.setdefault(destino, [])
+                pendientes.append(clave)
+                if len(pendientes) >= lote:
+                    n, sin = mover(r, get_redis_client_nodo(destino), pendientes)
+                    movidas += n
+                    sin_reserva += sin
+                    por_destino[destino] = []
+                    if progreso:
+                        progreso(nodo, movidas)
+            for destino, pendientes in por_destino.items():
+                if pendientes:
+                    n, sin = mover(r, get_redis_client_nodo(destino), pendientes)
+                    movidas += n
+                    sin_reserva += sin
+        resultado[nodo] = (revisadas, movidas, sin_reserva)
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reparte carritos y sesiones entre los nodos de REDIS_NODOS")
+    parser.add_argument("--anteriores", default="", help="Nodos a recorrer además de los actuales (host:puerto[/db],...)")
+    parser.add_argument("--simular", action="store_true", help="Solo cuenta cuántas claves se moverían")
+    parser.add_argument("--lote", type=int, default=LOTE, help="Claves por pipeline")
+    args = parser.parse_args()
+
+    if not REPARTIDO:
+        parser.error("REDIS_NODOS no está definido: todas las sesiones están en el nodo principal")
+
+    def progreso(nodo, movidas):
+        print(f"\r{nodo}: {movidas} clave(s) movida(s)", end="", flush=True)
+
+    inicio = time.perf_counter()
+    resultado = rebalancear(nodos_redis(leer_nodos(args.anteriores)), args.simular, args.lote, progreso)
+    print()
+    verbo = "a mover" if args.simular else "movida(s)"
+    for nodo, (revisadas, movidas, sin_reserva) in resultado.items():
+        print(f"{nodo:<28}{revisadas:>10} revisada(s){movidas:>10} {verbo}")
+        if sin_reserva:
+            print(f"{'':<28}{sin_reserva:>10} carrito(s) movido(s) sin reserva")
+    print(f"Listo en {time.perf_counter() - inicio:.1f}s")
@@ -0,0 +1,16 @@
+# scripts/reindexar_busqueda.py
+import argparse
+import time
+
+import busqueda
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruye el índice de autocompletado de productos en Redis")
+    parser.add_argument("--batch", type=int, default=busqueda.BATCH_RECONSTRUIR,
+                        help="Productos por pipeline de Redis")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    total = busqueda.reconstruir(args.batch)
+    print(f"{total} productos indexados en {time.perf_counter() - inicio:.1f}s.")
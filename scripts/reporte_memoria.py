@@ -0,0 +1,188 @@
+# scripts/reporte_memoria.py
+# Huella en memoria de Redis por grupo de claves (sesiones, carritos, cache de
+# productos): cantidad de claves, cuántas no tienen TTL y bytes estimados a
+# partir de una muestra con MEMORY USAGE.
+#
+#   python scripts/reporte_memoria.py
+#   python scripts/reporte_memoria.py --muestra 5000
+#   # sesiones viejas, creadas antes de que tuvieran TTL
+#   python scripts/reporte_memoria.py --aplicar-ttl-sesiones
+#   # bytes por carrito y por sesión antes/después del formato compacto
+#   python scripts/reporte_memoria.py --comparar
+import argparse
+
+from bson import ObjectId
+
+import carrito_repo
+from redis_config import get_redis_client_nodo, nodos_redis
+from carrito_repo import TTL_SESION
+
+GRUPOS = {
+    "sesiones": "session:*",
+    "carritos": "cart:*",
+    "sesiones_compactas": "s:*",
+    "carritos_compactos": "c:*",
+    "productos": "producto:*",
+    "reservas": "reserva:*",
+    "inventario": "inventario:*",
+    "operaciones": "operacion:*",
+    "categorias": "categorias:*",
+}
+
+
+def _formato_bytes(n):
+    for unidad in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.1f} {unidad}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def analizar(r, patron, muestra, lote=1000):
+    """Recorre el patrón con SCAN. Devuelve claves, sin_ttl y bytes de la muestra."""
+    claves = sin_ttl = 0
+    bytes_muestra = claves_muestra = 0
+    pendientes = []
+
+    def _procesar(pendientes):
+        nonlocal sin_ttl, bytes_muestra, claves_muestra
+        pipe = r.pipeline(transaction=False)
+        medir = []
+        for clave in pendientes:
+            pipe.ttl(clave)
+            medir.append(claves_muestra + len(medir) < muestra)
+            if medir[-1]:
+                pipe.memory_usage(clave)
+        respuestas = iter(pipe.execute())
+        for medida in medir:
+            if next(respuestas) == -1:
+                sin_ttl += 1
+            if medida:
+                bytes_muestra += next(respuestas) or 0
+                claves_muestra += 1
+
+    for clave in r.scan_iter(match=patron, count=lote):
+        claves += 1
+        pendientes.append(clave)
+        if len(pendientes) >= lote:
+            _procesar(pendientes)
+            pendientes = []
+    if pendientes:
+        _procesar(pendientes)
+
+    promedio = bytes_muestra / claves_muestra if claves_muestra else 0
+    return {"claves": claves, "sin_ttl": sin_ttl, "promedio": promedio, "estimado": promedio * claves}
+
+
+def _copia_temporal(clave):
+    # Mismo largo que la clave compacta real (c:/s: -> ~:), porque MEMORY USAGE
+    # incluye el nombre de la clave
+    return b"~" + clave[1:]
+
+
+def comparar(r, muestra, lote=1000):
+    """
+    Mide con MEMORY USAGE una muestra de carritos y sesiones en el formato
+    anterior y una copia temporal de cada una en el formato compacto.
+    Devuelve {tipo: {muestra, antes, despues, hashtable}} con promedios por clave;
+    hashtable = copias que quedaron fuera de la codificación listpack.
+    """
+    resultado = {}
+    for tipo in ("carritos", "sesiones"):
+        antes = despues = medidas = hashtable = 0
+        for clave in r.scan_iter(match=GRUPOS[tipo], count=lote):
+            if medidas >= muestra:
+                break
+            session_id = clave.split(b":", 1)[1].decode("utf-8")
+            if tipo == "carritos":
+                items = r.hgetall(clave)
+                if not items:
+                    continue
+                copia = _copia_temporal(carrito_repo.clave_carrito(session_id, compacto=True).encode("utf-8"))
+                pipe = r.pipeline(transaction=False)
+                pipe.hset(copia, mapping={carrito_repo.campo_producto(k.decode("utf-8"), compacto=True): v
+                                          for k, v in items.items()})
+                pipe.object("encoding", copia)
+            else:
+                user_id = r.hget(clave, "user_id")
+                if not user_id:
+                    continue
+                copia = _copia_temporal(carrito_repo.clave_sesion(session_id, compacto=True).encode("utf-8"))
+                pipe = r.pipeline(transaction=False)
+                pipe.set(copia, ObjectId(user_id.decode("utf-8")).binary)
+                pipe.object("encoding", copia)
+            pipe.memory_usage(clave)
+            pipe.memory_usage(copia)
+            pipe.delete(copia)
+            _, codificacion, bytes_antes, bytes_despues, _ = pipe.execute()
+            if bytes_antes is None or bytes_despues is None:
+                continue
+            antes += bytes_antes
+            despues += bytes_despues
+            medidas += 1
+            if codificacion in (b"hashtable", "hashtable"):
+                hashtable += 1
+        resultado[tipo] = {
+            "muestra": medidas,
+            "antes": antes / medidas if medidas else 0,
+            "despues": despues / medidas if medidas else 0,
+            "hashtable": hashtable,
+        }
+    return resultado
+
+
+def aplicar_ttl_sesiones(r, ttl, lote=1000):
+    """Pone TTL a las sesiones que no lo tienen. Devuelve cuántas se actualizaron."""
+    actualizadas = 0
+    pendientes = []
+    for clave in r.scan_iter(match=GRUPOS["sesiones"], count=lote):
+        pendientes.append(clave)
+        if len(pendientes) >= lote:
+            actualizadas += _expirar_sin_ttl(r, pendientes, ttl)
+            pendientes = []
+    if pendientes:
+        actualizadas += _expirar_sin_ttl(r, pendientes, ttl)
+    return actualizadas
+
+
+def _expirar_sin_ttl(r, claves, ttl):
+    pipe = r.pipeline(transaction=False)
+    for clave in claves:
+        # NX: solo si la clave todavía no tiene TTL (Redis >= 7)
+        pipe.expire(clave, ttl, nx=True)
+    return sum(1 for ok in pipe.execute() if ok)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reporte de memoria de Redis por grupo de claves")
+    parser.add_argument("--muestra", type=int, default=1000, help="Claves por grupo medidas con MEMORY USAGE")
+    parser.add_argument("--comparar", action="store_true",
+                        help="Compara bytes por carrito y por sesión con el formato compacto (ver migrar_redis.py)")
+    parser.add_argument("--aplicar-ttl-sesiones", action="store_true",
+                        help=f"Pone TTL ({TTL_SESION}s) a las sesiones que no tienen")
+    args = parser.parse_args()
+
+    # Con REDIS_NODOS, un reporte por nodo (principal primero)
+    nodos = nodos_redis()
+    for nodo in nodos:
+        r = get_redis_client_nodo(nodo)
+        if len(nodos) > 1:
+            print(f"\n== Nodo {nodo} ==")
+        if args.aplicar_ttl_sesiones:
+            print(f"Sesiones sin TTL actualizadas: {aplicar_ttl_sesiones(r, TTL_SESION)}")
+
+        info = r.info("memory")
+        print(f"Memoria usada por Redis: {info['used_memory_human']} (pico {info['used_memory_peak_human']})")
+        print(f"{'grupo':20}{'claves':>12}{'sin TTL':>12}{'prom./clave':>14}{'estimado':>14}")
+        for nombre, patron in GRUPOS.items():
+            fila = analizar(r, patron, args.muestra)
+            print(f"{nombre:20}{fila['claves']:>12}{fila['sin_ttl']:>12}"
+                  f"{_formato_bytes(fila['promedio']):>14}{_formato_bytes(fila['estimado']):>14}")
+
+        if args.comparar:
+            print()
+            print(f"{'formato compacto':20}{'muestra':>12}{'antes':>12}{'después':>12}{'ahorro':>10}{'hashtable':>12}")
+            for tipo, fila in comparar(r, args.muestra).items():
+                ahorro = 1 - fila["despues"] / fila["antes"] if fila["antes"] else 0
+                print(f"{tipo:20}{fila['muestra']:>12}{_formato_bytes(fila['antes']):>12}"
+                      f"{_formato_bytes(fila['despues']):>12}{ahorro:>10.0%}{fila['hashtable']:>12}")
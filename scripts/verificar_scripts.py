@@ -0,0 +1,105 @@
+# scripts/verificar_scripts.py
+# Chequeo rápido de que los scripts de esta carpeta pueden importar la app.
+# Al correr "python scripts/<nombre>.py", Python pone scripts/ primero en
+# sys.path: un script con el mismo nombre que un módulo de la raíz (por
+# ejemplo scripts/inventario.py) se importaría en lugar de ese módulo, y todo
+# lo que lo usa (app incluida) fallaría. Por eso los CLI se llaman cli_*.py.
+#
+#   python scripts/verificar_scripts.py          # se corre igual que los demás scripts
+#
+# 1. Compara los nombres de scripts/ con los módulos y paquetes de la raíz
+#    (no necesita dependencias instaladas).
+# 2. Importa app (y app_async si está Quart) desde este mismo contexto y
+#    verifica que ningún módulo de la raíz se haya cargado desde scripts/.
+# 3. Con Quart, compara las rutas de las dos apps: lo que app_async.py no
+#    sirve tiene que figurar en app_async.SOLO_SINCRONO.
+# Termina con código 1 si encuentra algún problema.
+import importlib
+import importlib.util
+import os
+import re
+import sys
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(SCRIPTS)
+APPS = (("app", None), ("app_async", "quart"))
+
+
+def _modulos(carpeta):
+    nombres = set()
+    for nombre in os.listdir(carpeta):
+        ruta = os.path.join(carpeta, nombre)
+        if nombre.endswith(".py") and nombre != "__init__.py":
+            nombres.add(nombre[:-3])
+        elif os.path.isfile(os.path.join(ruta, "__init__.py")):
+            nombres.add(nombre)
+    return nombres
+
+
+def colisiones():
+    """Scripts que tapan a un módulo o paquete de la raíz."""
+    return sorted(_modulos(SCRIPTS) & _modulos(RAIZ))
+
+
+def importar_apps():
+    """Importa las apps como lo haría cualquier script. Devuelve la lista de errores."""
+    errores = []
+    for modulo, requiere in APPS:
+        if requiere and importlib.util.find_spec(requiere) is None:
+            continue
+        try:
+            importlib.import_module(modulo)
+        except Exception as e:
+            errores.append(f"import {modulo}: {e!r}")
+    for nombre in _modulos(RAIZ):
+        archivo = getattr(sys.modules.get(nombre), "__file__", None)
+        if archivo and os.path.dirname(os.path.abspath(archivo)) == SCRIPTS:
+            errores.append(f"{nombre} se cargó desde scripts/ en lugar de la raíz")
+    return errores
+
+
+def _regla(texto):
+    # Los nombres y conversores de las variables difieren entre las dos apps
+    return re.sub(r"<[^>]*>", "<>", texto)
+
+
+def _rutas(app):
+    rutas = set()
+    for regla in app.url_map.iter_rules():
+        if regla.endpoint != "static":
+            rutas |= {(_regla(regla.rule), metodo) for metodo in regla.methods - {"HEAD", "OPTIONS"}}
+    return rutas
+
+
+def diferencias_rutas():
+    """Rutas de app.py que app_async.py no sirve sin figurar en SOLO_SINCRONO, y viceversa."""
+    if importlib.util.find_spec("quart") is None:
+        return []
+    import app
+    import app_async
+    sincronas = _rutas(app.create_app())
+    asincronas = _rutas(app_async.app)
+    excluidas = {_regla(texto) for texto in app_async.SOLO_SINCRONO}
+    errores = [f"{metodo} {regla} falta en app_async.py (o en SOLO_SINCRONO)"
+               for regla, metodo in sorted(sincronas - asincronas) if regla not in excluidas]
+    errores += [f"{metodo} {regla} está en app_async.py pero no en app.py"
+                for regla, metodo in sorted(asincronas - sincronas)]
+    errores += [f"app_async.py ya sirve {regla}: sacarla de SOLO_SINCRONO"
+                for regla in sorted(excluidas & {regla for regla, _ in asincronas})]
+    return errores
+
+
+if __name__ == "__main__":
+    problemas = [f"scripts/{nombre}.py tapa al módulo {nombre} de la raíz" for nombre in colisiones()]
+    if RAIZ not in sys.path:
+        # Igual que el Dockerfile (PYTHONPATH=/app)
+        sys.path.append(RAIZ)
+    # create_app() no lanza el thread de inventario
+    os.environ.setdefault("INVENTARIO_WORKER", "0")
+    errores_import = importar_apps()
+    problemas += errores_import or diferencias_rutas()
+    for problema in problemas:
+        print(f"ERROR: {problema}")
+    if problemas:
+        sys.exit(1)
+    print("OK: los scripts pueden importar la app y app_async.py sirve lo declarado")
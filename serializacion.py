@@ -0,0 +1,115 @@
+# serializacion.py
+from datetime import datetime, timezone
+from decimal import Decimal
+from bson import ObjectId, Decimal128
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # sin orjson se usa el json de la librería estándar
+    orjson = None
+    import json
+
+try:
+    import msgpack
+except ImportError:  # sin msgpack solo se responde JSON
+    msgpack = None
+
+# Proveedor JSON para Flask y Quart que entiende los tipos de BSON, así los
+# handlers devuelven los documentos tal como salen del cursor:
+#   ObjectId   -> "65f1c0..."          (string hexadecimal)
+#   datetime   -> "2025-03-01T12:00:00+00:00" (ISO 8601; las fechas de MongoDB son UTC)
+#   Decimal128 -> "19.99"              (string, para no perder precisión)
+# Con orjson la codificación se hace en C y genera bytes directamente.
+#
+# Si el cliente envía "Accept: application/msgpack" (y msgpack está instalado)
+# jsonify() responde MessagePack con los mismos datos; las fechas viajan como
+# el timestamp nativo de MessagePack. Ver negociacion.py para la compresión y
+# los cuerpos de request en MessagePack.
+
+MIMETYPE_MSGPACK = "application/msgpack"
+MIMETYPES_MSGPACK = (MIMETYPE_MSGPACK, "application/x-msgpack")
+
+
+def _convertir_bson(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, datetime):  # solo en el fallback: orjson ya serializa datetime
+        return obj.isoformat() if obj.tzinfo else obj.isoformat() + "+00:00"
+    raise TypeError(f"Objeto de tipo {type(obj).__name__} no serializable a JSON")
+
+
+def _convertir_msgpack(obj):
+    if isinstance(obj, datetime):
+        # Las fechas de MongoDB son UTC sin tzinfo
+        return msgpack.Timestamp.from_datetime(obj if obj.tzinfo else obj.replace(tzinfo=timezone.utc))
+    return _convertir_bson(obj)
+
+
+def dumps_msgpack(obj):
+    return msgpack.packb(obj, default=_convertir_msgpack, use_bin_type=True)
+
+
+def loads_msgpack(datos):
+    return msgpack.unpackb(datos, raw=False, timestamp=3)
+
+
+def responde_msgpack():
+    """True si el request en curso pide MessagePack y se le puede responder así."""
+    return msgpack is not None and _acepta_msgpack()
+
+
+def _acepta_msgpack():
+    # El proveedor lo usan Flask y Quart: se mira el request de la que esté activa
+    import flask
+    if flask.has_request_context():
+        accept = flask.request.accept_mimetypes
+    else:
+        try:
+            import quart
+        except ImportError:
+            return False
+        if not quart.has_request_context():
+            return False
+        accept = quart.request.accept_mimetypes
+    opciones = ("application/json",) + MIMETYPES_MSGPACK
+    return accept.best_match(opciones, default="application/json") in MIMETYPES_MSGPACK
+
+
+class ProveedorJSONBSON(JSONProvider):
+    mimetype = "application/json"
+
+    if orjson is not None:
+        _OPCIONES = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+        def dumps_bytes(self, obj):
+            return orjson.dumps(obj, default=_convertir_bson, option=self._OPCIONES)
+
+        def dumps(self, obj, **kwargs):
+            return self.dumps_bytes(obj).decode("utf-8")
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+    else:
+        def dumps_bytes(self, obj):
+            return self.dumps(obj).encode("utf-8")
+
+        def dumps(self, obj, **kwargs):
+            return json.dumps(obj, default=_convertir_bson, ensure_ascii=False, separators=(",", ":"))
+
+        def loads(self, s, **kwargs):
+            return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Igual que jsonify(), pero sin pasar por str: el cuerpo ya son bytes
+        obj = self._prepare_response_obj(args, kwargs)
+        if responde_msgpack():
+            respuesta = self._app.response_class(dumps_msgpack(obj), mimetype=MIMETYPE_MSGPACK)
+        else:
+            respuesta = self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+        respuesta.vary.add("Accept")
+        return respuesta
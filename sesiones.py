@@ -0,0 +1,63 @@
+# sesiones.py
+import os
+import uuid
+from flask import g, session
+
+import carrito_repo
+from cache_productos import CacheLRU
+
+# Sesiones de la tienda (app.py):
+#   - El id de sesión (cookie firmada de Flask) se crea solo cuando hace falta:
+#     al loguearse o al agregar algo al carrito. Las visitas anónimas al
+#     catálogo no generan cookie ni claves en Redis.
+#   - session:{id} (s:{id} en modo compacto) tiene TTL deslizante (carrito_repo.TTL_SESION), que
+#     se renueva cada vez que se resuelve el usuario desde Redis.
+#   - El usuario se resuelve una vez por request (flask.g) y se guarda unos
+#     segundos en un LRU del proceso, para no consultar Redis en cada request.
+#     Un logout hecho en otro worker puede tardar hasta SESION_CACHE_TTL en
+#     verse en este.
+
+CACHE_TTL = float(os.environ.get("SESION_CACHE_TTL", 5))
+CACHE_TAMANO = int(os.environ.get("SESION_CACHE_TAMANO", 10000))
+
+_usuarios = CacheLRU(CACHE_TAMANO, CACHE_TTL)
+
+
+def id_sesion(crear=False):
+    """Devuelve el id de sesión del request; con crear=True lo genera si no existe."""
+    session_id = session.get("user_session_id")
+    if session_id is None and crear:
+        session_id = session["user_session_id"] = str(uuid.uuid4())
+    return session_id
+
+
+def usuario_actual():
+    """Devuelve el user_id (str) logueado en la sesión, o None."""
+    if "usuario_id" in g:
+        return g.usuario_id
+    user_id = None
+    session_id = id_sesion()
+    if session_id:
+        user_id = _usuarios.obtener(session_id)
+        if user_id is None:
+            user_id = carrito_repo.usuario_de_sesion(session_id)
+            if user_id:
+                _usuarios.guardar(session_id, user_id)
+    g.usuario_id = user_id
+    return user_id
+
+
+def iniciar_sesion(user_id, email):
+    session_id = id_sesion(crear=True)
+    carrito_repo.guardar_sesion(session_id, user_id, email)
+    _usuarios.guardar(session_id, str(user_id))
+    g.usuario_id = str(user_id)
+    return session_id
+
+
+def cerrar_sesion():
+    session_id = session.pop("user_session_id", None)
+    if session_id:
+        carrito_repo.borrar_sesion(session_id)
+        _usuarios.borrar(session_id)
+    g.usuario_id = None
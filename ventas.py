@@ -0,0 +1,243 @@
+# ventas.py
+import logging
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from db_config import get_mongo_client
+from indices import INDICES
+
+# Rollups de ventas por hora y por día en la colección ventas_rollup. Hay dos
+# tipos de documento por bucket (g = "h" u "d", t = inicio del bucket en UTC):
+#   totales   {_id: "d:20250301", g, t, n, u, r,
+#              e: {estado: {n, r}},            pedidos por estado (fecha del pedido)
+#              m: {metodo_pago: {n, r}}}       pagos por método (fecha del pago)
+#   producto  {_id: "d:20250301:<product_id>", g, t, p, n, u, r}
+# n = pedidos (o pagos), u = unidades, r = ingresos. Los nombres cortos
+# mantienen chicos los documentos.
+#
+# confirmar_pedido y facturar_pedido suman al guardar (registrar_pedido /
+# registrar_pago): un $inc con upsert por bucket, en un solo bulk_write. Los
+# cambios hechos por el CRUD de pedidos no se reflejan hasta reconstruir().
+# Los reportes (crud/crud_ventas.py) leen solo esta colección.
+
+COLECCION = "ventas_rollup"
+GRANULARIDADES = {"h": ("hour", "%Y%m%d%H"), "d": ("day", "%Y%m%d")}
+
+log = logging.getLogger(__name__)
+
+
+def inicio_bucket(fecha, g):
+    if g == "h":
+        return fecha.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    return fecha.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def _id_bucket(g, t, producto_id=None):
+    _, formato = GRANULARIDADES[g]
+    clave = f"{g}:{t.strftime(formato)}"
+    return f"{clave}:{producto_id}" if producto_id else clave
+
+
+def _clave(valor):
+    # Estados y métodos de pago son claves de subdocumento: sin "." ni "$" inicial
+    return str(valor or "sin_dato").replace(".", "_").lstrip("$") or "sin_dato"
+
+
+def fecha_pedido(pedido):
+    # Los pedidos anteriores al campo fecha usan el tiempo de su ObjectId
+    return pedido.get("fecha") or pedido["_id"].generation_time.replace(tzinfo=None)
+
+
+def _inc(g, fecha, incrementos, producto_id=None):
+    t = inicio_bucket(fecha, g)
+    inserto = {"g": g, "t": t}
+    if producto_id:
+        inserto["p"] = ObjectId(producto_id)
+    return UpdateOne({"_id": _id_bucket(g, t, producto_id)},
+                     {"$inc": incrementos, "$setOnInsert": inserto}, upsert=True)
+
+
+def _ops_pedido(pedido):
+    fecha = fecha_pedido(pedido)
+    total = pedido.get("total", 0)
+    estado = _clave(pedido.get("estado", "pendiente"))
+    unidades = sum(item.get("cantidad", 0) for item in pedido.get("items", []))
+    ops = []
+    for g in GRANULARIDADES:
+        ops.append(_inc(g, fecha, {"n": 1, "u": unidades, "r": total,
+                                   f"e.{estado}.n": 1, f"e.{estado}.r": total}))
+        for item in pedido.get("items", []):
+            ops.append(_inc(g, fecha, {"n": 1, "u": item.get("cantidad", 0), "r": item.get("subtotal", 0)},
+                            item["product_id"]))
+    return ops
+
+
+def _ops_pago(fecha_del_pedido, pago, anterior="pendiente"):
+    monto = pago.get("total_pagado", 0)
+    anterior = _clave(anterior)
+    metodo = _clave(pago.get("metodo_pago"))
+    ops = []
+    for g in GRANULARIDADES:
+        # El pedido pasa de estado en su propio bucket; el pago cuenta en el de su fecha
+        ops.append(_inc(g, fecha_del_pedido, {f"e.{anterior}.n": -1, f"e.{anterior}.r": -monto,
+                                              "e.pagado.n": 1, "e.pagado.r": monto}))
+        ops.append(_inc(g, pago["fecha_pago"], {f"m.{metodo}.n": 1, f"m.{metodo}.r": monto}))
+    return ops
+
+
+def _aplicar(ops):
+    if not ops:
+        return
+    try:
+        get_mongo_client()[COLECCION].bulk_write(ops, ordered=False)
+    except PyMongoError:
+        # La venta ya quedó guardada: reconstruir() corrige el desvío
+        log.warning("No se pudieron actualizar los rollups de ventas (%d operaciones)", len(ops))
+
+
+def registrar_pedido(pedido):
+    """Suma un pedido confirmado a sus buckets por hora y por día."""
+    registrar_pedidos([pedido])
+
+
+def registrar_pedidos(pedidos):
+    _aplicar([op for pedido in pedidos for op in _ops_pedido(pedido)])
+
+
+def registrar_pago(pedido, pago):
+    """Pasa el pedido a pagado en sus buckets y suma el pago a su método."""
+    _aplicar(_ops_pago(fecha_pedido(pedido), pago, pedido.get("estado", "pendiente")))
+
+
+def registrar_pagos(pagos):
+    """Igual que registrar_pago para una tanda; lee las fechas de los pedidos en una consulta."""
+    if not pagos:
+        return
+    ids = list({pago["pedido_id"] for pago in pagos})
+    pedidos = {p["_id"]: p for p in get_mongo_client()["pedidos"].find({"_id": {"$in": ids}}, {"fecha": 1})}
+    ops = []
+    for pago in pagos:
+        pedido = pedidos.get(pago["pedido_id"])
+        if pedido:
+            ops.extend(_ops_pago(fecha_pedido(pedido), pago))
+    _aplicar(ops)
+
+
+# --- Lectura ---
+
+def _rango(desde, hasta):
+    return {"$gte": desde, "$lt": hasta}
+
+
+def serie(g, desde, hasta):
+    """Totales por bucket en [desde, hasta), ordenados por fecha."""
+    cursor = get_mongo_client()[COLECCION].find(
+        {"g": g, "p": None, "t": _rango(desde, hasta)}, {"_id": 0, "g": 0}).sort("t", 1)
+    return list(cursor)
+
+
+def serie_producto(g, producto_id, desde, hasta):
+    cursor = get_mongo_client()[COLECCION].find(
+        {"g": g, "p": ObjectId(producto_id), "t": _rango(desde, hasta)}, {"_id": 0, "g": 0, "p": 0}).sort("t", 1)
+    return list(cursor)
+
+
+def productos(g, desde, hasta, limite):
+    """Productos con más ingresos en [desde, hasta)."""
+    return list(get_mongo_client()[COLECCION].aggregate([
+        {"$match": {"g": g, "t": _rango(desde, hasta), "p": {"$ne": None}}},
+        {"$group": {"_id": "$p", "n": {"$sum": "$n"}, "u": {"$sum": "$u"}, "r": {"$sum": "$r"}}},
+        {"$sort": {"r": -1}},
+        {"$limit": limite},
+    ]))
+
+
+def sumar(buckets):
+    """Suma una serie en un solo total (incluidos estados y métodos de pago)."""
+    total = {"n": 0, "u": 0, "r": 0, "e": {}, "m": {}}
+    for b in buckets:
+        for campo in ("n", "u", "r"):
+            total[campo] += b.get(campo, 0)
+        for mapa in ("e", "m"):
+            for clave, valores in b.get(mapa, {}).items():
+                acumulado = total[mapa].setdefault(clave, {"n": 0, "r": 0})
+                acumulado["n"] += valores.get("n", 0)
+                acumulado["r"] += valores.get("r", 0)
+    return total
+
+
+# --- Reconstrucción desde pedidos y pagos ---
+
+def _pipelines(g, destino, desde=None):
+    unidad, formato = GRANULARIDADES[g]
+    fecha = {"$ifNull": ["$fecha", {"$toDate": "$_id"}]}
+    filtro = [{"$match": {"f": {"$gte": desde}}}] if desde else []
+
+    def bucket(campo):
+        return {"$dateTrunc": {"date": campo, "unit": unidad}}
+
+    def _id(*extra):
+        return {"$concat": [f"{g}:", {"$dateToString": {"date": "$_id.t", "format": formato}}, *extra]}
+
+    def clave(campo, defecto):
+        return {"$replaceAll": {"input": {"$ifNull": [campo, defecto]}, "find": ".", "replacement": "_"}}
+
+    merge = {"$merge": {"into": destino, "on": "_id", "whenMatched": "merge", "whenNotMatched": "insert"}}
+    por_producto = [
+        {"$addFields": {"f": fecha}}, *filtro,
+        {"$unwind": "$items"},
+        {"$group": {"_id": {"t": bucket("$f"), "p": "$items.product_id"},
+                    "n": {"$sum": 1}, "u": {"$sum": "$items.cantidad"}, "r": {"$sum": "$items.subtotal"}}},
+        {"$project": {"_id": _id(":", {"$toString": "$_id.p"}), "g": {"$literal": g}, "t": "$_id.t",
+                      "p": {"$toObjectId": "$_id.p"}, "n": 1, "u": 1, "r": 1}},
+        merge,
+    ]
+    totales = [
+        {"$addFields": {"f": fecha}}, *filtro,
+        {"$group": {"_id": {"t": bucket("$f"), "e": clave("$estado", "pendiente")},
+                    "n": {"$sum": 1}, "r": {"$sum": "$total"}, "u": {"$sum": {"$sum": "$items.cantidad"}}}},
+        {"$group": {"_id": {"t": "$_id.t"}, "n": {"$sum": "$n"}, "u": {"$sum": "$u"}, "r": {"$sum": "$r"},
+                    "e": {"$push": {"k": "$_id.e", "v": {"n": "$n", "r": "$r"}}}}},
+        {"$project": {"_id": _id(), "g": {"$literal": g}, "t": "$_id.t", "n": 1, "u": 1, "r": 1,
+                      "e": {"$arrayToObject": "$e"}}},
+        merge,
+    ]
+    pagos = [
+        {"$addFields": {"f": "$fecha_pago"}}, *filtro,
+        {"$group": {"_id": {"t": bucket("$f"), "m": clave("$metodo_pago", "sin_dato")},
+                    "n": {"$sum": 1}, "r": {"$sum": "$total_pagado"}}},
+        {"$group": {"_id": {"t": "$_id.t"}, "m": {"$push": {"k": "$_id.m", "v": {"n": "$n", "r": "$r"}}}}},
+        {"$project": {"_id": _id(), "g": {"$literal": g}, "t": "$_id.t", "m": {"$arrayToObject": "$m"}}},
+        merge,
+    ]
+    return [("pedidos", por_producto), ("pedidos", totales), ("pagos", pagos)]
+
+
+def reconstruir(desde=None):
+    """
+    Rearma los rollups desde pedidos y pagos con agregaciones en el servidor.
+    Sin `desde` se construyen en una colección temporal que reemplaza a la
+    actual con un rename; con `desde` se borran y rehacen los buckets desde
+    ese día. Las ventas registradas mientras corre pueden perderse.
+    Devuelve la cantidad de buckets.
+    """
+    db = get_mongo_client()
+    if desde is None:
+        destino = COLECCION + "_tmp"
+        db.drop_collection(destino)
+        db[destino].create_indexes(INDICES[COLECCION])
+    else:
+        desde = inicio_bucket(desde, "d")
+        destino = COLECCION
+        db[destino].delete_many({"t": {"$gte": desde}})
+
+    for g in GRANULARIDADES:
+        for coleccion, pipeline in _pipelines(g, destino, desde):
+            db[coleccion].aggregate(pipeline, allowDiskUse=True)
+
+    if desde is None:
+        db[destino].rename(COLECCION, dropTarget=True)
+    return db[COLECCION].estimated_document_count()
+
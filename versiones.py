@@ -0,0 +1,156 @@
+# versiones.py
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+
+import redis
+from flask import request, make_response, Response
+
+import serializacion
+from redis_config import get_redis_client, get_async_redis_client
+
+# Contadores de versión en Redis para GET condicionales (ETag / Last-Modified):
+#   version:{coleccion}       cambia con cualquier alta, cambio o baja de la colección
+#   version:{coleccion}:{id}  cambia con cada escritura de ese documento
+# Cada uno es un hash {v: versión, ts: epoch de la última escritura}. La
+# versión inicial es el epoch en milisegundos, así que si Redis pierde los
+# contadores no se repiten ETags ya entregados. Si el cliente envía el ETag
+# vigente se responde 304 sin consultar MongoDB.
+#
+# Los contadores de productos se incrementan en cache_productos.invalidar(),
+# que ya llaman todas las escrituras de productos (CRUD, lotes y checkout).
+
+# Cache-Control de las respuestas versionadas: el navegador revalida
+# (max-age) y un CDN o proxy puede servirlas durante s-maxage segundos.
+MAX_AGE = int(os.environ.get("CATALOGO_MAX_AGE", 0))
+S_MAXAGE = int(os.environ.get("CATALOGO_S_MAXAGE", 30))
+# Los contadores por documento expiran si nadie los usa (se recrean con una versión nueva)
+TTL_DOCUMENTO = 7 * 24 * 3600
+
+# KEYS = hashes de versión; ARGV = versión inicial, timestamp
+# Devuelve [v1, ts1, v2, ts2, ...] creando los que no existen
+_LUA_LEER = """
+local r = {}
+for i, k in ipairs(KEYS) do
+  if redis.call('HSETNX', k, 'v', ARGV[1]) == 1 then
+    redis.call('HSET', k, 'ts', ARGV[2])
+  end
+  local vals = redis.call('HMGET', k, 'v', 'ts')
+  r[#r + 1] = vals[1]
+  r[#r + 1] = vals[2]
+end
+return r
+"""
+
+# KEYS[1] = versión de la colección, KEYS[2..] = versiones de documentos
+# ARGV = versión inicial, timestamp, ttl de los documentos
+_LUA_INCREMENTAR = """
+for i, k in ipairs(KEYS) do
+  if redis.call('EXISTS', k) == 1 then
+    redis.call('HINCRBY', k, 'v', 1)
+  else
+    redis.call('HSET', k, 'v', ARGV[1])
+  end
+  redis.call('HSET', k, 'ts', ARGV[2])
+  if i > 1 then
+    redis.call('EXPIRE', k, ARGV[3])
+  end
+end
+return #KEYS
+"""
+
+_scripts = {}
+
+
+def _script(nombre, fuente, asincrono=False):
+    clave = (nombre, asincrono)
+    if clave not in _scripts:
+        cliente = get_async_redis_client() if asincrono else get_redis_client()
+        _scripts[clave] = cliente.register_script(fuente)
+    return _scripts[clave]
+
+
+def clave_coleccion(coleccion):
+    return f"version:{coleccion}"
+
+
+def clave_documento(coleccion, doc_id):
+    return f"version:{coleccion}:{doc_id}"
+
+
+def _argumentos():
+    ahora = time.time()
+    return [int(ahora * 1000), int(ahora), TTL_DOCUMENTO]
+
+
+def incrementar(pipe, coleccion, ids=()):
+    """Encola en `pipe` el incremento de la colección y de los documentos `ids`."""
+    claves = [clave_coleccion(coleccion)] + [clave_documento(coleccion, i) for i in ids]
+    _script("incrementar", _LUA_INCREMENTAR)(keys=claves, args=_argumentos(), client=pipe)
+
+
+def incrementar_async(pipe, coleccion, ids=()):
+    """Igual que incrementar, sobre un pipeline de redis.asyncio."""
+    claves = [clave_coleccion(coleccion)] + [clave_documento(coleccion, i) for i in ids]
+    return _script("incrementar", _LUA_INCREMENTAR, asincrono=True)(
+        keys=claves, args=_argumentos(), client=pipe)
+
+
+def _leer(claves):
+    valores = _script("leer", _LUA_LEER)(keys=claves, args=_argumentos()[:2], client=get_redis_client())
+    versiones = [int(v) for v in valores[0::2]]
+    ts = max(int(t) for t in valores[1::2])
+    return versiones, datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+def _cache_control(respuesta):
+    respuesta.headers["Cache-Control"] = f"public, max-age={MAX_AGE}, s-maxage={S_MAXAGE}"
+
+
+def comprobar(claves, variante=""):
+    """
+    Lee las versiones de `claves` y compara con If-None-Match / If-Modified-Since.
+    Devuelve (etag, ultima_modificacion, respuesta_304 o None). `variante`
+    distingue respuestas del mismo recurso (por ejemplo, el query string).
+    Si Redis no responde devuelve (None, None, None) y la ruta responde normal.
+    """
+    try:
+        versiones, modificado = _leer(claves)
+    except redis.RedisError:
+        return None, None, None
+
+    etag = "-".join(str(v) for v in versiones)
+    if variante:
+        etag += "-" + hashlib.sha1(variante.encode("utf-8")).hexdigest()[:12]
+    if serializacion.responde_msgpack():
+        etag += "-mp"  # JSON y MessagePack son representaciones distintas
+
+    if request.if_none_match:
+        vigente = request.if_none_match.contains_weak(etag)
+    else:
+        vigente = bool(request.if_modified_since and request.if_modified_since >= modificado)
+    if not vigente:
+        return etag, modificado, None
+
+    respuesta = Response(status=304)
+    respuesta.vary.add("Accept")
+    agregar_cabeceras(respuesta, etag, modificado)
+    return etag, modificado, respuesta
+
+
+def agregar_cabeceras(respuesta, etag, modificado):
+    """Agrega ETag, Last-Modified y Cache-Control. `respuesta` puede ser una tupla de Flask."""
+    respuesta = make_response(respuesta)
+    if etag is None or respuesta.status_code != 200:
+        return respuesta
+    # ETag débil: el cuerpo puede viajar comprimido
+    respuesta.set_etag(etag, weak=True)
+    respuesta.last_modified = modificado
+    _cache_control(respuesta)
+    return respuesta
+
+
+def variante_consulta():
+    """Query string normalizado, para que ?a=1&b=2 y ?b=2&a=1 compartan ETag."""
+    return "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))